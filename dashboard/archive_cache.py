@@ -0,0 +1,106 @@
+"""Keeps archive files on local disk, keyed by their ETag, so past days are only downloaded once"""
+import os
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+ARCHIVE_CACHE_DIR = os.getenv('ARCHIVE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'vodnik-archive-cache'))
+ARCHIVE_CACHE_MAX_BYTES = int(os.getenv('ARCHIVE_CACHE_MAX_BYTES', str(1024 ** 3)))
+HITS = "hits"
+MISSES = "misses"
+BYTES_SAVED = "bytes_saved"
+EVICTIONS = "evictions"
+
+
+class ArchiveCache:
+    """A size capped directory of archive files named after their key and ETag, evicting the least recently used"""
+
+    def __init__(self, directory: str = ARCHIVE_CACHE_DIR, max_bytes: int = ARCHIVE_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = None
+        self._size = 0
+        self.stats = {HITS: 0, MISSES: 0, BYTES_SAVED: 0, EVICTIONS: 0}
+
+    @staticmethod
+    def file_name(key: str, etag: str) -> str:
+        """Returns the cache file name of one version of an object"""
+        return hashlib.sha256("\n".join((key, etag.strip('"'))).encode()).hexdigest()
+
+    def _index(self) -> OrderedDict:
+        """Returns the cached files and their sizes, least recently used first, scanning the directory once"""
+        if self._entries is None:
+            os.makedirs(self.directory, exist_ok=True)
+            files = [entry for entry in os.scandir(self.directory)
+                     if entry.is_file() and not entry.name.endswith(".tmp")]
+            files.sort(key=lambda entry: entry.stat().st_mtime)
+            self._entries = OrderedDict((entry.name, entry.stat().st_size) for entry in files)
+            self._size = sum(self._entries.values())
+        return self._entries
+
+    def _read(self, name: str) -> bytes:
+        """Reads a cached file and marks it as recently used, or returns None if it has gone"""
+        path = os.path.join(self.directory, name)
+        try:
+            with open(path, "rb") as cached_file:
+                body = cached_file.read()
+            os.utime(path)
+        except FileNotFoundError:
+            self._size -= self._entries.pop(name, 0)
+            return None
+        self._entries.move_to_end(name)
+        return body
+
+    def _write(self, name: str, body: bytes) -> None:
+        """Stores a file, then evicts the least recently used until the cache fits its cap"""
+        if len(body) > self.max_bytes:
+            return
+        path = os.path.join(self.directory, name)
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as temp_file:
+            temp_file.write(body)
+        os.replace(temp_path, path)
+
+        self._size += len(body) - self._entries.pop(name, 0)
+        self._entries[name] = len(body)
+        while self._size > self.max_bytes:
+            evicted, size = self._entries.popitem(last=False)
+            try:
+                os.remove(os.path.join(self.directory, evicted))
+            except FileNotFoundError:
+                pass
+            self._size -= size
+            self.stats[EVICTIONS] += 1
+
+    def get_object(self, s3, bucket_name: str, key: str, etag: str = None) -> bytes:
+        """Returns an object's bytes from disk if this version is cached, otherwise downloads and caches it"""
+        if etag is None:
+            return s3.get_object(Bucket=bucket_name, Key=key)['Body'].read()
+
+        name = self.file_name(key, etag)
+        with self._lock:
+            if name in self._index():
+                body = self._read(name)
+                if body is not None:
+                    self.stats[HITS] += 1
+                    self.stats[BYTES_SAVED] += len(body)
+                    return body
+
+        response = s3.get_object(Bucket=bucket_name, Key=key)
+        body = response['Body'].read()
+        with self._lock:
+            self.stats[MISSES] += 1
+            self._index()
+            self._write(self.file_name(key, response.get('ETag', etag)), body)
+        return body
+
+    def size(self) -> int:
+        """Returns the bytes currently cached"""
+        with self._lock:
+            self._index()
+            return self._size
+
+
+ARCHIVE_CACHE = ArchiveCache()
@@ -0,0 +1,111 @@
+"""Caches dashboard queries so reruns and concurrent users share results"""
+import os
+import functools
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+import pymssql
+import pandas as pd
+import streamlit as st
+from connections import ConnectionPool
+from archive_cache import ARCHIVE_CACHE
+
+LOCATIONS_TTL = int(os.getenv('LOCATIONS_CACHE_TTL', '86400'))
+LATEST_READINGS_TTL = int(os.getenv('LATEST_READINGS_CACHE_TTL', '60'))
+PLANT_READINGS_TTL = int(os.getenv('PLANT_READINGS_CACHE_TTL', '60'))
+ARCHIVE_LISTING_TTL = int(os.getenv('ARCHIVE_LISTING_CACHE_TTL', '3600'))
+ARCHIVE_OBJECT_MAX_ENTRIES = int(os.getenv('ARCHIVE_OBJECT_CACHE_ENTRIES', '256'))
+CALLS = "calls"
+MISSES = "misses"
+
+CACHE_STATS = defaultdict(Counter)
+CACHE_TTLS = {}
+CACHED_LOADERS = {}
+STATS_LOCK = threading.Lock()
+
+
+class SharedConnection:
+    """One pymssql connection shared by every session, used by one query at a time and reopened if it drops"""
+
+    def __init__(self, host: str, username: str, password: str, database_name: str):
+        self._settings = {"server": host, "user": username,
+                          "password": password, "database": database_name}
+        self._conn = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def borrow(self):
+        """Lends the connection for the duration of a with block"""
+        with self._lock:
+            if self._conn is None or not ConnectionPool.is_healthy(self._conn):
+                self._conn = pymssql.connect(**self._settings)
+            yield self._conn
+
+
+@st.cache_resource
+def get_shared_connection() -> SharedConnection:
+    """Returns the connection shared by every session of this server"""
+    return SharedConnection(os.getenv('DB_HOST'), os.getenv('DB_USER'),
+                            os.getenv('DB_PASSWORD'), os.getenv('DB_NAME'))
+
+
+def record(name: str, stat: str) -> None:
+    """Increments a cache counter"""
+    with STATS_LOCK:
+        CACHE_STATS[name][stat] += 1
+
+
+def cached_loader(name: str, ttl: int = None, max_entries: int = None):
+    """Caches a loader's results for every session, counting calls and misses so hit rates can be shown"""
+    def decorator(loader):
+        def cached(dataset: str, *args):
+            record(dataset, MISSES)
+            return loader(*args)
+
+        # st.cache_data keys a cache by the function's module, qualname and source, so without a qualname of its
+        # own every loader would share one cache and one clear()
+        cached.__module__ = loader.__module__
+        cached.__qualname__ = f"{loader.__qualname__}.cached"
+        cached = st.cache_data(ttl=ttl, max_entries=max_entries, show_spinner=False)(cached)
+
+        @functools.wraps(loader)
+        def wrapper(*args):
+            record(name, CALLS)
+            return cached(name, *args)
+
+        wrapper.clear = cached.clear
+        CACHE_TTLS[name] = ttl
+        CACHED_LOADERS[name] = wrapper
+        return wrapper
+    return decorator
+
+
+def invalidate(name: str = None) -> None:
+    """Clears one dataset's cache, or every dataset's if no name is given"""
+    for loader_name, loader in CACHED_LOADERS.items():
+        if name is None or loader_name == name:
+            loader.clear()
+
+
+def get_cache_stats() -> pd.DataFrame:
+    """Returns the calls, hits, misses and hit rate of every cached dataset"""
+    with STATS_LOCK:
+        rows = [{"dataset": name, "ttl_seconds": CACHE_TTLS[name], "calls": CACHE_STATS[name][CALLS],
+                 "hits": CACHE_STATS[name][CALLS] - CACHE_STATS[name][MISSES],
+                 "misses": CACHE_STATS[name][MISSES]} for name in CACHED_LOADERS]
+    stats = pd.DataFrame(rows, columns=["dataset", "ttl_seconds", "calls", "hits", "misses"])
+    stats["hit_rate"] = (stats["hits"] / stats["calls"].where(stats["calls"] > 0)).fillna(0).round(3)
+    return stats
+
+
+def show_debug_panel() -> None:
+    """Shows cache hit rates and invalidation buttons in the sidebar"""
+    with st.sidebar.expander("Cache debug"):
+        st.dataframe(get_cache_stats(), hide_index=True)
+        st.caption(f"Archive files on disk: {ARCHIVE_CACHE.size()} bytes")
+        st.json(ARCHIVE_CACHE.stats)
+        for name in CACHED_LOADERS:
+            if st.button(f"Clear {name}", key=f"clear_{name}"):
+                invalidate(name)
+        if st.button("Clear all caches"):
+            invalidate()
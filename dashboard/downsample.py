@@ -0,0 +1,50 @@
+"""Shrinks time series to a fixed point budget before they are charted"""
+import os
+import numpy as np
+import pandas as pd
+
+CHART_POINT_BUDGET = int(os.getenv('CHART_POINT_BUDGET', '500'))
+BUCKET_RESOLUTIONS = [pd.Timedelta(resolution) for resolution in
+                      ("1min", "5min", "15min", "30min", "1h", "3h", "6h", "12h", "1D", "7D")]
+
+
+def choose_resolution(start: pd.Timestamp, end: pd.Timestamp, point_budget: int = CHART_POINT_BUDGET) -> pd.Timedelta:
+    """Returns the finest bucket size that keeps the range within the point budget"""
+    span = pd.Timestamp(end) - pd.Timestamp(start)
+    for resolution in BUCKET_RESOLUTIONS:
+        if span / resolution <= point_budget:
+            return resolution
+    return pd.Timedelta(seconds=int(np.ceil(span.total_seconds() / point_budget)))
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Returns the indices of the points Largest-Triangle-Three-Buckets keeps"""
+    length = len(x)
+    if threshold >= length or threshold < 3:
+        return np.arange(length)
+
+    bucket_edges = np.linspace(1, length - 1, threshold - 1).astype(int)
+    indices = np.empty(threshold, dtype=int)
+    indices[0], indices[-1] = 0, length - 1
+    selected = 0
+    for bucket in range(threshold - 2):
+        start, end = bucket_edges[bucket], bucket_edges[bucket + 1]
+        next_end = bucket_edges[bucket + 2] if bucket + 2 < len(bucket_edges) else length
+        next_start = end if bucket + 2 < len(bucket_edges) else length - 1
+        average_x = x[next_start:next_end].mean()
+        average_y = y[next_start:next_end].mean()
+
+        areas = np.abs((x[selected] - average_x) * (y[start:end] - y[selected])
+                       - (x[selected] - x[start:end]) * (average_y - y[selected]))
+        selected = start + int(np.argmax(areas))
+        indices[bucket + 1] = selected
+    return indices
+
+
+def downsample_lttb(data: pd.DataFrame, time_column: str, value_column: str,
+                    point_budget: int = CHART_POINT_BUDGET) -> pd.DataFrame:
+    """Returns at most point_budget rows of a series, keeping the shape of its line"""
+    data = data.dropna(subset=[value_column]).sort_values(time_column)
+    x = pd.to_datetime(data[time_column]).to_numpy(dtype="datetime64[ns]").astype(np.int64).astype(float)
+    y = data[value_column].to_numpy(dtype=float)
+    return data.iloc[lttb_indices(x, y, point_budget)]
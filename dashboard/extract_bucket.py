@@ -1,48 +1,115 @@
 """Extracts from s3 bucket"""
+import io
 import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
 from boto3 import client
 import pandas as pd
 from dotenv import load_dotenv
+from connections import CONNECTION_POOL
+from archive_cache import ARCHIVE_CACHE
+
+BUCKET_NAME = "vodnik-historical-plant-readings"
+PARQUET_SUFFIX = ".parquet"
+DATE_COLUMNS = {"reading_at", "watered_at"}
+DOWNLOAD_WORKERS = int(os.getenv("HISTORICAL_DOWNLOAD_WORKERS", "8"))
+ARCHIVE_LAG_DAYS = int(os.getenv("ARCHIVE_LAG_DAYS", "7"))
+CSV_CHUNK_ROWS = int(os.getenv("HISTORICAL_CSV_CHUNK_ROWS", "50000"))
+PARQUET_KEY = re.compile(r"^wc-\d{2}-\d{2}-\d{4}/day=(\d{4}-\d{2}-\d{2})/plant_id=(\d+)/[^/]+\.parquet$")
+CSV_KEY = re.compile(r"^wc-\d{2}-\d{2}-\d{4}/(\d{4}-\d{2}-\d{2})[^/]*\.csv(\.gz)?$")
+GZIP_SUFFIX = ".gz"
 
 
 def get_aws_client() -> client:
-    "Returns an s3 client"
-    return client('s3',
-                  aws_access_key_id=os.getenv("ACCESS_KEY"),
-                  aws_secret_access_key=os.getenv("SECRET_ACCESS_KEY")
-                  )
+    "Returns the shared s3 client"
+    return CONNECTION_POOL.get_client('s3',
+                                      aws_access_key_id=os.getenv(
+                                          "ACCESS_KEY"),
+                                      aws_secret_access_key=os.getenv(
+                                          "SECRET_ACCESS_KEY")
+                                      )
+
+
+def get_bucket(s3: client, bucket_name: str, prefix: str = "") -> list:
+    """ Returns every object in the bucket under a prefix, following the listing pages """
+    paginator = s3.get_paginator('list_objects_v2')
+    return [file for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix)
+            for file in page.get('Contents', [])]
 
 
-def get_bucket(s3: client, bucket_name: str):
-    """ Returns the bucket contents """
-    return s3.list_objects(Bucket=bucket_name)['Contents']
+def get_week_prefixes(start: date, end: date) -> list[str]:
+    """ Returns the wc-DD-MM-YYYY/ prefix of every week from start to end """
+    monday = start - timedelta(days=start.weekday())
+    prefixes = []
+    while monday <= end:
+        prefixes.append(f"wc-{monday.strftime('%d-%m-%Y')}/")
+        monday += timedelta(days=7)
+    return prefixes
 
 
-def get_latest_file(files: list) -> str:
-    """ Filters for last modified sjogren files """
-    max_modified = max([file['LastModified'] for file in files])
-    latest = [file for file in files if file['LastModified'] == max_modified]
-    return latest[0]
+def may_contain(key: str, start: date, end: date, plant_ids: set = None) -> bool:
+    """ Whether an archive key can hold readings from start to end for the plants, judged from its name alone.
+    A csv file is named after the day it was archived, which comes after every reading in it """
+    parquet = PARQUET_KEY.match(key)
+    if parquet:
+        day = date.fromisoformat(parquet.group(1))
+        return start <= day <= end and (plant_ids is None or int(parquet.group(2)) in plant_ids)
 
+    csv = CSV_KEY.match(key)
+    if csv:
+        archived = date.fromisoformat(csv.group(1))
+        return start < archived <= end + timedelta(days=ARCHIVE_LAG_DAYS)
+    return False
 
-def download_files(s3: client, file: str, bucket_name: str) -> None:
-    """ Downloads files from bucket """
-    s3.download_file(
-        bucket_name, file['Key'], "historical_data.csv")
 
+def list_archive_files(s3: client, bucket_name: str, start: date, end: date, plant_ids: set = None) -> list[dict]:
+    """ Returns the listings of the archive files that can hold readings from start to end for the plants """
+    prefixes = get_week_prefixes(start, end + timedelta(days=ARCHIVE_LAG_DAYS))
+    files = [file for prefix in prefixes for file in get_bucket(s3, bucket_name, prefix)
+             if may_contain(file['Key'], start, end, plant_ids)]
+    return sorted(files, key=lambda file: file['Key'])
 
-def download_historical_data() -> pd.DataFrame:
-    """Downloads the latest data from the s3 bucket and converts it into a df"""
-    client = get_aws_client()
-    bucket_name = "vodnik-historical-plant-readings"
-    objects = get_bucket(client, bucket_name)
-    latest_files = get_latest_file(objects)
-    download_files(client, latest_files, bucket_name)
 
-    # Read csv into a dataframe
-    df = pd.read_csv("historical_data.csv")
+def read_filtered_archive_object(s3: client, bucket_name: str, file: dict, start: datetime, end: datetime,
+                                 plant_ids: set = None, columns: list = None, cache=ARCHIVE_CACHE) -> pd.DataFrame:
+    """ Reads the readings of an archive file taken from start up to end for the plants, filtering as it parses.
+    Files already on disk with the listed ETag are read from the local cache instead of s3 """
+    key = file['Key']
+    body = io.BytesIO(cache.get_object(s3, bucket_name, key, file.get('ETag')))
+    if key.endswith(PARQUET_SUFFIX):
+        filters = [("reading_at", ">=", pd.Timestamp(start)), ("reading_at", "<", pd.Timestamp(end))]
+        if plant_ids is not None:
+            filters.append(("plant_id", "in", sorted(plant_ids)))
+        return pd.read_parquet(body, columns=columns, filters=filters)
+
+    chunks = []
+    for chunk in pd.read_csv(body, chunksize=CSV_CHUNK_ROWS, parse_dates=["reading_at"],
+                             compression="gzip" if key.endswith(GZIP_SUFFIX) else None):
+        keep = (chunk["reading_at"] >= start) & (chunk["reading_at"] < end)
+        if plant_ids is not None:
+            keep &= chunk["plant_id"].isin(plant_ids)
+        chunk = chunk[keep]
+        chunks.append(chunk[columns] if columns else chunk)
+    df = pd.concat(chunks, ignore_index=True)
+    for column in DATE_COLUMNS.intersection(df.columns):
+        df[column] = pd.to_datetime(df[column])
     return df
 
 
-if __name__ == '__main__':
-    download_historical_data(client)
+def read_historical_readings(s3: client, bucket_name: str, start: datetime, end: datetime,
+                             plant_ids: list = None, columns: list = None, cache=ARCHIVE_CACHE) -> pd.DataFrame:
+    """ Returns the archived readings taken from start up to end, for only the given plants if any,
+    downloading the matching files that aren't cached concurrently """
+    plant_ids = set(plant_ids) if plant_ids is not None else None
+    files = list_archive_files(s3, bucket_name, start.date(), (end - timedelta(microseconds=1)).date(), plant_ids)
+    if not files:
+        return pd.DataFrame(columns=columns)
+
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as executor:
+        frames = list(executor.map(lambda file: read_filtered_archive_object(
+            s3, bucket_name, file, start, end, plant_ids, columns, cache), files))
+
+    df = pd.concat(frames, ignore_index=True)
+    order = [column for column in ("plant_id", "reading_at") if column in df.columns]
+    return df.sort_values(order, ignore_index=True)
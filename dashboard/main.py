@@ -1,19 +1,20 @@
 """Dashboard Script"""
 import os
+from datetime import date, datetime, timedelta
 import altair as alt
 import pymssql
 from dotenv import load_dotenv
 import pandas as pd
 import streamlit as st
-from extract_bucket import download_historical_data
+from extract_bucket import get_aws_client, read_historical_readings, BUCKET_NAME
+from downsample import choose_resolution, downsample_lttb
+from caching import (cached_loader, get_shared_connection, show_debug_panel, LOCATIONS_TTL, LATEST_READINGS_TTL,
+                     PLANT_READINGS_TTL, ARCHIVE_LISTING_TTL, ARCHIVE_OBJECT_MAX_ENTRIES)
 
-
-def create_connection() -> pymssql.Connection:
-    """Creates a pymssql connection to the appropriate database"""
-    return pymssql.connect(server=os.getenv('DB_HOST'),
-                           user=os.getenv('DB_USER'),
-                           password=os.getenv('DB_PASSWORD'),
-                           database=os.getenv('DB_NAME'))
+DASHBOARD_DEBUG = os.getenv('DASHBOARD_DEBUG', 'false').lower() == 'true'
+PLANT_READINGS_HOURS = [1, 6, 24]
+HISTORICAL_DAYS = int(os.getenv('HISTORICAL_DAYS', '7'))
+HISTORICAL_COLUMNS = ["plant_id", "reading_at", "moisture", "temp"]
 
 
 def get_locations_data(conn: pymssql.Connection) -> pd.DataFrame:
@@ -27,63 +28,94 @@ def get_locations_data(conn: pymssql.Connection) -> pd.DataFrame:
     return df
 
 
-def get_readings_data(conn: pymssql.Connection) -> pd.DataFrame:
-    "Returns locations data from database as a dataframe"
-    query = pd.read_sql("""SELECT r.plant_id, ps.common_name, r.reading_at, r.moisture, r.temp, r.watered_at
-                    FROM gamma.readings AS r
-                    JOIN gamma.plants AS p ON r.plant_id = p.plant_id
+def get_latest_readings_data(conn: pymssql.Connection) -> pd.DataFrame:
+    "Returns each plant's most recent reading, kept up to date by the pipeline, as a dataframe"
+    query = pd.read_sql("""SELECT lr.plant_id, ps.common_name, lr.reading_at, lr.moisture, lr.temp, lr.watered_at,
+                           lr.moisture_avg, lr.temp_avg
+                    FROM gamma.latest_readings AS lr
+                    JOIN gamma.plants AS p ON lr.plant_id = p.plant_id
                     JOIN gamma.plant_species AS ps ON p.species_id = ps.species_id
-                    WHERE reading_at > DATEADD(minute, -30, (SELECT CURRENT_TIMESTAMP)) ;""", conn)
+                    WHERE lr.reading_at > DATEADD(minute, -30, (SELECT CURRENT_TIMESTAMP)) ;""", conn)
     df = pd.DataFrame(query)
     return df
 
 
-def get_readings_data_for_specific_plant(conn: pymssql.Connection, common_name: str) -> pd.DataFrame:
-    "Returns locations data from database as a dataframe"
-    query = pd.read_sql(f"""SELECT r.plant_id, ps.common_name, r.reading_at, r.moisture, r.temp, r.watered_at
-                    FROM gamma.readings AS r
-                    JOIN gamma.plants AS p ON r.plant_id = p.plant_id
-                    JOIN gamma.plant_species AS ps ON p.species_id = ps.species_id
-                    WHERE ps.common_name ='{common_name}';""", conn)
+def get_bucketed_readings_for_plant(conn: pymssql.Connection, common_name: str, start: datetime,
+                                    bucket_seconds: int) -> pd.DataFrame:
+    "Returns the min, mean and max readings per time bucket for a plant since start, aggregated in the database"
+    query = pd.read_sql("""SELECT DATEADD(second, CAST(bucket * %s AS INT), %s) AS reading_at,
+                           MIN(temp) AS temp_min, AVG(temp) AS temp_mean, MAX(temp) AS temp_max,
+                           MIN(moisture) AS moisture_min, AVG(moisture) AS moisture_mean,
+                           MAX(moisture) AS moisture_max, COUNT(*) AS reading_count
+                    FROM (SELECT DATEDIFF_BIG(second, %s, r.reading_at) / %s AS bucket, r.temp, r.moisture
+                          FROM gamma.readings AS r
+                          JOIN gamma.plants AS p ON r.plant_id = p.plant_id
+                          JOIN gamma.plant_species AS ps ON p.species_id = ps.species_id
+                          WHERE ps.common_name = %s AND r.reading_at >= %s) AS bucketed
+                    GROUP BY bucket
+                    ORDER BY bucket;""", conn,
+                        params=(bucket_seconds, start, start, bucket_seconds, common_name, start))
     df = pd.DataFrame(query)
     return df
 
 
-def get_moisture_chart_single_plant(data: pd.DataFrame, plant_choice: str) -> alt.Chart:
-    """Creates a line graph of moisture over time for a given plant id"""
-    y_min = data['moisture'].min()
-    y_max = data['moisture'].max()
-    data['reading_at'] = pd.to_datetime(data['reading_at'])
+@cached_loader("locations", LOCATIONS_TTL)
+def load_locations() -> pd.DataFrame:
+    "Returns the cached locations data"
+    with get_shared_connection().borrow() as conn:
+        return get_locations_data(conn)
 
-    moisture_data = data[data["common_name"] == plant_choice]
-    chart = alt.Chart(moisture_data).mark_line().encode(
-        x=alt.X('reading_at:T', axis=alt.Axis(title='Time')),
-        y=alt.Y('moisture', scale=alt.Scale(
-            domain=[y_min, y_max]), axis=alt.Axis(title='Moisture'))
-    ).properties(
-        width=700,
-        height=600,
-    ).interactive()
 
-    return chart
+@cached_loader("latest_readings", LATEST_READINGS_TTL)
+def load_latest_readings() -> pd.DataFrame:
+    "Returns the cached latest readings"
+    with get_shared_connection().borrow() as conn:
+        return get_latest_readings_data(conn)
 
 
-def get_temperature_chart_single_plant(data: pd.DataFrame, plant_choice) -> alt.Chart:
-    """Creates a line graph of temperature over time for a given plant id"""
-    y_min = data['temp'].min()
-    y_max = data['temp'].max()
+@cached_loader("plant_readings", PLANT_READINGS_TTL)
+def load_plant_readings(common_name: str, hours: int) -> pd.DataFrame:
+    "Returns the cached readings for one plant over the last few hours, bucketed to fit the chart point budget"
+    end = datetime.now().replace(second=0, microsecond=0)
+    start = end - timedelta(hours=hours)
+    resolution = choose_resolution(start, end)
+    with get_shared_connection().borrow() as conn:
+        return get_bucketed_readings_for_plant(conn, common_name, start, int(resolution.total_seconds()))
 
-    temp_data = data[data["common_name"] == plant_choice]
-    chart = alt.Chart(temp_data).mark_line().encode(
-        x=alt.X('reading_at:T', axis=alt.Axis(title='Time')),
-        y=alt.Y('temp:Q', scale=alt.Scale(
-            domain=[y_min, y_max]), axis=alt.Axis(title='Temperature'))
-    ).properties(
+
+@cached_loader("historical_readings", ARCHIVE_LISTING_TTL, ARCHIVE_OBJECT_MAX_ENTRIES)
+def load_historical_readings(plant_id: int, start_day: date, end_day: date) -> pd.DataFrame:
+    "Returns a plant's cached archived readings from the start day through the end day"
+    start = datetime.combine(start_day, datetime.min.time())
+    end = datetime.combine(end_day + timedelta(days=1), datetime.min.time())
+    return read_historical_readings(get_aws_client(), BUCKET_NAME, start, end, [plant_id], HISTORICAL_COLUMNS)
+
+
+def get_band_chart(data: pd.DataFrame, metric: str, title: str) -> alt.Chart:
+    """Creates a line of a metric's mean per bucket over a band from its min to its max"""
+    base = alt.Chart(data).encode(
+        x=alt.X('reading_at:T', axis=alt.Axis(title='Time')))
+    band = base.mark_area(opacity=0.3).encode(
+        y=alt.Y(f'{metric}_min:Q', scale=alt.Scale(zero=False), axis=alt.Axis(title=title)),
+        y2=f'{metric}_max:Q')
+    line = base.mark_line().encode(y=f'{metric}_mean:Q')
+
+    return (band + line).properties(
         width=700,
         height=600,
     ).interactive()
 
-    return chart
+
+def get_moisture_chart_single_plant(data: pd.DataFrame) -> alt.Chart:
+    """Creates a line graph of bucketed moisture over time for a plant"""
+    data['reading_at'] = pd.to_datetime(data['reading_at'])
+    return get_band_chart(data, 'moisture', 'Moisture')
+
+
+def get_temperature_chart_single_plant(data: pd.DataFrame) -> alt.Chart:
+    """Creates a line graph of bucketed temperature over time for a plant"""
+    data['reading_at'] = pd.to_datetime(data['reading_at'])
+    return get_band_chart(data, 'temp', 'Temperature')
 
 
 def get_latest_moisture_chart(latest_data: pd.DataFrame) -> alt.Chart:
@@ -118,7 +150,8 @@ def get_average_moisture_chart(data: pd.DataFrame, plant_id: int) -> alt.Chart:
     y_max = data['moisture'].max()
     data['reading_at'] = pd.to_datetime(data['reading_at'])
 
-    moisture_data = data[data["plant_id"] == plant_id]
+    moisture_data = downsample_lttb(
+        data[data["plant_id"] == plant_id], 'reading_at', 'moisture')
     chart = alt.Chart(moisture_data).mark_line().encode(
         x=alt.X('reading_at:T', axis=alt.Axis(title='Time')),
         y=alt.Y('moisture:Q', scale=alt.Scale(
@@ -136,7 +169,8 @@ def get_average_temperature_chart(data: pd.DataFrame, plant_id: int) -> alt.Char
     y_min = data['temp'].min()
     y_max = data['temp'].max()
 
-    temp_data = data[data["plant_id"] == plant_id]
+    temp_data = downsample_lttb(
+        data[data["plant_id"] == plant_id], 'reading_at', 'temp')
     chart = alt.Chart(temp_data).mark_line().encode(
         x=alt.X('reading_at:T', axis=alt.Axis(title='Time')),
         y=alt.Y('temp:Q', scale=alt.Scale(
@@ -151,12 +185,12 @@ def get_average_temperature_chart(data: pd.DataFrame, plant_id: int) -> alt.Char
 
 def build_dashboard():
     "Builds and structures the dashboard"
-    conn = create_connection()
-    locations_df = get_locations_data(conn)
-    readings_df = get_readings_data(conn)
-    historical_data = download_historical_data()
+    locations_df = load_locations()
+    readings_df = load_latest_readings()
 
     st.title("LNMH Plant Health Dashboard🌳")
+    if DASHBOARD_DEBUG or st.query_params.get("debug") == "1":
+        show_debug_panel()
 
     tab_location, tab_latest, tab_historical = st.tabs(
         ["Location", "Latest Analysis", "Historical Analysis"])
@@ -166,6 +200,12 @@ def build_dashboard():
         st.markdown("## Plant Filter")
         plant_ids = readings_df['plant_id'].unique().tolist()
         plant_option = st.selectbox("Choose a plant", plant_ids)
+        yesterday = date.today() - timedelta(days=1)
+        history_range = st.date_input("Choose a date range",
+                                      (yesterday - timedelta(days=HISTORICAL_DAYS - 1), yesterday),
+                                      max_value=yesterday)
+        start_day, end_day = history_range if len(history_range) == 2 else (history_range[0],) * 2
+        historical_data = load_historical_readings(plant_option, start_day, end_day)
         st.header(f'🌡️ Temperature Readings 🌡️')
         st.write(get_average_temperature_chart(
             historical_data, plant_option))
@@ -194,16 +234,15 @@ def build_dashboard():
         plant_names = readings_df['common_name'].unique().tolist()
         plant_option = st.selectbox("Choose a plant", plant_names)
 
-        plant_readings = get_readings_data_for_specific_plant(
-            conn, plant_option)
+        hours = st.selectbox("Time range (hours)", PLANT_READINGS_HOURS,
+                             index=len(PLANT_READINGS_HOURS) - 1)
+        plant_readings = load_plant_readings(plant_option, hours)
 
         st.subheader(f'Temperature Readings for {plant_option.title()}🌡️')
-        st.write(get_temperature_chart_single_plant(
-            plant_readings, plant_choice=plant_option))
+        st.write(get_temperature_chart_single_plant(plant_readings))
 
         st.subheader(f' Soil Moisture Readings for {plant_option.title()}💧')
-        st.write(get_moisture_chart_single_plant(
-            plant_readings, plant_choice=plant_option))
+        st.write(get_moisture_chart_single_plant(plant_readings))
 
 
 if __name__ == '__main__':
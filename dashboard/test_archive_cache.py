@@ -0,0 +1,84 @@
+# pylint: skip-file
+import io
+import os
+from unittest.mock import MagicMock
+import pytest
+
+from archive_cache import ArchiveCache
+
+
+def fake_s3(objects: dict) -> MagicMock:
+    s3 = MagicMock()
+    s3.get_object.side_effect = lambda Bucket, Key: {"Body": io.BytesIO(objects[Key][1]), "ETag": objects[Key][0]}
+    return s3
+
+
+@pytest.fixture
+def objects():
+    return {"a.parquet": ('"etag-a"', b"a" * 40), "b.parquet": ('"etag-b"', b"b" * 40),
+            "c.parquet": ('"etag-c"', b"c" * 40)}
+
+
+def test_get_object_downloads_once_then_hits(tmp_path, objects):
+    cache = ArchiveCache(str(tmp_path), max_bytes=1000)
+    s3 = fake_s3(objects)
+
+    assert cache.get_object(s3, "bucket", "a.parquet", '"etag-a"') == b"a" * 40
+    assert cache.get_object(s3, "bucket", "a.parquet", '"etag-a"') == b"a" * 40
+
+    assert s3.get_object.call_count == 1
+    assert cache.stats == {"hits": 1, "misses": 1, "bytes_saved": 40, "evictions": 0}
+
+
+def test_get_object_refetches_a_new_etag(tmp_path, objects):
+    cache = ArchiveCache(str(tmp_path), max_bytes=1000)
+    s3 = fake_s3(objects)
+    cache.get_object(s3, "bucket", "a.parquet", '"etag-a"')
+
+    objects["a.parquet"] = ('"etag-a2"', b"A" * 10)
+
+    assert cache.get_object(s3, "bucket", "a.parquet", '"etag-a2"') == b"A" * 10
+    assert s3.get_object.call_count == 2
+
+
+def test_get_object_without_etag_skips_the_cache(tmp_path, objects):
+    cache = ArchiveCache(str(tmp_path), max_bytes=1000)
+
+    cache.get_object(fake_s3(objects), "bucket", "a.parquet")
+
+    assert os.listdir(tmp_path) == []
+    assert cache.stats["misses"] == 0
+
+
+def test_evicts_least_recently_used_over_the_cap(tmp_path, objects):
+    cache = ArchiveCache(str(tmp_path), max_bytes=100)
+    s3 = fake_s3(objects)
+    cache.get_object(s3, "bucket", "a.parquet", '"etag-a"')
+    cache.get_object(s3, "bucket", "b.parquet", '"etag-b"')
+    cache.get_object(s3, "bucket", "a.parquet", '"etag-a"')
+    cache.get_object(s3, "bucket", "c.parquet", '"etag-c"')
+
+    assert cache.size() == 80
+    assert cache.stats["evictions"] == 1
+    assert cache.get_object(s3, "bucket", "a.parquet", '"etag-a"') == b"a" * 40
+    assert cache.stats["hits"] == 2
+    cache.get_object(s3, "bucket", "b.parquet", '"etag-b"')
+    assert s3.get_object.call_count == 4
+
+
+def test_skips_objects_larger_than_the_cap(tmp_path, objects):
+    cache = ArchiveCache(str(tmp_path), max_bytes=10)
+
+    cache.get_object(fake_s3(objects), "bucket", "a.parquet", '"etag-a"')
+
+    assert cache.size() == 0
+
+
+def test_reuses_files_left_by_an_earlier_process(tmp_path, objects):
+    ArchiveCache(str(tmp_path), max_bytes=1000).get_object(fake_s3(objects), "bucket", "a.parquet", '"etag-a"')
+    cache = ArchiveCache(str(tmp_path), max_bytes=1000)
+    s3 = fake_s3(objects)
+
+    assert cache.size() == 40
+    assert cache.get_object(s3, "bucket", "a.parquet", '"etag-a"') == b"a" * 40
+    s3.get_object.assert_not_called()
@@ -0,0 +1,42 @@
+# pylint: skip-file
+import pytest
+
+pytest.importorskip("streamlit")
+
+from caching import cached_loader, invalidate, CACHE_STATS, MISSES
+
+
+def make_loaders():
+    @cached_loader("test_first")
+    def load_first() -> str:
+        return "first"
+
+    @cached_loader("test_second")
+    def load_second() -> str:
+        return "second"
+
+    return load_first, load_second
+
+
+def test_loaders_with_the_same_arguments_return_their_own_data():
+    load_first, load_second = make_loaders()
+    invalidate()
+
+    assert load_first() == "first"
+    assert load_second() == "second"
+    assert load_first() == "first"
+
+
+def test_loaders_clear_independently():
+    load_first, load_second = make_loaders()
+    invalidate()
+    load_first()
+    load_second()
+    first_misses, second_misses = CACHE_STATS["test_first"][MISSES], CACHE_STATS["test_second"][MISSES]
+
+    load_first.clear()
+    load_first()
+    load_second()
+
+    assert CACHE_STATS["test_first"][MISSES] == first_misses + 1
+    assert CACHE_STATS["test_second"][MISSES] == second_misses
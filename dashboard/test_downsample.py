@@ -0,0 +1,52 @@
+# pylint: skip-file
+import numpy as np
+import pandas as pd
+import pytest
+
+from downsample import choose_resolution, lttb_indices, downsample_lttb
+
+
+@pytest.fixture
+def day_of_readings():
+    times = pd.date_range("2024-06-12", periods=24 * 60, freq="1min")
+    return pd.DataFrame({"reading_at": times,
+                         "temp": np.sin(np.linspace(0, 6, len(times))) * 10 + 20,
+                         "moisture": np.linspace(20, 40, len(times))})
+
+
+@pytest.mark.parametrize("hours, expected", [(1, "1min"), (24, "5min"), (24 * 7, "30min"), (24 * 365, "1D")])
+def test_choose_resolution_stays_within_budget(hours, expected):
+    start = pd.Timestamp("2024-06-12")
+
+    assert choose_resolution(start, start + pd.Timedelta(hours=hours), 500) == pd.Timedelta(expected)
+
+
+def test_choose_resolution_beyond_largest_bucket():
+    start = pd.Timestamp("2000-01-01")
+    end = start + pd.Timedelta(days=7 * 1000)
+
+    assert (end - start) / choose_resolution(start, end, 500) <= 500
+
+
+def test_lttb_keeps_first_last_and_peaks():
+    x = np.arange(1000, dtype=float)
+    y = np.zeros(1000)
+    y[500] = 100
+
+    indices = lttb_indices(x, y, 50)
+
+    assert len(indices) == 50
+    assert indices[0] == 0 and indices[-1] == 999
+    assert 500 in indices
+    assert (np.diff(indices) > 0).all()
+
+
+def test_lttb_returns_everything_under_threshold():
+    assert lttb_indices(np.arange(10.0), np.arange(10.0), 50).tolist() == list(range(10))
+
+
+def test_downsample_lttb_respects_point_budget(day_of_readings):
+    downsampled = downsample_lttb(day_of_readings, "reading_at", "temp", 200)
+
+    assert len(downsampled) == 200
+    assert downsampled["reading_at"].is_monotonic_increasing
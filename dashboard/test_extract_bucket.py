@@ -0,0 +1,145 @@
+# pylint: skip-file
+import io
+import gzip
+import datetime
+from unittest.mock import MagicMock
+import pandas as pd
+import pytest
+
+from archive_cache import ArchiveCache
+from extract_bucket import get_bucket, get_week_prefixes, list_archive_files, may_contain, read_historical_readings
+
+
+@pytest.fixture
+def fake_readings():
+    return pd.DataFrame({"reading_id": [1, 2], "plant_id": [5, 5],
+                         "reading_at": pd.to_datetime(["2024-06-12 18:38:08", "2024-06-12 18:39:08"]),
+                         "moisture": [81.2, 80.9], "temp": [11.5, 11.6], "botanist_id": [2, 2],
+                         "watered_at": pd.to_datetime(["2024-06-12 15:38:08", "2024-06-12 15:38:08"])})
+
+
+class FakeS3:
+    """A bucket held in memory that pages its listings two keys at a time, like a small list_objects_v2"""
+
+    def __init__(self, objects: dict):
+        self.objects = objects
+        self.gets = []
+
+    def get_paginator(self, operation):
+        assert operation == "list_objects_v2"
+        paginator = MagicMock()
+        paginator.paginate.side_effect = self.paginate
+        return paginator
+
+    def paginate(self, Bucket, Prefix=""):
+        keys = sorted(key for key in self.objects if key.startswith(Prefix))
+        for start in range(0, len(keys), 2):
+            yield {"Contents": [{"Key": key, "ETag": self.etag(key)} for key in keys[start:start + 2]]}
+
+    def etag(self, key):
+        return f'"{hash(self.objects[key])}"'
+
+    def get_object(self, Bucket, Key):
+        self.gets.append(Key)
+        return {"Body": io.BytesIO(self.objects[Key]), "ETag": self.etag(Key)}
+
+
+def to_parquet_bytes(df: pd.DataFrame) -> bytes:
+    buffer = io.BytesIO()
+    df.to_parquet(buffer, index=False)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def archive(fake_readings):
+    plant_9 = fake_readings.assign(plant_id=9, reading_id=[3, 4])
+    legacy = fake_readings.assign(reading_at=pd.to_datetime(["2024-06-09 10:00:00", "2024-06-10 09:00:00"]))
+    return FakeS3({
+        "wc-10-06-2024/day=2024-06-12/plant_id=5/1-2.parquet": to_parquet_bytes(fake_readings),
+        "wc-10-06-2024/day=2024-06-12/plant_id=9/3-4.parquet": to_parquet_bytes(plant_9),
+        "wc-10-06-2024/day=2024-06-13/plant_id=5/5-6.parquet": b"not read",
+        "wc-10-06-2024/2024-06-11-1.csv": legacy.to_csv(index=False).encode(),
+        "wc-03-06-2024/2024-06-04.csv": b"not read",
+        "checkpoints/migration.json": b"{}"})
+
+
+def test_get_bucket_follows_every_page(archive):
+    assert len(get_bucket(archive, "bucket")) == 6
+    assert [file["Key"] for file in get_bucket(archive, "bucket", "wc-03")] == ["wc-03-06-2024/2024-06-04.csv"]
+
+
+def test_get_week_prefixes_covers_each_monday():
+    assert get_week_prefixes(datetime.date(2024, 6, 9), datetime.date(2024, 6, 17)) == [
+        "wc-03-06-2024/", "wc-10-06-2024/", "wc-17-06-2024/"]
+
+
+def test_may_contain_prunes_on_day_and_plant():
+    key = "wc-10-06-2024/day=2024-06-12/plant_id=5/1-2.parquet"
+
+    assert may_contain(key, datetime.date(2024, 6, 12), datetime.date(2024, 6, 12), {5})
+    assert not may_contain(key, datetime.date(2024, 6, 12), datetime.date(2024, 6, 12), {9})
+    assert not may_contain(key, datetime.date(2024, 6, 13), datetime.date(2024, 6, 14))
+    assert not may_contain("checkpoints/migration.json", datetime.date(2024, 6, 1), datetime.date(2024, 6, 30))
+
+
+def test_may_contain_keeps_csv_archived_after_the_start():
+    assert may_contain("wc-10-06-2024/2024-06-11-1.csv", datetime.date(2024, 6, 10), datetime.date(2024, 6, 10))
+    assert not may_contain("wc-10-06-2024/2024-06-11-1.csv", datetime.date(2024, 6, 11), datetime.date(2024, 6, 12))
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ArchiveCache(str(tmp_path))
+
+
+def test_list_archive_files_lists_only_matching_files(archive):
+    files = list_archive_files(archive, "bucket", datetime.date(2024, 6, 12), datetime.date(2024, 6, 12), {9})
+
+    assert [file["Key"] for file in files] == ["wc-10-06-2024/day=2024-06-12/plant_id=9/3-4.parquet"]
+
+
+def test_read_historical_readings_filters_range_and_plants(archive, cache):
+    df = read_historical_readings(archive, "bucket", datetime.datetime(2024, 6, 12, 18, 39),
+                                  datetime.datetime(2024, 6, 13), [5], ["plant_id", "reading_at", "temp"], cache)
+
+    assert list(df.columns) == ["plant_id", "reading_at", "temp"]
+    assert df["temp"].tolist() == [11.6]
+    assert archive.gets == ["wc-10-06-2024/day=2024-06-12/plant_id=5/1-2.parquet"]
+
+
+def test_read_historical_readings_merges_parquet_and_csv(archive, cache):
+    df = read_historical_readings(archive, "bucket", datetime.datetime(2024, 6, 10),
+                                  datetime.datetime(2024, 6, 13), cache=cache)
+
+    assert df["reading_id"].tolist() == [2, 1, 2, 3, 4]
+    assert df["reading_at"].iloc[0] == datetime.datetime(2024, 6, 10, 9, 0)
+    assert "wc-10-06-2024/day=2024-06-13/plant_id=5/5-6.parquet" not in archive.gets
+
+
+def test_read_historical_readings_returns_empty_without_files(archive, cache):
+    df = read_historical_readings(archive, "bucket", datetime.datetime(2023, 1, 1),
+                                  datetime.datetime(2023, 1, 2), columns=["plant_id", "temp"], cache=cache)
+
+    assert df.empty
+    assert list(df.columns) == ["plant_id", "temp"]
+
+
+def test_read_historical_readings_repeats_from_the_cache(archive, cache):
+    first = read_historical_readings(archive, "bucket", datetime.datetime(2024, 6, 12),
+                                     datetime.datetime(2024, 6, 13), cache=cache)
+    archive.gets.clear()
+    second = read_historical_readings(archive, "bucket", datetime.datetime(2024, 6, 12),
+                                      datetime.datetime(2024, 6, 13), cache=cache)
+
+    pd.testing.assert_frame_equal(first, second)
+    assert archive.gets == []
+    assert cache.stats["hits"] == 2
+
+
+def test_read_historical_readings_reads_gzip_csv(fake_readings, cache):
+    archive = FakeS3({"wc-10-06-2024/2024-06-13-1.csv.gz": gzip.compress(fake_readings.to_csv(index=False).encode())})
+
+    df = read_historical_readings(archive, "bucket", datetime.datetime(2024, 6, 12),
+                                  datetime.datetime(2024, 6, 13), columns=["plant_id", "temp"], cache=cache)
+
+    assert df["temp"].tolist() == [11.5, 11.6]
@@ -0,0 +1,11 @@
+-- Covers the per-plant "latest reading" lookups (load.py) and per-plant history (dashboard)
+CREATE NONCLUSTERED INDEX IX_readings_plant_id_reading_at
+ON gamma.readings(plant_id, reading_at DESC)
+INCLUDE (moisture, temp, botanist_id, watered_at);
+GO
+
+-- Covers the dashboard's 30 minute window and the migration's reading_at <= scan
+CREATE NONCLUSTERED INDEX IX_readings_reading_at
+ON gamma.readings(reading_at)
+INCLUDE (plant_id, moisture, temp, watered_at);
+GO
@@ -0,0 +1,20 @@
+-- The natural keys load.py merges dimensions on, so lookups seek and duplicates are rejected
+ALTER TABLE gamma.timezones
+ADD CONSTRAINT UQ_timezones_timezone UNIQUE (timezone);
+GO
+
+ALTER TABLE gamma.country_codes
+ADD CONSTRAINT UQ_country_codes_country_code UNIQUE (country_code);
+GO
+
+ALTER TABLE gamma.locations
+ADD CONSTRAINT UQ_locations_name_lat_lon UNIQUE (location_name, location_lat, location_lon);
+GO
+
+ALTER TABLE gamma.botanists
+ADD CONSTRAINT UQ_botanists_email UNIQUE (email);
+GO
+
+CREATE UNIQUE NONCLUSTERED INDEX UQ_plant_species_names
+ON gamma.plant_species(common_name, scientific_name);
+GO
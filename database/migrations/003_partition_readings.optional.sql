@@ -0,0 +1,55 @@
+-- Optional: partitions gamma.readings by day so retention can switch out whole days.
+-- The clustered key becomes (reading_id, reading_at) so it is aligned with the partition scheme.
+-- It may run before or after 007: the unique (plant_id, reading_at) constraint 007 adds is moved onto the
+-- partition scheme here if it already exists, and is partitioned like the table if 007 comes later.
+-- Boundaries cover the previous 7 and next 60 days. The migration lambda splits new days on each run
+-- (PARTITION_DAYS_AHEAD), so it must stay scheduled; otherwise run
+-- ALTER PARTITION FUNCTION pf_readings_daily() SPLIT RANGE ('YYYY-MM-DD') before they run out.
+DECLARE @boundaries NVARCHAR(MAX) = N'';
+DECLARE @day DATE = DATEADD(day, -7, CAST(SYSDATETIME() AS DATE));
+WHILE @day <= DATEADD(day, 60, CAST(SYSDATETIME() AS DATE))
+BEGIN
+    SET @boundaries += CASE WHEN @boundaries = N'' THEN N'' ELSE N', ' END
+                       + QUOTENAME(CONVERT(CHAR(10), @day, 23), '''');
+    SET @day = DATEADD(day, 1, @day);
+END;
+EXEC(N'CREATE PARTITION FUNCTION pf_readings_daily (DATETIME2) AS RANGE RIGHT FOR VALUES (' + @boundaries + N')');
+GO
+
+CREATE PARTITION SCHEME ps_readings_daily
+AS PARTITION pf_readings_daily ALL TO ([PRIMARY]);
+GO
+
+DROP INDEX IX_readings_plant_id_reading_at ON gamma.readings;
+DROP INDEX IX_readings_reading_at ON gamma.readings;
+GO
+
+DECLARE @primary_key SYSNAME = (SELECT name FROM sys.key_constraints
+                                WHERE parent_object_id = OBJECT_ID('gamma.readings') AND type = 'PK');
+EXEC(N'ALTER TABLE gamma.readings DROP CONSTRAINT ' + QUOTENAME(@primary_key));
+GO
+
+ALTER TABLE gamma.readings
+ADD CONSTRAINT PK_readings PRIMARY KEY CLUSTERED (reading_id, reading_at)
+ON ps_readings_daily(reading_at);
+GO
+
+CREATE NONCLUSTERED INDEX IX_readings_plant_id_reading_at
+ON gamma.readings(plant_id, reading_at DESC)
+INCLUDE (moisture, temp, botanist_id, watered_at)
+ON ps_readings_daily(reading_at);
+GO
+
+CREATE NONCLUSTERED INDEX IX_readings_reading_at
+ON gamma.readings(reading_at)
+INCLUDE (plant_id, moisture, temp, watered_at)
+ON ps_readings_daily(reading_at);
+GO
+
+IF EXISTS (SELECT 1 FROM sys.key_constraints
+           WHERE name = 'UQ_readings_plant_id_reading_at' AND parent_object_id = OBJECT_ID('gamma.readings'))
+    CREATE UNIQUE NONCLUSTERED INDEX UQ_readings_plant_id_reading_at
+    ON gamma.readings(plant_id, reading_at)
+    WITH (DROP_EXISTING = ON)
+    ON ps_readings_daily(reading_at);
+GO
@@ -0,0 +1,14 @@
+-- Per-species and per-plant alert thresholds, read by the pipeline and the rollups when ALERT_RULES_SOURCE=database.
+-- Rows with neither species_id nor plant_id override the defaults; NULL bounds fall through to the next level.
+CREATE TABLE gamma.alert_thresholds(
+    threshold_id SMALLINT IDENTITY(1,1) PRIMARY KEY,
+    species_id SMALLINT NULL,
+    plant_id SMALLINT NULL,
+    metric VARCHAR(20) NOT NULL CHECK (metric IN ('moisture', 'temperature')),
+    min_value DECIMAL(5, 2) NULL,
+    max_value DECIMAL(5, 2) NULL,
+    max_change DECIMAL(5, 2) NULL,
+    FOREIGN KEY (species_id) REFERENCES gamma.plant_species(species_id),
+    FOREIGN KEY (plant_id) REFERENCES gamma.plants(plant_id)
+);
+GO
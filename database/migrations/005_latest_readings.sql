@@ -0,0 +1,29 @@
+-- One row per plant holding its most recent reading and smoothed averages, upserted by the pipeline's load transaction
+CREATE TABLE gamma.latest_readings(
+    plant_id SMALLINT PRIMARY KEY,
+    reading_at DATETIME2 NOT NULL,
+    moisture DECIMAL(5, 2) NOT NULL,
+    temp DECIMAL(5, 2) NOT NULL,
+    botanist_id SMALLINT NOT NULL,
+    watered_at DATETIME2 NOT NULL,
+    moisture_avg DECIMAL(7, 3) NOT NULL,
+    temp_avg DECIMAL(7, 3) NOT NULL,
+    reading_count BIGINT NOT NULL,
+    FOREIGN KEY (plant_id) REFERENCES gamma.plants(plant_id),
+    FOREIGN KEY (botanist_id) REFERENCES gamma.botanists(botanists_id)
+);
+GO
+
+-- Backfills each plant's most recent reading, averaging over whatever is still in gamma.readings
+INSERT INTO gamma.latest_readings (plant_id, reading_at, moisture, temp, botanist_id, watered_at,
+                                   moisture_avg, temp_avg, reading_count)
+SELECT plant_id, reading_at, moisture, temp, botanist_id, watered_at, moisture_avg, temp_avg, reading_count
+FROM (
+    SELECT plant_id, reading_at, moisture, temp, botanist_id, watered_at,
+           AVG(moisture) OVER (PARTITION BY plant_id) AS moisture_avg,
+           AVG(temp) OVER (PARTITION BY plant_id) AS temp_avg,
+           COUNT(*) OVER (PARTITION BY plant_id) AS reading_count,
+           ROW_NUMBER() OVER (PARTITION BY plant_id ORDER BY reading_at DESC) AS row_num
+    FROM gamma.readings) AS ranked
+WHERE row_num = 1;
+GO
@@ -0,0 +1,35 @@
+-- Hourly ('hourly') and daily ('daily') per-plant rollups, added to by the migration job as it archives readings
+CREATE TABLE gamma.reading_rollups(
+    plant_id SMALLINT NOT NULL,
+    granularity VARCHAR(6) NOT NULL CHECK (granularity IN ('hourly', 'daily')),
+    period_start DATETIME2 NOT NULL,
+    reading_count INT NOT NULL,
+    moisture_sum DECIMAL(12, 2) NOT NULL,
+    moisture_min DECIMAL(5, 2) NULL,
+    moisture_max DECIMAL(5, 2) NULL,
+    temp_sum DECIMAL(12, 2) NOT NULL,
+    temp_min DECIMAL(5, 2) NULL,
+    temp_max DECIMAL(5, 2) NULL,
+    moisture_out_of_range_minutes DECIMAL(9, 2) NOT NULL,
+    temp_out_of_range_minutes DECIMAL(9, 2) NOT NULL,
+    watering_events INT NOT NULL,
+    moisture_mean AS CAST(moisture_sum / NULLIF(reading_count, 0) AS DECIMAL(7, 3)),
+    temp_mean AS CAST(temp_sum / NULLIF(reading_count, 0) AS DECIMAL(7, 3)),
+    PRIMARY KEY (plant_id, granularity, period_start),
+    FOREIGN KEY (plant_id) REFERENCES gamma.plants(plant_id)
+);
+GO
+
+CREATE NONCLUSTERED INDEX IX_reading_rollups_period_start
+ON gamma.reading_rollups(granularity, period_start)
+INCLUDE (reading_count, moisture_sum, temp_sum);
+GO
+
+-- The last reading each plant's rollups include, so re-archiving a chunk never counts it twice
+CREATE TABLE gamma.rollup_progress(
+    plant_id SMALLINT PRIMARY KEY,
+    last_reading_id BIGINT NOT NULL,
+    last_watered_at DATETIME2 NULL,
+    FOREIGN KEY (plant_id) REFERENCES gamma.plants(plant_id)
+);
+GO
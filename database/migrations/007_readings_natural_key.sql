@@ -0,0 +1,11 @@
+-- Removes repeated readings, keeping the first stored copy of each (plant_id, reading_at)
+WITH ranked AS (
+    SELECT ROW_NUMBER() OVER (PARTITION BY plant_id, reading_at ORDER BY reading_id) AS row_num
+    FROM gamma.readings)
+DELETE FROM ranked WHERE row_num > 1;
+GO
+
+-- A reading is identified by its plant and the time it was taken, so the API repeating one can't store it twice
+ALTER TABLE gamma.readings
+ADD CONSTRAINT UQ_readings_plant_id_reading_at UNIQUE (plant_id, reading_at);
+GO
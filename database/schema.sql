@@ -1,4 +1,10 @@
-DROP TABLE IF EXISTS gamma.readings, gamma.plants, gamma.locations, gamma.timezones, gamma.botanists, gamma.country_codes, gamma.plant_species;
+DROP TABLE IF EXISTS gamma.schema_migrations, gamma.reading_rollups, gamma.rollup_progress, gamma.alert_thresholds, gamma.latest_readings, gamma.readings, gamma.plants, gamma.locations, gamma.timezones, gamma.botanists, gamma.country_codes, gamma.plant_species;
+GO
+
+IF EXISTS (SELECT 1 FROM sys.partition_schemes WHERE name = 'ps_readings_daily')
+    DROP PARTITION SCHEME ps_readings_daily;
+IF EXISTS (SELECT 1 FROM sys.partition_functions WHERE name = 'pf_readings_daily')
+    DROP PARTITION FUNCTION pf_readings_daily;
 GO
 
 CREATE TABLE gamma.timezones(
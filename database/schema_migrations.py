@@ -0,0 +1,107 @@
+"""This file applies the versioned schema migrations in the migrations folder"""
+# pylint: disable=C0301, E1101
+
+import os
+import re
+import argparse
+import logging
+import pymssql
+from dotenv import load_dotenv
+
+MIGRATIONS_FOLDER = os.path.join(os.path.dirname(__file__), "migrations")
+MIGRATION_FILE = re.compile(r"^(\d+)_(\w+?)(\.optional)?\.sql$")
+BATCH_SEPARATOR = re.compile(r"^\s*GO\s*;?\s*$", re.IGNORECASE | re.MULTILINE)
+
+
+def create_connection(host: str, username: str, password: str, database_name: str) -> pymssql.Connection:
+    """Creates a pymssql connection to the appropriate database"""
+    return pymssql.connect(server=host,
+                           user=username,
+                           password=password,
+                           database=database_name)
+
+
+def list_migrations(folder: str = MIGRATIONS_FOLDER, include_optional: bool = False) -> list[tuple]:
+    """Returns (version, name, path) for every migration file, in version order"""
+    migrations = []
+    for file_name in os.listdir(folder):
+        match = MIGRATION_FILE.match(file_name)
+        if match and (include_optional or not match.group(3)):
+            migrations.append((int(match.group(1)), match.group(2),
+                               os.path.join(folder, file_name)))
+    return sorted(migrations)
+
+
+def split_batches(script: str) -> list[str]:
+    """Splits a script on its GO lines, as sqlcmd does"""
+    return [batch.strip() for batch in BATCH_SEPARATOR.split(script) if batch.strip()]
+
+
+def create_migrations_table(cursor: pymssql.Cursor) -> None:
+    """Creates the table recording which migrations have been applied"""
+    cursor.execute("""IF OBJECT_ID('gamma.schema_migrations') IS NULL
+                      CREATE TABLE gamma.schema_migrations (
+                          version INT PRIMARY KEY,
+                          name VARCHAR(100) NOT NULL,
+                          applied_at DATETIME2 NOT NULL DEFAULT SYSDATETIME()
+                      );""")
+
+
+def get_applied_versions(cursor: pymssql.Cursor) -> set[int]:
+    """Returns the version of every migration already applied"""
+    cursor.execute("SELECT version FROM gamma.schema_migrations;")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def apply_migration(conn: pymssql.Connection, version: int, name: str, path: str) -> None:
+    """Runs every batch of a migration and records it, all in one transaction"""
+    with open(path, encoding="utf-8") as migration_file:
+        batches = split_batches(migration_file.read())
+
+    cursor = conn.cursor()
+    try:
+        for batch in batches:
+            cursor.execute(batch)
+        cursor.execute("INSERT INTO gamma.schema_migrations (version, name) VALUES (%s, %s);",
+                       (version, name))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def run_migrations(conn: pymssql.Connection, folder: str = MIGRATIONS_FOLDER, include_optional: bool = False) -> list[int]:
+    """Applies every pending migration in version order and returns the versions applied"""
+    cursor = conn.cursor()
+    create_migrations_table(cursor)
+    conn.commit()
+    applied = get_applied_versions(cursor)
+    cursor.close()
+
+    newly_applied = []
+    for version, name, path in list_migrations(folder, include_optional):
+        if version in applied:
+            continue
+        logging.info("Applying migration %s_%s", version, name)
+        apply_migration(conn, version, name, path)
+        newly_applied.append(version)
+    return newly_applied
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--include-optional", action="store_true",
+                        help="also apply optional migrations, such as partitioning readings by day")
+    args = parser.parse_args()
+
+    connection = create_connection(os.getenv('DB_HOST'), os.getenv('DB_USER'),
+                                   os.getenv('DB_PASSWORD'), os.getenv('DB_NAME'))
+    try:
+        versions = run_migrations(connection, include_optional=args.include_optional)
+        logging.info("Applied migrations: %s", versions or "none pending")
+    finally:
+        connection.close()
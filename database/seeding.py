@@ -24,6 +24,7 @@ NAME = 'name'
 SCIENTIFIC_NAME = 'scientific_name'
 ERROR = 'error'
 PLANT_ID = 'plant_id'
+PROBE_WINDOW = int(os.getenv('SEED_PROBE_WINDOW', '50'))
 
 
 def create_connection(host: str, username: str, password: str, database_name: str) -> pymssql.Connection:
@@ -52,6 +53,18 @@ async def get_all_responses(plant_ids: list[int]) -> list[dict]:
     return responses
 
 
+async def discover_responses(window: int = PROBE_WINDOW) -> list[dict]:
+    """Fetches plant IDs a window at a time from 0, stopping after the first window with no plants in it"""
+    all_responses = []
+    start = 0
+    while True:
+        responses = await get_all_responses(range(start, start + window))
+        all_responses.extend(responses)
+        if all(ERROR in response for response in responses):
+            return all_responses
+        start += window
+
+
 def get_unique_timezones(responses: list[str]) -> list[tuple]:
     """Finds all unique timezones"""
     unique_timezones = set()
@@ -227,8 +240,7 @@ def get_plant_names_id_map(schema: str, cursor: pymssql.Cursor) -> dict:
 
 
 if __name__ == '__main__':
-    all_plant_ids = range(0, 51)
-    all_responses = asyncio.run(get_all_responses(all_plant_ids))
+    all_responses = asyncio.run(discover_responses())
 
     con = create_connection(DB_HOST, DB_USERNAME, DB_PASSWORD, DB_NAME)
     cur = con.cursor()
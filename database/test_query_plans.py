@@ -0,0 +1,74 @@
+# pylint: skip-file
+"""Asserts the hot queries seek the indexes added by the migrations.
+
+Runs against a disposable SQL Server, for example:
+    docker run -e ACCEPT_EULA=Y -e MSSQL_SA_PASSWORD=<password> -p 1433:1433 mcr.microsoft.com/mssql/server:2022-latest
+with schema.sql applied and TEST_DB_HOST, TEST_DB_USER, TEST_DB_PASSWORD and TEST_DB_NAME set.
+"""
+
+import os
+import xml.etree.ElementTree as ET
+import pytest
+
+from schema_migrations import create_connection, run_migrations
+
+SHOWPLAN_NAMESPACE = {"sp": "http://schemas.microsoft.com/sqlserver/2004/07/showplan"}
+SEEK_OPERATIONS = {"Index Seek", "Clustered Index Seek"}
+
+pytestmark = pytest.mark.skipif(not os.getenv("TEST_DB_HOST"),
+                                reason="TEST_DB_HOST is not set")
+
+
+@pytest.fixture(scope="module")
+def conn():
+    conn = create_connection(os.getenv("TEST_DB_HOST"), os.getenv("TEST_DB_USER"),
+                             os.getenv("TEST_DB_PASSWORD"), os.getenv("TEST_DB_NAME"))
+    run_migrations(conn)
+    yield conn
+    conn.close()
+
+
+def get_seeked_indexes(conn, query: str) -> set[str]:
+    """Returns the name of every index the estimated plan for a query seeks"""
+    cursor = conn.cursor()
+    cursor.execute("SET SHOWPLAN_XML ON;")
+    try:
+        cursor.execute(query)
+        plan = ET.fromstring(cursor.fetchall()[0][0])
+    finally:
+        cursor.execute("SET SHOWPLAN_XML OFF;")
+        cursor.close()
+
+    seeked = set()
+    for operator in plan.iterfind(".//sp:RelOp", SHOWPLAN_NAMESPACE):
+        if operator.get("PhysicalOp") in SEEK_OPERATIONS:
+            for index in operator.iterfind(".//sp:Object", SHOWPLAN_NAMESPACE):
+                seeked.add(index.get("Index", "").strip("[]"))
+    return seeked
+
+
+@pytest.mark.parametrize("query, index", [
+    ("SELECT TOP 1 temp, moisture FROM gamma.readings WHERE plant_id = 1 ORDER BY reading_at DESC;",
+     "IX_readings_plant_id_reading_at"),
+    ("""SELECT plant_id, temp, moisture FROM (
+            SELECT plant_id, temp, moisture,
+                   ROW_NUMBER() OVER (PARTITION BY plant_id ORDER BY reading_at DESC) AS row_number
+            FROM gamma.readings WHERE plant_id IN (1, 2, 3)) AS latest
+        WHERE row_number = 1;""",
+     "IX_readings_plant_id_reading_at"),
+    ("SELECT plant_id, reading_at, moisture, temp FROM gamma.readings WHERE reading_at > DATEADD(minute, -30, CURRENT_TIMESTAMP);",
+     "IX_readings_reading_at"),
+    ("SELECT timezone_id FROM gamma.timezones WHERE timezone = 'Europe/London';",
+     "UQ_timezones_timezone"),
+    ("SELECT country_code_id FROM gamma.country_codes WHERE country_code = 'GB';",
+     "UQ_country_codes_country_code"),
+    ("SELECT botanists_id FROM gamma.botanists WHERE email = 'carl.linnaeus@lnhm.co.uk';",
+     "UQ_botanists_email"),
+    ("""SELECT location_id FROM gamma.locations
+        WHERE location_name = 'Split' AND location_lat = 43.5089100 AND location_lon = 16.4391500;""",
+     "UQ_locations_name_lat_lon"),
+    ("SELECT species_id FROM gamma.plant_species WHERE common_name = 'venus flytrap' AND scientific_name IS NULL;",
+     "UQ_plant_species_names"),
+])
+def test_hot_queries_seek_expected_index(conn, query, index):
+    assert index in get_seeked_indexes(conn, query)
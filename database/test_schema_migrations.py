@@ -0,0 +1,76 @@
+# pylint: skip-file
+
+from unittest.mock import MagicMock
+import pytest
+
+from schema_migrations import list_migrations, split_batches, run_migrations, MIGRATIONS_FOLDER
+
+
+@pytest.fixture
+def migrations_folder(tmp_path):
+    (tmp_path / "001_first.sql").write_text("SELECT 1;\nGO\nSELECT 2;\ngo\n")
+    (tmp_path / "002_second.sql").write_text("SELECT 3;")
+    (tmp_path / "003_partition.optional.sql").write_text("SELECT 4;")
+    (tmp_path / "notes.txt").write_text("not a migration")
+    return tmp_path
+
+
+def test_list_migrations_skips_optional_by_default(migrations_folder):
+    migrations = list_migrations(str(migrations_folder))
+
+    assert [(version, name) for version, name, _ in migrations] == [
+        (1, "first"), (2, "second")]
+
+
+def test_list_migrations_includes_optional(migrations_folder):
+    migrations = list_migrations(str(migrations_folder), include_optional=True)
+
+    assert [version for version, _, _ in migrations] == [1, 2, 3]
+
+
+def test_split_batches():
+    assert split_batches("SELECT 1;\nGO\n\nSELECT 2;\n  go;  \n") == [
+        "SELECT 1;", "SELECT 2;"]
+
+
+def test_run_migrations_applies_only_pending(migrations_folder):
+    mock_conn = MagicMock()
+    mock_cursor = mock_conn.cursor.return_value
+    mock_cursor.fetchall.return_value = [(1,)]
+
+    applied = run_migrations(mock_conn, str(migrations_folder))
+
+    assert applied == [2]
+    executed = [call[0][0] for call in mock_cursor.execute.call_args_list]
+    assert "SELECT 3;" in executed
+    assert "SELECT 1;" not in executed
+    assert mock_cursor.execute.call_args_list[-1][0][1] == (2, "second")
+
+
+def test_run_migrations_rolls_back_failed_migration(migrations_folder):
+    mock_conn = MagicMock()
+    mock_cursor = mock_conn.cursor.return_value
+    mock_cursor.fetchall.return_value = []
+    mock_cursor.execute.side_effect = [None, None, Exception("syntax error")]
+
+    with pytest.raises(Exception):
+        run_migrations(mock_conn, str(migrations_folder))
+
+    mock_conn.rollback.assert_called_once()
+
+
+def test_shipped_migrations_are_numbered_uniquely():
+    versions = [version for version, _, _ in list_migrations(
+        MIGRATIONS_FOLDER, include_optional=True)]
+
+    assert versions == sorted(set(versions))
+
+
+def test_partition_migration_keeps_readings_natural_key():
+    partition = next(path for _, name, path in list_migrations(MIGRATIONS_FOLDER, include_optional=True)
+                     if name == "partition_readings")
+    with open(partition, encoding="utf-8") as migration_file:
+        batches = split_batches(migration_file.read())
+
+    assert any("UQ_readings_plant_id_reading_at" in batch and "ps_readings_daily(reading_at)" in batch
+               for batch in batches)
@@ -0,0 +1,161 @@
+"""Compares the size and load time of the daily csv archive against the partitioned parquet archive,
+and the peak memory of building the csv in one go against streaming it"""
+import io
+import argparse
+import random
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+import pandas as pd
+from migrate import (create_reading_file, split_parquet_partitions, open_parquet_writer, upload_historical_readings,
+                     CsvArchiveWriter, MultipartUploadWriter, CHUNK_SIZE, PARQUET_ROW_GROUP_SIZE)
+
+PLANT_COUNT = 50
+READINGS_PER_DAY = 24 * 60
+
+
+def generate_readings(days: int, seed: int = 0) -> list[tuple]:
+    """Creates one reading a minute for every plant, shaped like gamma.readings rows"""
+    rng = random.Random(seed)
+    start = datetime(2024, 6, 3)
+    readings = []
+    for minute in range(days * READINGS_PER_DAY):
+        reading_at = start + timedelta(minutes=minute)
+        watered_at = reading_at.replace(minute=0, second=0)
+        for plant_id in range(1, PLANT_COUNT + 1):
+            readings.append((len(readings) + 1, plant_id, reading_at, round(rng.uniform(10, 100), 2),
+                             round(rng.uniform(5, 40), 2), plant_id % 3 + 1, watered_at))
+    return readings
+
+
+def timed(function, *args):
+    """Returns the function's result and how long it took in seconds"""
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+class DiscardingS3:
+    """Stands in for s3, counting the bytes uploaded without keeping them"""
+
+    def __init__(self):
+        self.bytes_uploaded = 0
+
+    def upload_fileobj(self, file_data, bucket_name, object_key):
+        self.bytes_uploaded += len(file_data.read())
+
+    def create_multipart_upload(self, **kwargs):
+        return {"UploadId": "benchmark"}
+
+    def upload_part(self, Body, **kwargs):
+        self.bytes_uploaded += len(Body)
+        return {"ETag": "benchmark"}
+
+    def complete_multipart_upload(self, **kwargs):
+        pass
+
+
+def peak_memory(function, *args):
+    """Returns the function's result and the most memory it allocated at once, in bytes"""
+    tracemalloc.start()
+    try:
+        result = function(*args)
+        return result, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def upload_whole_file(readings: list[tuple]) -> int:
+    """Uploads the readings the original way, as one csv built through a df, returning the bytes uploaded"""
+    s3 = DiscardingS3()
+    upload_historical_readings(s3, "bucket", "wc-03-06-2024/", "2024-06-17.csv", create_reading_file(readings))
+    return s3.bytes_uploaded
+
+
+def upload_streamed(readings: list[tuple], compress: bool = True) -> int:
+    """Uploads the readings chunk by chunk through the streaming csv writer, returning the bytes uploaded"""
+    s3 = DiscardingS3()
+    upload = MultipartUploadWriter(s3, "bucket", "wc-03-06-2024/2024-06-17-1.csv.gz")
+    writer = CsvArchiveWriter(upload, compress)
+    for start in range(0, len(readings), CHUNK_SIZE):
+        writer.write_rows(readings[start:start + CHUNK_SIZE])
+    writer.close()
+    upload.close()
+    return s3.bytes_uploaded
+
+
+def compare_memory(readings: list[tuple]) -> None:
+    """Prints the peak memory and upload size of each way of writing the csv archive"""
+    for name, function, args in (("whole file", upload_whole_file, ()),
+                                 ("streamed csv", upload_streamed, (False,)),
+                                 ("streamed gzip", upload_streamed, (True,))):
+        (uploaded, peak), seconds = timed(peak_memory, function, readings, *args)
+        print(f"{name + ':':<22} peak {peak / 1e6:,.1f} MB, "
+              f"uploaded {uploaded / 1e6:,.1f} MB in {seconds:.2f}s")
+
+
+def create_parquet_partitions(readings: list[tuple]) -> dict[str, io.BytesIO]:
+    """Writes the readings to an in-memory parquet file per day and plant, keyed by partition prefix"""
+    partitions = {}
+    for prefix, partition in split_parquet_partitions(readings).items():
+        buffer = io.BytesIO()
+        writer = open_parquet_writer(buffer)
+        writer.write_batch(partition, row_group_size=PARQUET_ROW_GROUP_SIZE)
+        writer.close()
+        partitions[prefix] = buffer
+    return partitions
+
+
+def read_all_partitions(partitions: dict, columns: list = None) -> pd.DataFrame:
+    """Reads every parquet partition back into one df"""
+    frames = []
+    for buffer in partitions.values():
+        buffer.seek(0)
+        frames.append(pd.read_parquet(buffer, columns=columns))
+    return pd.concat(frames, ignore_index=True)
+
+
+def read_csv_archive(buffer) -> pd.DataFrame:
+    """Reads the csv archive back and parses its dates, as the dashboard has to"""
+    buffer.seek(0)
+    df = pd.read_csv(buffer)
+    df['reading_at'] = pd.to_datetime(df['reading_at'])
+    df['watered_at'] = pd.to_datetime(df['watered_at'])
+    return df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--days", type=int, default=14)
+    parser.add_argument("--memory", action="store_true",
+                        help="compare the peak memory of the csv upload paths instead")
+    args = parser.parse_args()
+
+    synthetic_readings = generate_readings(args.days)
+    if args.memory:
+        print(f"readings:              {len(synthetic_readings):,}")
+        compare_memory(synthetic_readings)
+        raise SystemExit
+    csv_buffer, csv_write = timed(create_reading_file, synthetic_readings)
+    partitions, parquet_write = timed(
+        create_parquet_partitions, synthetic_readings)
+
+    csv_size = csv_buffer.getbuffer().nbytes
+    parquet_size = sum(buffer.getbuffer().nbytes
+                       for buffer in partitions.values())
+    _, csv_read = timed(read_csv_archive, csv_buffer)
+    _, parquet_read = timed(read_all_partitions, partitions)
+    one_plant = {key: buffer for key, buffer in partitions.items()
+                 if key.endswith("/plant_id=1/")}
+    _, parquet_plant_read = timed(
+        read_all_partitions, one_plant, ['reading_at', 'temp'])
+
+    print(f"readings:              {len(synthetic_readings):,}")
+    print(f"csv size:              {csv_size / 1e6:,.1f} MB")
+    print(
+        f"parquet size:          {parquet_size / 1e6:,.1f} MB across {len(partitions)} files")
+    print(f"csv write:             {csv_write:.2f}s")
+    print(f"parquet write:         {parquet_write:.2f}s")
+    print(f"csv full load:         {csv_read:.2f}s")
+    print(f"parquet full load:     {parquet_read:.2f}s")
+    print(f"parquet 1 plant, 2 col: {parquet_plant_read:.2f}s")
@@ -1,27 +1,54 @@
 """A script to migrate 24 hour old day to long-term bucket storage"""
 import io
 import os
+import csv
+import gzip
+import json
 import logging
+import time
 from datetime import datetime, timedelta, date
 from os import environ as ENV
-import pymssql
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 from dotenv import load_dotenv
 from boto3 import client
-from botocore.exceptions import NoCredentialsError
+from botocore.exceptions import NoCredentialsError, ClientError
+from connections import CONNECTION_POOL
+from rollups import rollup_chunk, export_rollups
 
 DATE_CONSTRAINT = datetime.now() - timedelta(hours=24)
 WEEKDAY_INDEX = datetime.today().weekday()
 CURRENT_DATE = date.today()
 TEMPORARY_DATA_FOLDER = "data/"
+ARCHIVE_FORMAT = ENV.get('ARCHIVE_FORMAT', 'parquet')
+READING_COLUMNS = ['reading_id', 'plant_id', 'reading_at',
+                   'moisture', 'temp', 'botanist_id', 'watered_at']
+READING_SCHEMA = pa.schema([('reading_id', pa.int64()), ('plant_id', pa.int16()),
+                            ('reading_at', pa.timestamp('us')), ('moisture', pa.float64()),
+                            ('temp', pa.float64()), ('botanist_id', pa.int16()),
+                            ('watered_at', pa.timestamp('us'))])
+PARQUET_ROW_GROUP_SIZE = 10000
+PARQUET_COMPRESSION = 'zstd'
+CHUNK_SIZE = int(ENV.get('MIGRATION_CHUNK_SIZE', '10000'))
+CHECKPOINT_KEY = "checkpoints/migration.json"
+MULTIPART_PART_SIZE = 8 * 1024 * 1024
+TIME_MARGIN_MS = 60000
+DELETE_BATCH_SIZE = int(ENV.get('RETENTION_BATCH_SIZE', '2000'))
+DELETE_BATCH_PAUSE = float(ENV.get('RETENTION_BATCH_PAUSE', '0'))
+ARCHIVE_COMPRESSION = ENV.get('ARCHIVE_COMPRESSION', 'gzip')
+GZIP_LEVEL = int(ENV.get('ARCHIVE_GZIP_LEVEL', '6'))
+PARTITION_DAYS_AHEAD = int(ENV.get('PARTITION_DAYS_AHEAD', '60'))
 
 
 def get_s3_client() -> client:
     """Returns input s3 client"""
     try:
-        s3_client = client('s3',
-                           aws_access_key_id=ENV.get('ACCESS_KEY'),
-                           aws_secret_access_key=ENV.get('SECRET_ACCESS_KEY'))
+        s3_client = CONNECTION_POOL.get_client('s3',
+                                               aws_access_key_id=ENV.get(
+                                                   'ACCESS_KEY'),
+                                               aws_secret_access_key=ENV.get('SECRET_ACCESS_KEY'))
         logging.info(f"""Connected to S3 bucket {
                      ENV.get('STORAGE_BUCKET_NAME')}""")
         return s3_client
@@ -31,11 +58,11 @@ def get_s3_client() -> client:
 
 
 def get_connection():
-    """returns a pymssql connection to the plants database"""
-    return pymssql.connect(server=ENV["DB_HOST"],
-                           user=ENV["DB_USER"],
-                           password=ENV["DB_PASSWORD"],
-                           database=ENV["DB_NAME"])
+    """returns a pooled pymssql connection to the plants database, for use in a with block"""
+    return CONNECTION_POOL.connection(ENV["DB_HOST"],
+                                      ENV["DB_USER"],
+                                      ENV["DB_PASSWORD"],
+                                      ENV["DB_NAME"])
 
 
 def get_prefix(current_date: date) -> str:
@@ -53,62 +80,382 @@ def upload_historical_readings(s3: client, bucket_name: str, prefix: str,
     """uploads the historical readings in memory to the s3 bucket"""
     object_key = os.path.join(prefix, filename)
     s3.upload_fileobj(file_data, bucket_name, object_key)
-    logging.info(f"csv file uploaded: {object_key}")
+    logging.info(f"archive file uploaded: {object_key}")
 
 
-def fetch_historical_readings(conn, date_constraint: datetime) -> list[tuple]:
-    """get 24 hour old readings from plant db"""
+def fetch_readings_chunk(conn, date_constraint: datetime, after_id: int, chunk_size: int) -> list[tuple]:
+    """get the next chunk of 24 hour old readings after a reading_id"""
     with conn.cursor() as cur:
         cur.execute("""
-                    SELECT * FROM gamma.readings
-                    WHERE reading_at <= %s""",
-                    (date_constraint,))
+                    SELECT TOP (%s) * FROM gamma.readings
+                    WHERE reading_id > %s AND reading_at <= %s
+                    ORDER BY reading_id""",
+                    (chunk_size, after_id, date_constraint))
 
         return cur.fetchall()
 
 
-def create_reading_file(readings: list[tuple]) -> io.BytesIO:
+def iter_historical_chunks(conn, date_constraint: datetime, chunk_size: int = CHUNK_SIZE, after_id: int = 0):
+    """yields 24 hour old readings one keyset-paginated chunk at a time"""
+    while chunk := fetch_readings_chunk(conn, date_constraint, after_id, chunk_size):
+        yield chunk
+        after_id = chunk[-1][0]
+
+
+def create_reading_file(readings: list[tuple], include_header: bool = True) -> io.BytesIO:
     """creates in-memory byte stream of csv data"""
     readings = pd.DataFrame(readings)
-    readings.columns = ['reading_id', 'plant_id', 'reading_at',
-                        'moisture', 'temp', 'botanist_id', 'watered_at']
+    readings.columns = READING_COLUMNS
 
     buffer = io.BytesIO()
-    readings.to_csv(buffer, index=False)
+    readings.to_csv(buffer, index=False, header=include_header)
     buffer.seek(0)
     return buffer
 
 
-def remove_historical_readings(conn, date_constraint: datetime) -> None:
-    """removes 24 hour old readings from plant db"""
+class MultipartUploadWriter:
+    """A writable stream that uploads to s3 in multipart chunks, so only one part is held in memory"""
+
+    def __init__(self, s3: client, bucket_name: str, object_key: str, part_size: int = MULTIPART_PART_SIZE):
+        self.s3 = s3
+        self.bucket_name = bucket_name
+        self.object_key = object_key
+        self.part_size = part_size
+        self.buffer = io.BytesIO()
+        self.parts = []
+        self.closed = False
+        self.upload_id = s3.create_multipart_upload(
+            Bucket=bucket_name, Key=object_key)['UploadId']
+
+    def write(self, data: bytes) -> int:
+        """buffers data and uploads a part each time the buffer reaches the part size"""
+        self.buffer.write(data)
+        if self.buffer.tell() >= self.part_size:
+            self.upload_part()
+        return len(data)
+
+    def upload_part(self) -> None:
+        """uploads whatever is buffered as the next part"""
+        part_number = len(self.parts) + 1
+        response = self.s3.upload_part(Bucket=self.bucket_name, Key=self.object_key, UploadId=self.upload_id,
+                                       PartNumber=part_number, Body=self.buffer.getvalue())
+        self.parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+        self.buffer = io.BytesIO()
+
+    def close(self) -> None:
+        """uploads the final part and completes the upload"""
+        if self.buffer.tell() or not self.parts:
+            self.upload_part()
+        self.s3.complete_multipart_upload(Bucket=self.bucket_name, Key=self.object_key, UploadId=self.upload_id,
+                                          MultipartUpload={"Parts": self.parts})
+        self.closed = True
+        logging.info(f"archive file uploaded: {self.object_key}")
+
+    def abort(self) -> None:
+        """discards every part uploaded so far"""
+        self.s3.abort_multipart_upload(
+            Bucket=self.bucket_name, Key=self.object_key, UploadId=self.upload_id)
+        self.closed = True
+
+
+class CsvArchiveWriter:
+    """Serialises reading rows straight to csv, gzip compressed unless turned off, and feeds them to a stream
+    such as a multipart upload, so no dataframe or whole-file buffer is built"""
+
+    def __init__(self, stream, compress: bool = True, compress_level: int = GZIP_LEVEL):
+        self.stream = stream
+        self._compressor = gzip.GzipFile(fileobj=stream, mode="wb", compresslevel=compress_level) \
+            if compress else None
+        self._output = self._compressor if compress else stream
+        self._text = io.StringIO()
+        self._csv = csv.writer(self._text, lineterminator="\n")
+        self._csv.writerow(READING_COLUMNS)
+        self.rows_written = 0
+
+    def flush(self) -> None:
+        """encodes the csv text written so far into the output and empties the text buffer"""
+        self._output.write(self._text.getvalue().encode("utf-8"))
+        self._text.seek(0)
+        self._text.truncate()
+
+    def write_rows(self, rows) -> int:
+        """writes an iterable of rows, such as one chunk from the cursor, returning how many were written"""
+        count = 0
+        for row in rows:
+            self._csv.writerow(row)
+            count += 1
+        self.flush()
+        self.rows_written += count
+        return count
+
+    def close(self) -> None:
+        """writes anything left and the gzip trailer, leaving the underlying stream for the caller to complete"""
+        self.flush()
+        if self._compressor is not None:
+            self._compressor.close()
+
+
+def get_csv_archive_key(first_id: int, compress: bool) -> str:
+    """creates the key of the csv archive starting at a reading_id"""
+    extension = ".csv.gz" if compress else ".csv"
+    return os.path.join(get_prefix(CURRENT_DATE), f"{CURRENT_DATE}-{first_id}{extension}")
+
+
+def load_checkpoint(s3: client, bucket_name: str) -> dict:
+    """returns the last archived reading_id range, or None if the last run finished cleanly"""
+    try:
+        body = s3.get_object(Bucket=bucket_name, Key=CHECKPOINT_KEY)['Body']
+        return json.loads(body.read())
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'NoSuchKey':
+            return None
+        raise
+
+
+def save_checkpoint(s3: client, bucket_name: str, first_id: int, last_id: int, date_constraint: datetime) -> None:
+    """records a reading_id range as archived before it is removed from the database"""
+    s3.put_object(Bucket=bucket_name, Key=CHECKPOINT_KEY,
+                  Body=json.dumps({"first_id": first_id, "last_id": last_id,
+                                   "date_constraint": date_constraint.isoformat()}))
+
+
+def clear_checkpoint(s3: client, bucket_name: str) -> None:
+    """marks every archived range as removed from the database"""
+    s3.delete_object(Bucket=bucket_name, Key=CHECKPOINT_KEY)
+
+
+def get_partition_prefix(reading_day: date, plant_id: int) -> str:
+    """creates the week/day/plant partition prefix for a day's readings"""
+    return f"{get_prefix(reading_day)}day={reading_day.isoformat()}/plant_id={plant_id}/"
+
+
+def create_record_batch(readings: list[tuple]) -> pa.RecordBatch:
+    """builds an arrow record batch straight from cursor rows, column by column, without a dataframe"""
+    columns = zip(*readings)
+    return pa.RecordBatch.from_arrays([pa.array(column).cast(field.type)
+                                       for column, field in zip(columns, READING_SCHEMA)], schema=READING_SCHEMA)
+
+
+def split_parquet_partitions(readings: list[tuple]) -> dict[str, pa.RecordBatch]:
+    """splits cursor rows into a record batch for every day and plant, sorted by reading_at and keyed by
+    partition prefix"""
+    batch = create_record_batch(readings)
+    days = batch.column('reading_at').cast(pa.date32()).to_pylist()
+    plant_ids = batch.column('plant_id').to_pylist()
+    rows_by_partition = {}
+    for row, partition in enumerate(zip(days, plant_ids)):
+        rows_by_partition.setdefault(partition, []).append(row)
+
+    partitions = {}
+    for (reading_day, plant_id), rows in sorted(rows_by_partition.items()):
+        partition = batch.take(pa.array(rows))
+        partitions[get_partition_prefix(reading_day, plant_id)] = partition.take(
+            pc.sort_indices(partition, sort_keys=[('reading_at', 'ascending')]))
+    return partitions
+
+
+def open_parquet_writer(stream) -> pq.ParquetWriter:
+    """opens a parquet writer over a stream such as a multipart upload, keeping row group statistics for pruning"""
+    return pq.ParquetWriter(stream, READING_SCHEMA, compression=PARQUET_COMPRESSION, write_statistics=True)
+
+
+class ParquetArchiveWriter:
+    """Keeps one parquet writer and multipart upload open for every day and plant partition for a whole run,
+    writing each chunk's rows for a partition as a row group, so a partition is one file however many chunks it spans"""
+
+    def __init__(self, s3: client, bucket_name: str, file_name: str):
+        self.s3 = s3
+        self.bucket_name = bucket_name
+        self.file_name = file_name
+        self._partitions = {}
+        self.rows_written = 0
+
+    def write_rows(self, rows: list[tuple]) -> int:
+        """writes one chunk from the cursor into the partitions it touches, returning how many rows were written"""
+        for prefix, partition in split_parquet_partitions(rows).items():
+            if prefix not in self._partitions:
+                upload = MultipartUploadWriter(self.s3, self.bucket_name, os.path.join(prefix, self.file_name))
+                self._partitions[prefix] = (upload, open_parquet_writer(upload))
+            self._partitions[prefix][1].write_batch(partition, row_group_size=PARQUET_ROW_GROUP_SIZE)
+        self.rows_written += len(rows)
+        return len(rows)
+
+    def close(self) -> None:
+        """writes every partition's footer and completes its upload"""
+        for upload, writer in self._partitions.values():
+            writer.close()
+            upload.close()
+
+    def abort(self) -> None:
+        """discards every partition upload not yet completed"""
+        for upload, _ in self._partitions.values():
+            if not upload.closed:
+                upload.abort()
+
+
+def remove_archived_readings(conn, first_id: int, last_id: int, date_constraint: datetime,
+                             batch_size: int = DELETE_BATCH_SIZE, pause: float = DELETE_BATCH_PAUSE) -> dict:
+    """removes an archived reading_id range from plant db in short batched transactions, returning delete stats"""
+    rows_deleted, batches, longest_batch = 0, 0, 0.0
+    start = time.perf_counter()
+    while True:
+        batch_start = time.perf_counter()
+        with conn.cursor() as cur:
+            cur.execute("""
+                        WITH batch AS (
+                            SELECT TOP (%s) * FROM gamma.readings
+                            WHERE reading_id BETWEEN %s AND %s AND reading_at <= %s
+                            ORDER BY reading_id)
+                        DELETE FROM batch""",
+                        (batch_size, first_id, last_id, date_constraint))
+            deleted = cur.rowcount
+            conn.commit()
+        longest_batch = max(longest_batch, time.perf_counter() - batch_start)
+        rows_deleted += max(deleted, 0)
+        batches += 1
+        if deleted < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+
+    elapsed = time.perf_counter() - start
+    stats = {"rows_deleted": rows_deleted, "batches": batches,
+             "rows_per_second": rows_deleted / elapsed if elapsed else 0.0,
+             "longest_batch_seconds": longest_batch}
+    logging.info(f"readings {first_id}-{last_id} removed from database: {stats}")
+    return stats
+
+
+def extend_reading_partitions(conn, days_ahead: int = PARTITION_DAYS_AHEAD, today: date = None) -> list[date]:
+    """splits daily partitions onto gamma.readings up to days_ahead from today, if the optional
+    003 partitioning is applied, returning the new boundaries"""
+    today = today or date.today()
     with conn.cursor() as cur:
         cur.execute("""
-                    DELETE FROM gamma.readings
-                    WHERE reading_at <= %s""",
-                    (date_constraint,))
+                    SELECT CAST(MAX(CAST(rv.value AS DATETIME2)) AS DATE) FROM sys.partition_range_values AS rv
+                    JOIN sys.partition_functions AS pf ON pf.function_id = rv.function_id
+                    WHERE pf.name = 'pf_readings_daily'""")
+        last_boundary = cur.fetchone()[0]
+        if last_boundary is None:
+            return []
 
+        boundaries = [last_boundary + timedelta(days=offset)
+                      for offset in range(1, (today + timedelta(days=days_ahead) - last_boundary).days + 1)]
+        for boundary in boundaries:
+            cur.execute("ALTER PARTITION SCHEME ps_readings_daily NEXT USED [PRIMARY]")
+            cur.execute("ALTER PARTITION FUNCTION pf_readings_daily() SPLIT RANGE (%s)", (boundary.isoformat(),))
         conn.commit()
-    logging.info("historical readings removed from database")
+    return boundaries
+
+
+def resume_from_checkpoint(conn, s3: client, bucket_name: str) -> None:
+    """finishes removing the last range a timed-out run archived but may not have deleted"""
+    checkpoint = load_checkpoint(s3, bucket_name)
+    if checkpoint:
+        logging.info(f"resuming from checkpoint {checkpoint}")
+        remove_archived_readings(conn, checkpoint["first_id"], checkpoint["last_id"],
+                                 datetime.fromisoformat(checkpoint["date_constraint"]))
+        clear_checkpoint(s3, bucket_name)
+
+
+def out_of_time(context) -> bool:
+    """whether the lambda is too close to its timeout to start another chunk"""
+    return context is not None and context.get_remaining_time_in_millis() < TIME_MARGIN_MS
+
+
+def archive_parquet_chunks(conn, s3: client, bucket_name: str, date_constraint: datetime, context=None,
+                           rollup_days: set = None) -> int:
+    """streams and rolls up old readings chunk by chunk into one parquet file per day and plant partition,
+    then removes them, returning the rows archived"""
+    chunks = iter_historical_chunks(conn, date_constraint)
+    first_chunk = next(chunks, None)
+    if first_chunk is None:
+        return 0
+    rollup_days = set() if rollup_days is None else rollup_days
+
+    first_id, last_id = first_chunk[0][0], first_chunk[-1][0]
+    writer = ParquetArchiveWriter(s3, bucket_name, f"{first_id}.parquet")
+    try:
+        writer.write_rows(first_chunk)
+        rollup_days.update(rollup_chunk(conn, first_chunk, READING_COLUMNS))
+        for chunk in chunks:
+            if out_of_time(context):
+                logging.info("stopping early, the next run will continue")
+                break
+            writer.write_rows(chunk)
+            rollup_days.update(rollup_chunk(conn, chunk, READING_COLUMNS))
+            last_id = chunk[-1][0]
+        writer.close()
+    except Exception:
+        writer.abort()
+        raise
+
+    save_checkpoint(s3, bucket_name, first_id, last_id, date_constraint)
+    remove_archived_readings(conn, first_id, last_id, date_constraint)
+    clear_checkpoint(s3, bucket_name)
+    return writer.rows_written
+
+
+def archive_csv_chunks(conn, s3: client, bucket_name: str, date_constraint: datetime, context=None,
+                       rollup_days: set = None, compress: bool = ARCHIVE_COMPRESSION == 'gzip') -> int:
+    """streams and rolls up old readings chunk by chunk into one multipart csv upload, then removes them,
+    returning the rows archived"""
+    chunks = iter_historical_chunks(conn, date_constraint)
+    first_chunk = next(chunks, None)
+    if first_chunk is None:
+        return 0
+    rollup_days = set() if rollup_days is None else rollup_days
+
+    upload = MultipartUploadWriter(s3, bucket_name, get_csv_archive_key(first_chunk[0][0], compress))
+    first_id, last_id = first_chunk[0][0], first_chunk[-1][0]
+    try:
+        writer = CsvArchiveWriter(upload, compress)
+        writer.write_rows(first_chunk)
+        rollup_days.update(rollup_chunk(conn, first_chunk, READING_COLUMNS))
+        for chunk in chunks:
+            if out_of_time(context):
+                logging.info("stopping early, the next run will continue")
+                break
+            writer.write_rows(chunk)
+            rollup_days.update(rollup_chunk(conn, chunk, READING_COLUMNS))
+            last_id = chunk[-1][0]
+        writer.close()
+        upload.close()
+    except Exception:
+        upload.abort()
+        raise
+    archived = writer.rows_written
+
+    save_checkpoint(s3, bucket_name, first_id, last_id, date_constraint)
+    remove_archived_readings(conn, first_id, last_id, date_constraint)
+    clear_checkpoint(s3, bucket_name)
+    return archived
 
 
 def handler(event=None, context=None):
     """lambda handler function"""
     load_dotenv()
-    conn = get_connection()
     s3_client = get_s3_client()
-    readings = fetch_historical_readings(conn, DATE_CONSTRAINT)
-
-    if readings:
-        csv_data = create_reading_file(readings)
-        prefix = get_prefix(CURRENT_DATE)
-        file_name = f"{CURRENT_DATE}.csv"
-        upload_historical_readings(
-            s3_client, ENV.get('STORAGE_BUCKET_NAME'), prefix, file_name, csv_data)
-        remove_historical_readings(conn, DATE_CONSTRAINT)
-    else:
-        logging.info("No new historical data")
-
-    conn.close()
+    bucket_name = ENV.get('STORAGE_BUCKET_NAME')
+    with get_connection() as conn:
+        new_partitions = extend_reading_partitions(conn)
+        if new_partitions:
+            logging.info(f"Split readings partitions up to {new_partitions[-1]}")
+        resume_from_checkpoint(conn, s3_client, bucket_name)
+
+        rollup_days = set()
+        if ARCHIVE_FORMAT == 'parquet':
+            archived = archive_parquet_chunks(
+                conn, s3_client, bucket_name, DATE_CONSTRAINT, context, rollup_days)
+        else:
+            archived = archive_csv_chunks(
+                conn, s3_client, bucket_name, DATE_CONSTRAINT, context, rollup_days)
+        export_rollups(conn, s3_client, bucket_name, rollup_days)
+
+        if not archived:
+            logging.info("No new historical data")
+
+    logging.info(f"connection pool stats: {CONNECTION_POOL.stats}")
     return {"success": "data migration complete"}
 
 
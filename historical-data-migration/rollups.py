@@ -0,0 +1,186 @@
+"""Builds hourly and daily per-plant rollups of the readings as they are archived"""
+import io
+from datetime import date, datetime, timedelta
+from os import environ as ENV
+import pandas as pd
+from boto3 import client
+from thresholds import MIN, MAX, load_rules, resolve_thresholds, outside
+
+READING_INTERVAL_MINUTES = float(ENV.get('READING_INTERVAL_MINUTES', '1'))
+GRANULARITIES = {"hourly": "h", "daily": "D"}
+ROLLUP_COLUMNS = ['plant_id', 'granularity', 'period_start', 'reading_count',
+                  'moisture_sum', 'moisture_min', 'moisture_max', 'temp_sum', 'temp_min', 'temp_max',
+                  'moisture_out_of_range_minutes', 'temp_out_of_range_minutes', 'watering_events']
+EXPORT_COLUMNS = ['plant_id', 'granularity', 'period_start', 'reading_count',
+                  'moisture_mean', 'moisture_min', 'moisture_max', 'temp_mean', 'temp_min', 'temp_max',
+                  'moisture_out_of_range_minutes', 'temp_out_of_range_minutes', 'watering_events']
+ROLLUP_PREFIX = "rollups/"
+MAX_PARAMS_PER_STATEMENT = 2000
+MERGE_ROLLUPS_QUERY = """
+    MERGE gamma.reading_rollups WITH (HOLDLOCK) AS target
+    USING (VALUES {values}) AS source ({columns})
+    ON target.plant_id = source.plant_id AND target.granularity = source.granularity
+       AND target.period_start = source.period_start
+    WHEN MATCHED THEN UPDATE SET
+        reading_count = target.reading_count + source.reading_count,
+        moisture_sum = target.moisture_sum + source.moisture_sum,
+        moisture_min = CASE WHEN target.moisture_min IS NULL OR source.moisture_min < target.moisture_min
+                            THEN source.moisture_min ELSE target.moisture_min END,
+        moisture_max = CASE WHEN target.moisture_max IS NULL OR source.moisture_max > target.moisture_max
+                            THEN source.moisture_max ELSE target.moisture_max END,
+        temp_sum = target.temp_sum + source.temp_sum,
+        temp_min = CASE WHEN target.temp_min IS NULL OR source.temp_min < target.temp_min
+                        THEN source.temp_min ELSE target.temp_min END,
+        temp_max = CASE WHEN target.temp_max IS NULL OR source.temp_max > target.temp_max
+                        THEN source.temp_max ELSE target.temp_max END,
+        moisture_out_of_range_minutes = target.moisture_out_of_range_minutes + source.moisture_out_of_range_minutes,
+        temp_out_of_range_minutes = target.temp_out_of_range_minutes + source.temp_out_of_range_minutes,
+        watering_events = target.watering_events + source.watering_events
+    WHEN NOT MATCHED THEN INSERT ({columns}) VALUES ({source_columns});"""
+MERGE_PROGRESS_QUERY = """
+    MERGE gamma.rollup_progress WITH (HOLDLOCK) AS target
+    USING (VALUES {values}) AS source (plant_id, last_reading_id, last_watered_at)
+    ON target.plant_id = source.plant_id
+    WHEN MATCHED THEN UPDATE SET last_reading_id = source.last_reading_id, last_watered_at = source.last_watered_at
+    WHEN NOT MATCHED THEN INSERT (plant_id, last_reading_id, last_watered_at)
+        VALUES (source.plant_id, source.last_reading_id, source.last_watered_at);"""
+
+
+def fetch_rollup_progress(conn, plant_ids: list[int]) -> dict:
+    """returns each plant's last rolled up reading_id and watered_at"""
+    placeholders = ", ".join(["%s"] * len(plant_ids))
+    with conn.cursor() as cur:
+        cur.execute(f"""
+                    SELECT plant_id, last_reading_id, last_watered_at FROM gamma.rollup_progress
+                    WHERE plant_id IN ({placeholders})""", tuple(plant_ids))
+
+        return {row[0]: (row[1], row[2]) for row in cur.fetchall()}
+
+
+def fetch_species_names(conn, plant_ids: list[int]) -> dict:
+    """returns each plant's species common name, which species alert thresholds are keyed by"""
+    placeholders = ", ".join(["%s"] * len(plant_ids))
+    with conn.cursor() as cur:
+        cur.execute(f"""
+                    SELECT p.plant_id, ps.common_name FROM gamma.plants AS p
+                    JOIN gamma.plant_species AS ps ON ps.species_id = p.species_id
+                    WHERE p.plant_id IN ({placeholders})""", tuple(plant_ids))
+
+        return {row[0]: row[1] for row in cur.fetchall()}
+
+
+def flag_out_of_range(readings: pd.DataFrame, rules: dict, species_names: dict) -> pd.DataFrame:
+    """marks the readings outside each plant's alert thresholds, resolved the same way the pipeline alerts on them"""
+    names = readings['plant_id'].map(species_names)
+    flags = {}
+    for flag, column, metric in (('moisture_out', 'moisture', 'moisture'), ('temp_out', 'temp', 'temperature')):
+        flags[flag] = outside(readings[column].to_numpy(dtype=float), resolve_thresholds(readings['plant_id'], names, rules, metric, MIN),
+                                resolve_thresholds(readings['plant_id'], names, rules, metric, MAX))
+    return readings.assign(**flags)
+
+
+def build_rollups(readings: pd.DataFrame, progress: dict, rules: dict,
+                  species_names: dict) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """returns the hourly and daily rollups of readings not yet rolled up, and each plant's new progress"""
+    last_ids = readings['plant_id'].map({plant_id: last[0] for plant_id, last in progress.items()})
+    readings = readings[readings['reading_id'] > last_ids.fillna(0)]
+    readings = readings.sort_values(['plant_id', 'reading_at'])
+
+    previous_watered_at = readings.groupby('plant_id')['watered_at'].shift().fillna(
+        readings['plant_id'].map({plant_id: pd.Timestamp(last[1]) for plant_id, last in progress.items()
+                                  if last[1] is not None}))
+    waterings = readings[readings['watered_at'].ne(previous_watered_at)]
+    readings = flag_out_of_range(readings, rules, species_names)
+
+    rollups = []
+    for granularity, frequency in GRANULARITIES.items():
+        stats = readings.groupby(['plant_id', readings['reading_at'].dt.floor(frequency).rename('period_start')]).agg(
+            reading_count=('reading_id', 'count'),
+            moisture_sum=('moisture', 'sum'), moisture_min=('moisture', 'min'), moisture_max=('moisture', 'max'),
+            temp_sum=('temp', 'sum'), temp_min=('temp', 'min'), temp_max=('temp', 'max'),
+            moisture_out_of_range_minutes=('moisture_out', 'sum'), temp_out_of_range_minutes=('temp_out', 'sum'))
+        events = waterings.groupby(['plant_id', waterings['watered_at'].dt.floor(frequency).rename(
+            'period_start')]).size().rename('watering_events')
+
+        rollup = stats.join(events, how='outer').reset_index()
+        counts = ['reading_count', 'moisture_sum', 'temp_sum', 'moisture_out_of_range_minutes',
+                  'temp_out_of_range_minutes', 'watering_events']
+        rollup[counts] = rollup[counts].fillna(0)
+        rollup[['reading_count', 'watering_events']] = rollup[['reading_count', 'watering_events']].astype(int)
+        rollup[['moisture_out_of_range_minutes', 'temp_out_of_range_minutes']] *= READING_INTERVAL_MINUTES
+        rollup['granularity'] = granularity
+        rollups.append(rollup)
+
+    # Readings can arrive late, so the newest reading_at is not always the highest reading_id already seen
+    new_progress = readings.groupby('plant_id').agg(
+        reading_id=('reading_id', 'max'), watered_at=('watered_at', 'last')).reset_index()
+    return pd.concat(rollups, ignore_index=True)[ROLLUP_COLUMNS], new_progress
+
+
+def to_sql_rows(frame: pd.DataFrame) -> list[tuple]:
+    """converts a df to rows of plain python values, with NaN as None"""
+    return [tuple(row) for row in frame.astype(object).where(frame.notna(), None).values.tolist()]
+
+
+def execute_values(cur, query: str, rows: list[tuple], **format_args) -> None:
+    """runs a multi-row VALUES statement in chunks that fit SQL Server's parameter limit"""
+    params_per_row = len(rows[0])
+    rows_per_chunk = min(1000, MAX_PARAMS_PER_STATEMENT // params_per_row)
+    row_placeholders = f"({', '.join(['%s'] * params_per_row)})"
+    for start in range(0, len(rows), rows_per_chunk):
+        chunk = rows[start:start + rows_per_chunk]
+        cur.execute(query.format(values=", ".join([row_placeholders] * len(chunk)), **format_args),
+                    tuple(value for row in chunk for value in row))
+
+
+def rollup_chunk(conn, chunk: list[tuple], reading_columns: list[str]) -> set[date]:
+    """adds a chunk of readings to the rollups and advances each plant's progress in one transaction,
+    returning the days touched"""
+    readings = pd.DataFrame(chunk, columns=reading_columns)
+    readings['reading_at'] = pd.to_datetime(readings['reading_at'])
+    readings['watered_at'] = pd.to_datetime(readings['watered_at'])
+    readings[['moisture', 'temp']] = readings[['moisture', 'temp']].astype(float)
+
+    plant_ids = readings['plant_id'].unique().tolist()
+    progress = fetch_rollup_progress(conn, plant_ids)
+    with conn.cursor() as cur:
+        rules = load_rules("gamma", cur)
+    rollups, new_progress = build_rollups(readings, progress, rules, fetch_species_names(conn, plant_ids))
+    if rollups.empty:
+        return set()
+
+    with conn.cursor() as cur:
+        execute_values(cur, MERGE_ROLLUPS_QUERY, to_sql_rows(rollups), columns=", ".join(ROLLUP_COLUMNS),
+                       source_columns=", ".join(f"source.{column}" for column in ROLLUP_COLUMNS))
+        execute_values(cur, MERGE_PROGRESS_QUERY, to_sql_rows(new_progress))
+        conn.commit()
+
+    return set(rollups['period_start'].dt.date)
+
+
+def fetch_day_rollups(conn, day: date) -> pd.DataFrame:
+    """returns every hourly and daily rollup starting on a day"""
+    with conn.cursor() as cur:
+        cur.execute(f"""
+                    SELECT {", ".join(EXPORT_COLUMNS)} FROM gamma.reading_rollups
+                    WHERE period_start >= %s AND period_start < %s
+                    ORDER BY granularity, plant_id, period_start""",
+                    (datetime.combine(day, datetime.min.time()),
+                     datetime.combine(day + timedelta(days=1), datetime.min.time())))
+
+        rollups = pd.DataFrame(cur.fetchall(), columns=EXPORT_COLUMNS)
+    measures = EXPORT_COLUMNS[4:12]
+    rollups[measures] = rollups[measures].astype(float)
+    return rollups
+
+
+def export_rollups(conn, s3: client, bucket_name: str, days: set[date]) -> None:
+    """writes each touched day's rollups to the bucket, replacing any earlier copy"""
+    for day in sorted(days):
+        day_rollups = fetch_day_rollups(conn, day)
+        for granularity, rollups in day_rollups.groupby('granularity'):
+            buffer = io.BytesIO()
+            rollups.to_parquet(buffer, index=False)
+            buffer.seek(0)
+            s3.upload_fileobj(buffer, bucket_name,
+                              f"{ROLLUP_PREFIX}{granularity}/day={day.isoformat()}/rollups.parquet")
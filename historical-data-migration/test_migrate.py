@@ -1,9 +1,13 @@
 # pylint: skip-file
-from migrate import fetch_historical_readings, remove_historical_readings, DATE_CONSTRAINT
-from migrate import get_prefix, create_reading_file
-from unittest.mock import MagicMock
+from migrate import DATE_CONSTRAINT, get_prefix, create_reading_file, split_parquet_partitions, ParquetArchiveWriter
+from migrate import iter_historical_chunks, MultipartUploadWriter, archive_parquet_chunks, archive_csv_chunks
+from migrate import remove_archived_readings, CsvArchiveWriter, extend_reading_partitions
+from unittest.mock import MagicMock, PropertyMock, patch
 import pytest
 import datetime
+import gzip
+import io
+import pyarrow.parquet as pq
 
 
 @pytest.fixture
@@ -22,46 +26,260 @@ def fake_csv_output():
 """
 
 
-def test_fetch_historical_readings():
+def test_get_prefix():
+    input = datetime.date(2020, 5, 17)
+
+    assert get_prefix(input) == "wc-11-05-2020/"
+
+
+def test_create_reading_file(fake_readings, fake_csv_output):
+    input = fake_readings
+    output = fake_csv_output
+
+    buffer = create_reading_file(input)
+    buffer.seek(0)
+    actual_csv = buffer.read().decode('utf-8')
+
+    assert actual_csv == output
+
+
+def test_csv_archive_writer_matches_create_reading_file(fake_readings, fake_csv_output):
+    stream = io.BytesIO()
+
+    writer = CsvArchiveWriter(stream, compress=False)
+    writer.write_rows(iter(fake_readings[:1]))
+    writer.write_rows(iter(fake_readings[1:]))
+    writer.close()
+
+    assert stream.getvalue().decode("utf-8") == fake_csv_output
+    assert writer.rows_written == 2
+
+
+def test_csv_archive_writer_compresses_as_it_goes(fake_readings, fake_csv_output):
+    stream = io.BytesIO()
+
+    writer = CsvArchiveWriter(stream)
+    writer.write_rows(fake_readings)
+    writer.close()
+
+    assert gzip.decompress(stream.getvalue()).decode("utf-8") == fake_csv_output
+
+
+def test_split_parquet_partitions(fake_readings):
+    partitions = split_parquet_partitions(fake_readings)
+
+    assert list(partitions) == ["wc-10-06-2024/day=2024-06-10/plant_id=9/",
+                                "wc-10-06-2024/day=2024-06-12/plant_id=5/"]
+    partition = partitions["wc-10-06-2024/day=2024-06-12/plant_id=5/"]
+    assert partition.schema.names == ['reading_id', 'plant_id', 'reading_at',
+                                      'moisture', 'temp', 'botanist_id', 'watered_at']
+    assert partition.column('reading_at').to_pylist() == [
+        datetime.datetime(2024, 6, 12, 18, 38, 8)]
+
+
+def fake_multipart_s3() -> MagicMock:
+    mock_s3 = MagicMock()
+    mock_s3.create_multipart_upload.side_effect = lambda Bucket, Key: {"UploadId": Key}
+    mock_s3.upload_part.return_value = {"ETag": "etag"}
+    return mock_s3
+
+
+def uploaded_files(mock_s3: MagicMock) -> dict[str, pq.ParquetFile]:
+    bodies = {}
+    for call in mock_s3.upload_part.call_args_list:
+        bodies[call.kwargs["Key"]] = bodies.get(call.kwargs["Key"], b"") + call.kwargs["Body"]
+    return {key: pq.ParquetFile(io.BytesIO(body)) for key, body in bodies.items()}
+
+
+def test_parquet_archive_writer_keeps_one_file_per_partition(fake_readings):
+    mock_s3 = fake_multipart_s3()
+    later = (3, 5, "2024-06-12 18:39:08", 80.9, 11.6, 2, "2024-06-12 15:38:08")
+
+    writer = ParquetArchiveWriter(mock_s3, "bucket", "1.parquet")
+    writer.write_rows(fake_readings)
+    writer.write_rows([later])
+    writer.close()
+
+    files = uploaded_files(mock_s3)
+    assert sorted(files) == ["wc-10-06-2024/day=2024-06-10/plant_id=9/1.parquet",
+                             "wc-10-06-2024/day=2024-06-12/plant_id=5/1.parquet"]
+    plant_5 = files["wc-10-06-2024/day=2024-06-12/plant_id=5/1.parquet"]
+    assert plant_5.read().column('reading_id').to_pylist() == [1, 3]
+    assert plant_5.metadata.num_row_groups == 2
+    assert plant_5.metadata.row_group(0).column(2).statistics.has_min_max
+    assert writer.rows_written == 3
+
+
+def test_parquet_archive_writer_aborts_unfinished_uploads(fake_readings):
+    mock_s3 = fake_multipart_s3()
+    mock_s3.complete_multipart_upload.side_effect = [None, Exception("upload failed")]
+
+    writer = ParquetArchiveWriter(mock_s3, "bucket", "1.parquet")
+    writer.write_rows(fake_readings)
+    with pytest.raises(Exception):
+        writer.close()
+    writer.abort()
+
+    mock_s3.abort_multipart_upload.assert_called_once()
+
+
+def test_iter_historical_chunks_pages_by_reading_id(fake_readings):
     mock_conn = MagicMock()
     mock_cursor = MagicMock()
+    mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+    mock_cursor.fetchall.side_effect = [[fake_readings[0]], [fake_readings[1]], []]
+
+    chunks = list(iter_historical_chunks(mock_conn, DATE_CONSTRAINT, 1))
 
+    assert chunks == [[fake_readings[0]], [fake_readings[1]]]
+    assert "reading_id > %s" in mock_cursor.execute.call_args_list[0][0][0]
+    assert [call[0][1][1] for call in mock_cursor.execute.call_args_list] == [0, 1, 2]
+
+
+def test_extend_reading_partitions_splits_up_to_days_ahead():
+    mock_conn = MagicMock()
+    mock_cursor = MagicMock()
     mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+    mock_cursor.fetchone.return_value = (datetime.date(2024, 6, 13),)
 
-    fetch_historical_readings(mock_conn, DATE_CONSTRAINT)
+    boundaries = extend_reading_partitions(mock_conn, 2, datetime.date(2024, 6, 12))
 
-    mock_cursor.execute.assert_called_once()
-    call_args = mock_cursor.execute.call_args[0]
-    assert "SELECT * FROM gamma.readings" in call_args[0]
-    assert "WHERE reading_at <= %s" in call_args[0]
+    assert boundaries == [datetime.date(2024, 6, 14)]
+    splits = [call[0] for call in mock_cursor.execute.call_args_list if "SPLIT RANGE" in call[0][0]]
+    assert [args[1] for args in splits] == [("2024-06-14",)]
+    mock_conn.commit.assert_called_once()
 
 
-def test_remove_historical_readings():
+def test_extend_reading_partitions_skips_unpartitioned_readings():
     mock_conn = MagicMock()
     mock_cursor = MagicMock()
+    mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+    mock_cursor.fetchone.return_value = (None,)
 
+    assert extend_reading_partitions(mock_conn) == []
+    assert mock_cursor.execute.call_count == 1
+    mock_conn.commit.assert_not_called()
+
+
+def test_multipart_upload_writer_uploads_in_parts():
+    mock_s3 = MagicMock()
+    mock_s3.create_multipart_upload.return_value = {"UploadId": "upload"}
+    mock_s3.upload_part.return_value = {"ETag": "etag"}
+
+    writer = MultipartUploadWriter(mock_s3, "bucket", "key.csv", part_size=4)
+    writer.write(b"12345")
+    writer.write(b"67")
+    writer.close()
+
+    bodies = [call.kwargs["Body"] for call in mock_s3.upload_part.call_args_list]
+    assert bodies == [b"12345", b"67"]
+    parts = mock_s3.complete_multipart_upload.call_args.kwargs["MultipartUpload"]["Parts"]
+    assert [part["PartNumber"] for part in parts] == [1, 2]
+
+
+@patch('migrate.rollup_chunk', return_value=set())
+def test_archive_parquet_chunks_deletes_the_run_after_upload(mock_rollup, fake_readings):
+    mock_conn = MagicMock()
+    mock_cursor = MagicMock()
     mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+    mock_cursor.fetchall.side_effect = [[fake_readings[0]], [fake_readings[1]], []]
+    mock_cursor.rowcount = 2
+    mock_s3 = fake_multipart_s3()
 
-    remove_historical_readings(mock_conn, DATE_CONSTRAINT)
+    archived = archive_parquet_chunks(mock_conn, mock_s3, "bucket", DATE_CONSTRAINT)
 
-    mock_cursor.execute.assert_called_once()
-    call_args = mock_cursor.execute.call_args[0]
-    assert "DELETE FROM gamma.readings" in call_args[0]
-    assert "WHERE reading_at <= %s" in call_args[0]
+    assert archived == 2
+    assert mock_rollup.call_count == 2
+    keys = [call.kwargs["Key"] for call in mock_s3.complete_multipart_upload.call_args_list]
+    assert len(keys) == 2 and all(key.endswith("/1.parquet") for key in keys)
+    delete_query, delete_params = mock_cursor.execute.call_args_list[-1][0]
+    assert "DELETE FROM batch" in delete_query
+    assert delete_params[1:3] == (1, 2)
+    mock_s3.put_object.assert_called_once()
+    mock_s3.delete_object.assert_called_once()
 
 
-def test_get_prefix():
-    input = datetime.date(2020, 5, 17)
+@patch('migrate.rollup_chunk', return_value=set())
+def test_archive_parquet_chunks_aborts_without_deleting_on_failure(mock_rollup, fake_readings):
+    mock_conn = MagicMock()
+    mock_cursor = MagicMock()
+    mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+    mock_cursor.fetchall.side_effect = [fake_readings, []]
+    mock_s3 = fake_multipart_s3()
+    mock_s3.complete_multipart_upload.side_effect = Exception("upload failed")
 
-    assert get_prefix(input) == "wc-11-05-2020/"
+    with pytest.raises(Exception):
+        archive_parquet_chunks(mock_conn, mock_s3, "bucket", DATE_CONSTRAINT)
 
+    assert mock_s3.abort_multipart_upload.call_count == 2
+    assert all("DELETE" not in call[0][0]
+               for call in mock_cursor.execute.call_args_list)
 
-def test_create_reading_file(fake_readings, fake_csv_output):
-    input = fake_readings
-    output = fake_csv_output
 
-    buffer = create_reading_file(input)
-    buffer.seek(0)
-    actual_csv = buffer.read().decode('utf-8')
+@patch('migrate.rollup_chunk', return_value=set())
+def test_archive_parquet_chunks_stops_when_out_of_time(mock_rollup, fake_readings):
+    mock_conn = MagicMock()
+    mock_cursor = MagicMock()
+    mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+    mock_cursor.fetchall.side_effect = [[fake_readings[0]], [fake_readings[1]], []]
+    mock_cursor.rowcount = 1
+    mock_context = MagicMock()
+    mock_context.get_remaining_time_in_millis.return_value = 0
 
-    assert actual_csv == output
+    archived = archive_parquet_chunks(mock_conn, MagicMock(), "bucket",
+                                      DATE_CONSTRAINT, mock_context)
+
+    assert archived == 1
+
+
+@patch('migrate.rollup_chunk', return_value=set())
+def test_archive_csv_chunks_aborts_without_deleting_on_failure(mock_rollup, fake_readings):
+    mock_conn = MagicMock()
+    mock_cursor = MagicMock()
+    mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+    mock_cursor.fetchall.side_effect = [fake_readings, []]
+    mock_s3 = MagicMock()
+    mock_s3.complete_multipart_upload.side_effect = Exception("upload failed")
+
+    with pytest.raises(Exception):
+        archive_csv_chunks(mock_conn, mock_s3, "bucket", DATE_CONSTRAINT)
+
+    mock_s3.abort_multipart_upload.assert_called_once()
+    assert all("DELETE" not in call[0][0]
+               for call in mock_cursor.execute.call_args_list)
+
+
+@patch('migrate.rollup_chunk', return_value=set())
+def test_archive_csv_chunks_uploads_gzip_csv(mock_rollup, fake_readings, fake_csv_output):
+    mock_conn = MagicMock()
+    mock_cursor = MagicMock()
+    mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+    mock_cursor.fetchall.side_effect = [[fake_readings[0]], [fake_readings[1]], []]
+    mock_cursor.rowcount = 2
+    mock_s3 = MagicMock()
+    mock_s3.create_multipart_upload.return_value = {"UploadId": "upload"}
+    mock_s3.upload_part.return_value = {"ETag": "etag"}
+
+    archived = archive_csv_chunks(mock_conn, mock_s3, "bucket", DATE_CONSTRAINT, compress=True)
+
+    assert archived == 2
+    assert mock_s3.create_multipart_upload.call_args.kwargs["Key"].endswith("-1.csv.gz")
+    body = b"".join(call.kwargs["Body"] for call in mock_s3.upload_part.call_args_list)
+    assert gzip.decompress(body).decode("utf-8") == fake_csv_output
+    mock_s3.complete_multipart_upload.assert_called_once()
+
+
+def test_remove_archived_readings_deletes_in_batches():
+    mock_conn = MagicMock()
+    mock_cursor = MagicMock()
+    mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+    type(mock_cursor).rowcount = PropertyMock(side_effect=[2, 2, 1])
+
+    stats = remove_archived_readings(mock_conn, 1, 5, DATE_CONSTRAINT, batch_size=2)
+
+    assert stats["rows_deleted"] == 5
+    assert stats["batches"] == 3
+    assert mock_conn.commit.call_count == 3
+    query, params = mock_cursor.execute.call_args[0]
+    assert "SELECT TOP (%s)" in query and "ORDER BY reading_id" in query
+    assert params == (2, 1, 5, DATE_CONSTRAINT)
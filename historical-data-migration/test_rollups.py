@@ -0,0 +1,112 @@
+# pylint: skip-file
+import datetime
+from unittest.mock import MagicMock
+import pandas as pd
+import pytest
+
+from rollups import build_rollups, rollup_chunk, to_sql_rows, export_rollups, EXPORT_COLUMNS
+from migrate import READING_COLUMNS
+
+
+@pytest.fixture
+def readings():
+    df = pd.DataFrame([(1, 5, "2024-06-12 10:58:00", 20.0, 14.0, 2, "2024-06-12 09:00:00"),
+                       (2, 5, "2024-06-12 10:59:00", 25.0, 14.0, 2, "2024-06-12 10:59:00"),
+                       (3, 5, "2024-06-12 11:00:00", 26.0, 40.0, 2, "2024-06-12 10:59:00"),
+                       (4, 6, "2024-06-12 11:00:00", 26.0, 20.0, 2, "2024-06-12 08:00:00")],
+                      columns=READING_COLUMNS)
+    df['reading_at'] = pd.to_datetime(df['reading_at'])
+    df['watered_at'] = pd.to_datetime(df['watered_at'])
+    return df
+
+
+@pytest.fixture
+def rules():
+    return {"defaults": {"moisture": {"min": 21, "max": 41}, "temperature": {"min": 7, "max": 38}},
+            "species": {}, "plants": {}, "rolling_window": 0}
+
+
+def test_build_rollups_hourly_and_daily(readings, rules):
+    rollups, _ = build_rollups(readings, {}, rules, {})
+    daily = rollups[(rollups['granularity'] == 'daily') & (rollups['plant_id'] == 5)].iloc[0]
+    hourly = rollups[(rollups['granularity'] == 'hourly') & (rollups['plant_id'] == 5)]
+
+    assert daily['reading_count'] == 3
+    assert (daily['moisture_min'], daily['moisture_max']) == (20.0, 26.0)
+    assert daily['moisture_out_of_range_minutes'] == 1
+    assert daily['temp_out_of_range_minutes'] == 1
+    assert daily['watering_events'] == 2
+    assert hourly['reading_count'].tolist() == [0, 2, 1]
+
+
+def test_build_rollups_skips_rolled_up_readings(readings, rules):
+    rollups, progress = build_rollups(readings, {5: (1, "2024-06-12 09:00:00")}, rules, {})
+    daily = rollups[(rollups['granularity'] == 'daily') & (rollups['plant_id'] == 5)].iloc[0]
+
+    assert daily['reading_count'] == 2
+    assert daily['watering_events'] == 1
+    assert to_sql_rows(progress) == [(5, 3, pd.Timestamp("2024-06-12 10:59:00")),
+                                     (6, 4, pd.Timestamp("2024-06-12 08:00:00"))]
+
+
+def test_build_rollups_progress_keeps_the_highest_reading_id(readings, rules):
+    late = readings.copy()
+    late.loc[0, 'reading_id'] = 7
+
+    _, progress = build_rollups(late, {}, rules, {})
+
+    assert to_sql_rows(progress)[0] == (5, 7, pd.Timestamp("2024-06-12 10:59:00"))
+
+
+def test_build_rollups_uses_species_and_plant_thresholds(readings, rules):
+    rules["species"] = {"venus flytrap": {"moisture": {"min": 10, "max": 90}}}
+    rules["plants"] = {"6": {"temperature": {"max": 15}}}
+
+    rollups, _ = build_rollups(readings, {}, rules, {5: "venus flytrap", 6: "dragon tree"})
+    daily = rollups[rollups['granularity'] == 'daily'].set_index('plant_id')
+
+    assert daily.loc[5, 'moisture_out_of_range_minutes'] == 0
+    assert daily.loc[5, 'temp_out_of_range_minutes'] == 1
+    assert daily.loc[6, 'temp_out_of_range_minutes'] == 1
+
+
+def test_rollup_chunk_merges_in_one_transaction(readings):
+    mock_conn = MagicMock()
+    mock_cursor = MagicMock()
+    mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+    mock_cursor.fetchall.return_value = []
+
+    days = rollup_chunk(mock_conn, list(readings.itertuples(index=False)), READING_COLUMNS)
+
+    assert days == {datetime.date(2024, 6, 12)}
+    queries = [call[0][0] for call in mock_cursor.execute.call_args_list]
+    assert "gamma.plant_species" in queries[1]
+    assert "MERGE gamma.reading_rollups" in queries[2]
+    assert "MERGE gamma.rollup_progress" in queries[3]
+    mock_conn.commit.assert_called_once()
+
+
+def test_rollup_chunk_already_rolled_up(readings):
+    mock_conn = MagicMock()
+    mock_cursor = MagicMock()
+    mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+    mock_cursor.fetchall.side_effect = [[(5, 3, None), (6, 4, None)], [(5, "venus flytrap")]]
+
+    assert rollup_chunk(mock_conn, list(readings.itertuples(index=False)), READING_COLUMNS) == set()
+    mock_conn.commit.assert_not_called()
+
+
+def test_export_rollups_writes_one_file_per_granularity():
+    mock_conn = MagicMock()
+    mock_cursor = MagicMock()
+    mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+    mock_cursor.fetchall.return_value = [
+        (5, 'daily', datetime.datetime(2024, 6, 12), 3, 23.6, 20, 26, 22.6, 14, 40, 1, 1, 2),
+        (5, 'hourly', datetime.datetime(2024, 6, 12, 10), 2, 22.5, 20, 25, 14, 14, 14, 1, 0, 1)]
+    mock_s3 = MagicMock()
+
+    export_rollups(mock_conn, mock_s3, "bucket", {datetime.date(2024, 6, 12)})
+
+    keys = sorted(call[0][2] for call in mock_s3.upload_fileobj.call_args_list)
+    assert keys == ["rollups/daily/day=2024-06-12/rollups.parquet",
+                    "rollups/hourly/day=2024-06-12/rollups.parquet"]
@@ -0,0 +1,119 @@
+"This file keeps each plant's most recent readings so alert checks don't have to query the database"
+
+import os
+import json
+import posixpath
+import logging
+from collections import deque
+from botocore.exceptions import ClientError
+
+ALERT_HISTORY_SIZE = int(os.getenv('ALERT_HISTORY_SIZE', '5'))
+ALERT_STATE_PATH = os.getenv('ALERT_STATE_PATH', '/tmp/alert_state.json')
+ALERT_STATE_BUCKET = os.getenv('ALERT_STATE_BUCKET')
+ALERT_STATE_KEY = os.getenv('ALERT_STATE_KEY', 'alert-state/snapshot.json')
+
+
+class AlertStateStore:
+    """The last N (reading_at, temp, moisture) readings of every plant, snapshotted to a local file and optionally S3"""
+
+    def __init__(self, history_size: int = ALERT_HISTORY_SIZE, path: str = ALERT_STATE_PATH,
+                 bucket: str = ALERT_STATE_BUCKET, key: str = ALERT_STATE_KEY):
+        self.history_size = history_size
+        self.path = path
+        self.bucket = bucket
+        self.key = key
+        self._unsharded = (path, key)
+        self._history = {}
+        self.loaded = False
+
+    def __contains__(self, plant_id: int) -> bool:
+        return plant_id in self._history
+
+    def missing(self, plant_ids: list[int]) -> list[int]:
+        """Returns the unique plant IDs the store knows nothing about yet"""
+        return [plant_id for plant_id in dict.fromkeys(plant_ids) if plant_id not in self._history]
+
+    def history(self, plant_id: int) -> list[tuple]:
+        """Returns a plant's known readings, oldest first"""
+        return list(self._history.get(plant_id, ()))
+
+    def latest(self, plant_id: int) -> tuple:
+        """Returns a plant's most recent (temp, moisture) reading, or None if it has none"""
+        readings = self._history.get(plant_id)
+        return readings[-1][1:] if readings else None
+
+    def seed(self, plant_ids: list[int], previous_readings: dict) -> None:
+        """Fills in plants from a database lookup, remembering the ones with no readings at all"""
+        for plant_id in plant_ids:
+            readings = self._history.setdefault(
+                plant_id, deque(maxlen=self.history_size))
+            if plant_id in previous_readings and not readings:
+                temp, moisture = previous_readings[plant_id]
+                readings.append((None, float(temp), float(moisture)))
+
+    def record(self, plant_id: int, reading_at: str, temp: float, moisture: float) -> None:
+        """Appends a newly loaded reading, ignoring any that isn't newer than the last one kept"""
+        readings = self._history.setdefault(
+            plant_id, deque(maxlen=self.history_size))
+        if readings and readings[-1][0] is not None and reading_at <= readings[-1][0]:
+            return
+        readings.append((reading_at, temp, moisture))
+
+    def to_snapshot(self) -> str:
+        """Serialises every plant's readings to JSON"""
+        return json.dumps({str(plant_id): list(readings) for plant_id, readings in self._history.items()})
+
+    def restore(self, snapshot: str) -> None:
+        """Replaces the store's readings with a JSON snapshot"""
+        self._history = {int(plant_id): deque((tuple(reading) for reading in readings), maxlen=self.history_size)
+                         for plant_id, readings in json.loads(snapshot).items()}
+
+    def load(self, s3_client=None) -> None:
+        """Restores the latest snapshot on a cold start, from the local file or else S3"""
+        if self.loaded:
+            return
+        self.loaded = True
+        try:
+            if self.path and os.path.exists(self.path):
+                with open(self.path, encoding="utf-8") as snapshot_file:
+                    self.restore(snapshot_file.read())
+            elif self.bucket and s3_client:
+                response = s3_client.get_object(Bucket=self.bucket, Key=self.key)
+                self.restore(response['Body'].read())
+        except (OSError, ValueError, ClientError) as e:
+            logging.warning("Unable to restore alert state, starting empty: %s", e)
+            self._history = {}
+
+    def save(self, s3_client=None) -> None:
+        """Writes a snapshot to the local file and, if configured, S3"""
+        snapshot = self.to_snapshot()
+        try:
+            if self.path:
+                with open(self.path, "w", encoding="utf-8") as snapshot_file:
+                    snapshot_file.write(snapshot)
+            if self.bucket and s3_client:
+                s3_client.put_object(Bucket=self.bucket, Key=self.key, Body=snapshot)
+        except (OSError, ClientError) as e:
+            logging.warning("Unable to save alert state: %s", e)
+
+    def use_shard(self, shard_index: int, shard_count: int) -> None:
+        """Points the snapshot at a file and key of its own for one shard, so shards running at once don't overwrite
+        each other's state, starting over if the store was holding another shard's plants"""
+        path, key = self._unsharded
+        if shard_count > 1:
+            shard = f"shard-{shard_index}-of-{shard_count}"
+            if path:
+                root, extension = os.path.splitext(path)
+                path = f"{root}-{shard}{extension}"
+            key = posixpath.join(posixpath.dirname(key), shard, posixpath.basename(key))
+        if (path, key) != (self.path, self.key):
+            self.path, self.key = path, key
+            self.clear()
+
+    def clear(self) -> None:
+        """Forgets every reading so the next run reloads"""
+        self._history = {}
+        self.loaded = False
+
+
+ALERT_STATE = AlertStateStore()
@@ -0,0 +1,85 @@
+"This file batches abnormal level alerts into one deduplicated SNS digest per run"
+
+import os
+import time
+import logging
+import threading
+from botocore.exceptions import BotoCoreError, ClientError
+from connections import CONNECTION_POOL
+
+TOPIC_ARN = "arn:aws:sns:eu-west-2:129033205317:vodnik-you-got-mail"
+ALERT_COOLDOWN = float(os.getenv('ALERT_COOLDOWN', '3600'))
+SENT = "sent"
+SUPPRESSED = "suppressed"
+DIGESTS = "digests"
+FAILED = "failed"
+
+
+def get_sns_client():
+    """Returns the pooled SNS client"""
+    return CONNECTION_POOL.get_client('sns', aws_access_key_id=os.getenv('ACCESS_KEY'),
+                                      aws_secret_access_key=os.getenv('SECRET_ACCESS_KEY'))
+
+
+class AlertDispatcher:
+    """Collects alerts during a run, drops repeats of a (plant, metric) within the cooldown, and sends them as one digest"""
+
+    def __init__(self, topic_arn: str = TOPIC_ARN, cooldown_seconds: float = ALERT_COOLDOWN, clock=time.time):
+        self.topic_arn = topic_arn
+        self.cooldown_seconds = cooldown_seconds
+        self._clock = clock
+        self._pending = {}
+        self._last_sent = {}
+        self._lock = threading.Lock()
+        self.stats = {SENT: 0, SUPPRESSED: 0, DIGESTS: 0, FAILED: 0}
+
+    def collect(self, plant_id: int, metric: str, message: str) -> bool:
+        """Queues an alert for the digest, returning False if it repeats one pending or sent within the cooldown"""
+        key = (plant_id, metric)
+        with self._lock:
+            last_sent = self._last_sent.get(key)
+            if key in self._pending or (last_sent is not None and self._clock() - last_sent < self.cooldown_seconds):
+                self.stats[SUPPRESSED] += 1
+                return False
+            self._pending[key] = message
+            return True
+
+    def resolve(self, plant_id: int, metric: str) -> None:
+        """Ends a (plant, metric) cooldown once it is back in range, so the next problem alerts straight away"""
+        with self._lock:
+            self._last_sent.pop((plant_id, metric), None)
+
+    @staticmethod
+    def build_digest(alerts: dict) -> tuple[str, str]:
+        """Returns the subject and body of a digest covering every alert"""
+        subject = f"Plant health: {len(alerts)} issue{'s' if len(alerts) != 1 else ''} found"
+        lines = [f"- Plant {plant_id}, {metric}: {message}"
+                 for (plant_id, metric), message in sorted(alerts.items())]
+        body = "Good day to you, the following plants need checking:\n\n" + "\n".join(lines)
+        return subject, body
+
+    def flush(self, sns_client) -> None:
+        """Publishes everything collected so far as a single digest"""
+        with self._lock:
+            alerts, self._pending = self._pending, {}
+        if not alerts:
+            return
+
+        subject, body = self.build_digest(alerts)
+        try:
+            sns_client.publish(TopicArn=self.topic_arn,
+                               Message=body, Subject=subject[:100])
+        except (BotoCoreError, ClientError) as e:
+            logging.error("Unable to send alert digest: %s", e)
+            with self._lock:
+                self.stats[FAILED] += 1
+            return
+
+        sent_at = self._clock()
+        with self._lock:
+            self._last_sent.update({key: sent_at for key in alerts})
+            self.stats[SENT] += len(alerts)
+            self.stats[DIGESTS] += 1
+
+
+ALERT_DISPATCHER = AlertDispatcher()
@@ -0,0 +1,144 @@
+"""Benchmarks apply_transformations against the original strptime-based implementation and the dict-building version"""
+# pylint: disable=C0301
+import argparse
+import random
+import re
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime, timedelta
+from transform import apply_transformations, format_watered_at, format_recording_taken, format_phone_number
+
+BOTANISTS = [{"email": "carl.linnaeus@lnhm.co.uk", "name": "Carl Linnaeus", "phone": "(146)994-1635x35992"},
+             {"email": "eliza.andrews@lnhm.co.uk",
+                 "name": "Eliza Andrews", "phone": "(846)669-6651x75948"},
+             {"email": "gertrude.jekyll@lnhm.co.uk", "name": "Gertrude Jekyll", "phone": "001-481-273-3691x127"}]
+LOCATIONS = [["43.50891", "16.43915", "Split", "HR", "Europe/Zagreb"],
+             ["23.29549", "113.82465", "Licheng", "CN", "Asia/Shanghai"],
+             ["7.65649", "4.92235", "Efon-Alaaye", "NG", "Africa/Lagos"]]
+PLANTS_PER_MINUTE = 50
+
+
+def legacy_apply_transformations(all_plant_data: list[dict]) -> list[dict]:
+    """The transform as it was before the fast paths, kept as the reference output"""
+    formatted_data = []
+    for plant in all_plant_data:
+        if "error" not in plant:
+            try:
+                plant_scientific_name = plant["scientific_name"][0].lower(
+                ) if "scientific_name" in plant else None
+                plant_name = plant["name"].lower()
+                current_plant_id = plant["plant_id"]
+                plant_watered_at = datetime.strptime(
+                    plant["last_watered"], '%a, %d %b %Y %H:%M:%S %Z').strftime('%Y-%m-%d %H:%M:%S')
+                current_temp = float(plant["temperature"])
+                current_moisture = float(plant["soil_moisture"])
+                plant_reading_at = datetime.strptime(
+                    plant["recording_taken"], '%Y-%m-%d %H:%M:%S').strftime('%Y-%m-%d %H:%M:%S')
+                lat = float(plant["origin_location"][0])
+                lon = float(plant["origin_location"][1])
+                city_name = plant["origin_location"][2]
+                country_code = plant["origin_location"][3]
+                timezone = plant["origin_location"][4]
+                botanist_phone = re.sub(
+                    r'[^\d]', "", plant["botanist"]["phone"])
+                botanist_email = plant["botanist"]["email"]
+                botanist_name = plant["botanist"]["name"]
+                formatted_data.append({"plant_id": current_plant_id, "name": plant_name, "scientific_name": plant_scientific_name,
+                                       "last_watered": plant_watered_at, "temperature": current_temp, "soil_moisture": current_moisture,
+                                       "reading_at": plant_reading_at, "origin_location": [lat, lon, city_name, country_code, timezone],
+                                       "botanist": {"name": botanist_name, "email": botanist_email, "phone": botanist_phone}})
+            except (KeyError, IndexError):
+                continue
+    return formatted_data
+
+
+def dict_apply_transformations(all_plant_data: list[dict]) -> list[dict]:
+    """The fast-parsing transform as it was before records, building a nested dict per plant"""
+    formatted_data = []
+    append = formatted_data.append
+    for plant in all_plant_data:
+        if "error" not in plant:
+            try:
+                location = plant["origin_location"]
+                botanist = plant["botanist"]
+                append({"plant_id": plant["plant_id"], "name": plant["name"].lower(),
+                        "scientific_name": plant["scientific_name"][0].lower() if "scientific_name" in plant else None,
+                        "last_watered": format_watered_at(plant["last_watered"]), "temperature": float(plant["temperature"]),
+                        "soil_moisture": float(plant["soil_moisture"]),
+                        "reading_at": format_recording_taken(plant["recording_taken"]),
+                        "origin_location": [float(location[0]), float(location[1]), location[2], location[3], location[4]],
+                        "botanist": {"name": botanist["name"], "email": botanist["email"],
+                                     "phone": format_phone_number(botanist["phone"])}})
+            except (KeyError, IndexError):
+                continue
+    return formatted_data
+
+
+def generate_records(count: int, seed: int = 0) -> list[dict]:
+    """Creates API-shaped readings for 50 plants a minute, each watered every few hours"""
+    rng = random.Random(seed)
+    start = datetime(2024, 6, 1)
+    records = []
+    for i in range(count):
+        plant_id = i % PLANTS_PER_MINUTE + 1
+        minute = i // PLANTS_PER_MINUTE
+        watered = start + timedelta(hours=(minute // 180) * 3,
+                                    minutes=plant_id)
+        record = {"botanist": BOTANISTS[plant_id % len(BOTANISTS)],
+                  "last_watered": watered.strftime('%a, %d %b %Y %H:%M:%S GMT'),
+                  "name": f"Plant {plant_id}", "origin_location": LOCATIONS[plant_id % len(LOCATIONS)], "plant_id": plant_id,
+                  "recording_taken": (start + timedelta(minutes=minute, seconds=rng.randrange(60))).strftime('%Y-%m-%d %H:%M:%S'),
+                  "soil_moisture": rng.uniform(10, 100), "temperature": rng.uniform(5, 40)}
+        if plant_id % 4 == 0:
+            record["scientific_name"] = [f"Plantae {plant_id}"]
+        records.append(record)
+    return records
+
+
+def time_transform(transform, records: list[dict]) -> tuple[list[dict], float]:
+    """Returns the transform's output and its throughput in records per second"""
+    start = time.perf_counter()
+    output = transform(records)
+    return output, len(records) / (time.perf_counter() - start)
+
+
+def measure_output_memory(transform, records: list[dict]) -> float:
+    """Returns the bytes a transform's output keeps alive per record, from the traced memory still held afterwards"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    output = transform(records)
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del output
+    return held / len(records)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--records", type=int, default=1_000_000)
+    parser.add_argument("--memory-records", type=int, default=100_000,
+                        help="records to measure output memory over, as tracing slows the transform down")
+    args = parser.parse_args()
+
+    synthetic_records = generate_records(args.records)
+    before, before_rate = time_transform(
+        legacy_apply_transformations, synthetic_records)
+    as_dicts, dict_rate = time_transform(
+        dict_apply_transformations, synthetic_records)
+    after, after_rate = time_transform(
+        lambda records: apply_transformations(records, Counter()), synthetic_records)
+
+    assert repr(as_dicts) == repr(before), "dict transform output differs"
+    assert repr([plant.to_dict() for plant in after]) == repr(before), "record transform output differs"
+    del before, as_dicts, after
+
+    memory_records = synthetic_records[:args.memory_records]
+    dict_bytes = measure_output_memory(dict_apply_transformations, memory_records)
+    record_bytes = measure_output_memory(lambda records: apply_transformations(records, Counter()), memory_records)
+    print(f"records:  {args.records:,}")
+    print(f"before:   {before_rate:,.0f} records/sec")
+    print(f"dicts:    {dict_rate:,.0f} records/sec, {dict_bytes:,.0f} bytes/record")
+    print(f"records:  {after_rate:,.0f} records/sec, {record_bytes:,.0f} bytes/record")
+    print(f"speed-up: {after_rate / before_rate:.1f}x over before, {after_rate / dict_rate:.2f}x over dicts")
+    print(f"memory:   {record_bytes / dict_bytes:.0%} of dicts")
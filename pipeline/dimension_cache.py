@@ -0,0 +1,86 @@
+"This file caches dimension IDs so warm Lambda invocations can skip database lookups"
+
+import os
+import time
+from collections import OrderedDict
+
+DIMENSION_CACHE_TTL = float(os.getenv('DIMENSION_CACHE_TTL', '3600'))
+DIMENSION_CACHE_SIZE = int(os.getenv('DIMENSION_CACHE_SIZE', '10000'))
+TIMEZONES = "timezones"
+COUNTRY_CODES = "country_codes"
+LOCATIONS = "locations"
+PLANT_SPECIES = "plant_species"
+BOTANISTS = "botanists"
+PLANTS = "plants"
+
+
+class DimensionCache:
+    """A least-recently-used map of natural keys to dimension IDs whose entries expire after a TTL"""
+
+    def __init__(self, max_size: int = DIMENSION_CACHE_SIZE, ttl_seconds: float = DIMENSION_CACHE_TTL, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._warmed_at = None
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key):
+        """Returns the ID cached for the key, or None if it is missing or has expired"""
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= self._clock():
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, dimension_id) -> None:
+        """Caches an ID, evicting the least recently used entries once the cache is full"""
+        self._entries[key] = (dimension_id, self._clock() + self.ttl_seconds)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def update(self, id_map: dict) -> dict:
+        """Caches every key and ID in the dict and returns it"""
+        for key, dimension_id in id_map.items():
+            self.put(key, dimension_id)
+        return id_map
+
+    def split(self, keys: list) -> tuple[dict, list]:
+        """Returns the IDs already cached for the keys and the unique keys that still need a lookup"""
+        found = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            dimension_id = self.get(key)
+            if dimension_id is None:
+                missing.append(key)
+            else:
+                found[key] = dimension_id
+        return found, missing
+
+    def needs_warming(self) -> bool:
+        """Whether the cache has never been loaded, or was last loaded longer ago than the TTL"""
+        return self._warmed_at is None or self._clock() - self._warmed_at >= self.ttl_seconds
+
+    def warm(self, id_map: dict) -> None:
+        """Replaces the cached entries with a full dimension table"""
+        self._entries.clear()
+        self.update(id_map)
+        self._warmed_at = self._clock()
+
+    def clear(self) -> None:
+        """Drops every entry so the next run warms from the database again"""
+        self._entries.clear()
+        self._warmed_at = None
+
+
+DIMENSION_CACHES = {dimension: DimensionCache() for dimension in (
+    TIMEZONES, COUNTRY_CODES, LOCATIONS, PLANT_SPECIES, BOTANISTS, PLANTS)}
@@ -1,27 +1,208 @@
 """This file extracts data from a plant API."""
 import asyncio
+import json
+import logging
+import math
+import os
+import random
+import time
+from collections import Counter, defaultdict, deque
 import aiohttp
 
+API_URL = os.getenv('PLANTS_API_URL', "https://data-eng-plants-api.herokuapp.com/plants/{}")
+CONDITIONAL_FETCH = os.getenv('CONDITIONAL_FETCH', 'true').lower() == 'true'
+MAX_CONCURRENCY = int(os.getenv('EXTRACT_CONCURRENCY', '10'))
+REQUEST_TIMEOUT = float(os.getenv('EXTRACT_REQUEST_TIMEOUT', '10'))
+MAX_RETRIES = int(os.getenv('EXTRACT_MAX_RETRIES', '3'))
+RETRY_BASE_DELAY = float(os.getenv('EXTRACT_RETRY_BASE_DELAY', '0.5'))
+RUN_BUDGET = float(os.getenv('EXTRACT_RUN_BUDGET', '45'))
+LATENCY_SAMPLES_PER_PLANT = 500
+ERROR = "error"
+PLANT_ID = "plant_id"
+CONNECTION_ERROR = "Unable to connect to the API."
+BUDGET_ERROR = "Run budget exceeded."
+RECORDING_TAKEN = "recording_taken"
+UNCHANGED = "unchanged"
+REQUESTS = "requests"
+FETCHED = "fetched"
+NOT_MODIFIED = "not_modified"
+BYTES_DOWNLOADED = "bytes_downloaded"
+ALL_PLANT_IDS = range(1, 51)
 
-async def fetch_plant_data(session, plant_id: int) -> dict:
-    "Creates all requests and fetches all of them concurrently"
-    try:
-        async with session.get(f"https://data-eng-plants-api.herokuapp.com/plants/{plant_id}", timeout=20) as response:
-            return await response.json()
-    except TimeoutError:
-        return {"error": "Unable to connect to the API."}
+FETCH_LATENCIES = defaultdict(lambda: deque(maxlen=LATENCY_SAMPLES_PER_PLANT))
+FETCH_STATS = Counter()
 
 
-async def get_all_responses(plant_ids: list[int]) -> list[dict]:
-    "Combines all requests into a list of dicts"
-    async with aiohttp.ClientSession() as session:
-        tasks = [fetch_plant_data(session, plant_id) for plant_id in plant_ids]
-        responses = await asyncio.gather(*tasks)
+class RetryableStatusError(Exception):
+    """Raised when the API answers with a status worth retrying"""
 
-    return responses
+
+class PlantVersions:
+    """The ETag, Last-Modified and recording_taken last seen for each plant, kept across warm invocations
+    so unchanged plants can be recognised without downloading or loading them again"""
+
+    def __init__(self):
+        self._versions = {}
+
+    def request_headers(self, plant_id: int) -> dict:
+        """Returns the conditional request headers for a plant, if the API gave it any validators"""
+        version = self._versions.get(plant_id, {})
+        headers = {}
+        if version.get("etag"):
+            headers["If-None-Match"] = version["etag"]
+        if version.get("last_modified"):
+            headers["If-Modified-Since"] = version["last_modified"]
+        return headers
+
+    def is_unchanged(self, plant_id: int, plant: dict) -> bool:
+        """Whether a response carries the same reading as the last one seen for the plant"""
+        recording_taken = plant.get(RECORDING_TAKEN)
+        return recording_taken is not None and \
+            self._versions.get(plant_id, {}).get(RECORDING_TAKEN) == recording_taken
+
+    def remember(self, plant_id: int, headers, plant: dict) -> None:
+        """Keeps a successful response's validators and reading time for the next request"""
+        self._versions[plant_id] = {"etag": headers.get("ETag"),
+                                    "last_modified": headers.get("Last-Modified"),
+                                    RECORDING_TAKEN: plant.get(RECORDING_TAKEN)}
+
+    def forget(self, plant_ids) -> None:
+        """Forgets plants whose readings were not stored, so the next request downloads them again"""
+        for plant_id in plant_ids:
+            self._versions.pop(plant_id, None)
+
+    def clear(self) -> None:
+        """Forgets every plant"""
+        self._versions = {}
+
+
+PLANT_VERSIONS = PlantVersions()
+
+
+def record_latency(plant_id: int, seconds: float) -> None:
+    """Keeps the most recent fetch latencies for each plant across warm invocations"""
+    FETCH_LATENCIES[plant_id].append(seconds)
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    """Returns the nearest-rank percentile of the samples"""
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def get_latency_percentiles(plant_id: int = None) -> dict:
+    """Returns p50/p95/p99 fetch latency in seconds for one plant, or for every plant combined"""
+    if plant_id is None:
+        samples = [sample for latencies in FETCH_LATENCIES.values()
+                   for sample in latencies]
+    else:
+        samples = list(FETCH_LATENCIES.get(plant_id, []))
+
+    if not samples:
+        return {}
+    return {f"p{pct}": percentile(samples, pct) for pct in (50, 95, 99)}
 
 
-def extract_data() -> list[dict]:
+def get_backoff_delay(attempt: int, base_delay: float) -> float:
+    """Exponential backoff with full jitter"""
+    return random.uniform(0, base_delay * 2 ** attempt)
+
+
+async def fetch_plant_data(session, plant_id: int, semaphore: asyncio.Semaphore = None,
+                           request_timeout: float = REQUEST_TIMEOUT, max_retries: int = MAX_RETRIES,
+                           base_delay: float = RETRY_BASE_DELAY, api_url: str = API_URL,
+                           versions: PlantVersions = PLANT_VERSIONS if CONDITIONAL_FETCH else None) -> dict:
+    """Fetches one plant, retrying timeouts and 5xx responses with jittered exponential backoff.
+    With versions, asks the API to skip unchanged plants and returns an unchanged marker for any that haven't moved on"""
+    semaphore = semaphore or asyncio.Semaphore(MAX_CONCURRENCY)
+    headers = versions.request_headers(plant_id) if versions else {}
+
+    for attempt in range(max_retries + 1):
+        try:
+            async with semaphore:
+                start = time.perf_counter()
+                FETCH_STATS[REQUESTS] += 1
+                async with session.get(api_url.format(plant_id), headers=headers,
+                                       timeout=aiohttp.ClientTimeout(total=request_timeout)) as response:
+                    if response.status >= 500:
+                        raise RetryableStatusError(
+                            f"API returned {response.status}")
+                    body = b"" if response.status == 304 else await response.read()
+            record_latency(plant_id, time.perf_counter() - start)
+            FETCH_STATS[BYTES_DOWNLOADED] += len(body)
+            if response.status == 304:
+                FETCH_STATS[NOT_MODIFIED] += 1
+                return {UNCHANGED: True, PLANT_ID: plant_id}
+
+            plant = json.loads(body)
+            if versions is not None and response.status == 200:
+                unchanged = versions.is_unchanged(plant_id, plant)
+                versions.remember(plant_id, response.headers, plant)
+                if unchanged:
+                    FETCH_STATS[UNCHANGED] += 1
+                    return {UNCHANGED: True, PLANT_ID: plant_id}
+            FETCH_STATS[FETCHED] += 1
+            return plant
+        except (TimeoutError, aiohttp.ClientError, RetryableStatusError, ValueError) as e:
+            logging.warning("Attempt %s for plant %s failed: %s",
+                            attempt + 1, plant_id, e)
+            if attempt < max_retries:
+                await asyncio.sleep(get_backoff_delay(attempt, base_delay))
+
+    return {ERROR: CONNECTION_ERROR, PLANT_ID: plant_id}
+
+
+async def stream_responses(plant_ids: list[int], queue: asyncio.Queue, max_concurrency: int = MAX_CONCURRENCY,
+                           run_budget: float = RUN_BUDGET, registry=None, **fetch_options) -> None:
+    """Puts (plant_id, response) on the queue as each fetch finishes, leaving out unchanged plants, then None once every plant is done or the run budget is spent.
+    Each outcome is recorded in the plant registry, if one is given"""
+    async def fetch_into_queue(session, plant_id: int, semaphore: asyncio.Semaphore) -> None:
+        response = await fetch_plant_data(session, plant_id, semaphore, **fetch_options)
+        if registry is not None:
+            registry.record(plant_id, response)
+        if UNCHANGED not in response:
+            await queue.put((plant_id, response))
+
+    FETCH_STATS.clear()
+    semaphore = asyncio.Semaphore(max_concurrency)
+    connector = aiohttp.TCPConnector(limit=max_concurrency, ttl_dns_cache=300)
+    pending = set()
+
+    async with aiohttp.ClientSession(connector=connector) as session:
+        tasks = {asyncio.create_task(fetch_into_queue(session, plant_id, semaphore)): plant_id
+                 for plant_id in plant_ids}
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=run_budget)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    if pending:
+        logging.warning("Run budget of %ss spent, %s plants left unfetched",
+                        run_budget, len(pending))
+    for task in pending:
+        response = {ERROR: BUDGET_ERROR, PLANT_ID: tasks[task]}
+        if registry is not None:
+            registry.record(tasks[task], response)
+        await queue.put((tasks[task], response))
+    await queue.put(None)
+
+
+async def get_all_responses(plant_ids: list[int], **options) -> list[dict]:
+    "Fetches every plant with bounded concurrency and returns the responses of changed plants in plant_ids order"
+    queue = asyncio.Queue()
+    await stream_responses(plant_ids, queue, **options)
+
+    responses = {}
+    while (item := queue.get_nowait()) is not None:
+        responses[item[0]] = item[1]
+    return [responses[plant_id] for plant_id in plant_ids if plant_id in responses]
+
+
+def extract_data(plant_ids: list[int] = ALL_PLANT_IDS, registry=None, **options) -> list[dict]:
     """ Extracts data for multiple plants asynchronously."""
-    all_plant_ids = range(1, 51)
-    return asyncio.run(get_all_responses(all_plant_ids))
+    responses = asyncio.run(get_all_responses(plant_ids, registry=registry, **options))
+    logging.info("Fetch latency percentiles: %s", get_latency_percentiles())
+    logging.info("Fetch stats: %s", dict(FETCH_STATS))
+    return responses
@@ -4,7 +4,13 @@
 import os
 import pymssql
 from dotenv import load_dotenv
-import boto3
+from connections import CONNECTION_POOL
+from alert_state import ALERT_STATE
+from alerts import ALERT_DISPATCHER
+from rules import RULE_CACHE, evaluate_rules
+from watermarks import READING_WATERMARKS
+from records import PlantReading, Location, Botanist
+from dimension_cache import DimensionCache, DIMENSION_CACHES, TIMEZONES, COUNTRY_CODES, LOCATIONS, PLANT_SPECIES, BOTANISTS, PLANTS
 
 load_dotenv()
 
@@ -15,306 +21,432 @@ DB_USERNAME = os.getenv('DB_USER')
 DB_PASSWORD = os.getenv('DB_PASSWORD')
 DB_NAME = os.getenv('DB_NAME')
 DB_SCHEMA = os.getenv('DB_SCHEMA')
-INDEX_OF_LAT = 0
-INDEX_OF_LON = 1
-INDEX_OF_NAME = 2
-INDEX_OF_CC = 3
-INDEX_OF_TIMEZONE = 4
-ORIGIN_LOCATION = "origin_location"
-NAME = "name"
-SCIENTIFIC_NAME = "scientific_name"
-PHONE = "phone"
-ERROR = "error"
-PLANT_ID = "plant_id"
-EMAIL = "email"
-BOTANIST = "botanist"
-LAST_WATERED = "last_watered"
-TEMPERATURE = "temperature"
-SOIL_MOISTURE = "soil_moisture"
-RECORDING_TAKEN = "reading_at"
-MIN_SOIL_MOISTURE = 21
-MAX_SOIL_MOISTURE = 41
-MIN_TEMP = 7
-MAX_TEMP = 38
-TOPIC_ARN = "arn:aws:sns:eu-west-2:129033205317:vodnik-you-got-mail"
-
-
-def create_connection(host: str, username: str, password: str, database_name: str) -> pymssql.Connection:
-    """Creates a pymssql connection to the appropriate database"""
-    return pymssql.connect(server=host,
-                           user=username,
-                           password=password,
-                           database=database_name)
-
-
-def check_if_botanist_in_db(email: str, schema: str, cursor: pymssql.Cursor) -> tuple:
-    """Checks if there is a botanist that has the provided email"""
-    cursor.execute(
-        f"""SELECT botanists_id FROM {schema}.botanists WHERE email=%s""", (email,))
+ROUND_TRIPS = "round_trips"
+COMMITS = "commits"
+DUPLICATES = "duplicates_suppressed"
+MAX_PARAMS_PER_STATEMENT = 2000
+MAX_ROWS_PER_VALUES = 1000
+LATEST_READINGS_SMOOTHING = float(os.getenv('LATEST_READINGS_SMOOTHING', '0.1'))
+
+
+class CountingCursor:
+    """Wraps a pymssql cursor and counts every statement it sends to the server"""
+
+    def __init__(self, cursor: pymssql.Cursor, stats: dict):
+        self._cursor = cursor
+        self._stats = stats
 
-    result = cursor.fetchone()
+    def execute(self, *args, **kwargs):
+        """Executes a single statement, counting it as one round trip"""
+        self._stats[ROUND_TRIPS] += 1
+        return self._cursor.execute(*args, **kwargs)
 
-    return result
+    def executemany(self, query: str, params: list) -> None:
+        """pymssql runs executemany as one statement per parameter set"""
+        params = list(params)
+        self._stats[ROUND_TRIPS] += len(params)
+        return self._cursor.executemany(query, params)
 
+    def __getattr__(self, name: str):
+        return getattr(self._cursor, name)
 
-def add_botanist_to_db(botanist_data: dict, schema: str, conn: pymssql.Connection, cursor: pymssql.Cursor) -> None:
-    """Adds the botanist to the 'botanists' table"""
-    first_name, last_name = tuple(botanist_data[NAME].split())
-    phone_number = botanist_data[PHONE]
-    email = botanist_data[EMAIL]
 
-    try:
-        cursor.execute(f"""INSERT INTO {
-            schema}.botanists (first_name, last_name, email, phone_number) VALUES (%s, %s, %s, %s)""",
-            (first_name, last_name, email, phone_number,))
+class CountingConnection:
+    """Wraps a pymssql connection and counts the round trips and commits made through it"""
 
-        conn.commit()
-    except Exception as e:
-        print(f"Error: {e}")
-        conn.rollback()
+    def __init__(self, conn: pymssql.Connection):
+        self._conn = conn
+        self.stats = {ROUND_TRIPS: 0, COMMITS: 0}
 
+    def cursor(self) -> CountingCursor:
+        """Returns a cursor that reports into this connection's stats"""
+        return CountingCursor(self._conn.cursor(), self.stats)
 
-def check_if_timezone_in_db(timezone: str, schema: str, cursor: pymssql.Cursor) -> tuple:
-    """Checks if the passed timezone value is in the 'timezones' table"""
-    cursor.execute(
-        f"""SELECT timezone_id FROM {schema}.timezones WHERE timezone=%s""", (timezone,))
+    def commit(self) -> None:
+        """Commits the open transaction"""
+        self.stats[ROUND_TRIPS] += 1
+        self.stats[COMMITS] += 1
+        self._conn.commit()
 
-    result = cursor.fetchone()
+    def rollback(self) -> None:
+        """Rolls back the open transaction"""
+        self.stats[ROUND_TRIPS] += 1
+        self._conn.rollback()
 
-    return result
+    def __getattr__(self, name: str):
+        return getattr(self._conn, name)
 
 
-def add_timezone_to_db(timezone_name: dict, schema: str, conn: pymssql.Connection, cursor: pymssql.Cursor) -> None:
-    """Adds the new timezone to the 'timezones' table"""
-    try:
-        cursor.execute(
-            f"""INSERT INTO {schema}.timezones (timezone) VALUES (%s)""", (timezone_name,))
-        conn.commit()
-    except Exception as e:
-        print(f"Error: {e}")
-        conn.rollback()
-
+def build_insert_new_readings_query(schema: str, row_count: int) -> str:
+    """Builds an insert of (plant_id, reading_at, moisture, temp, botanist_id, watered_at) rows that skips any already stored"""
+    return f"""INSERT INTO {schema}.readings (plant_id, reading_at, moisture, temp, botanist_id, watered_at)
+        SELECT source.plant_id, source.reading_at, source.moisture, source.temp, source.botanist_id, source.watered_at
+        FROM (VALUES {build_values_clause(row_count, 6)})
+            AS source (plant_id, reading_at, moisture, temp, botanist_id, watered_at)
+        WHERE NOT EXISTS (SELECT 1 FROM {schema}.readings AS existing WITH (UPDLOCK, HOLDLOCK)
+                          WHERE existing.plant_id = source.plant_id AND existing.reading_at = source.reading_at)"""
 
-def check_if_country_code_in_db(cc: str, schema: str, cursor: pymssql.Cursor) -> tuple:
-    """Checks if the passed country code is in the 'country_codes' table"""
-    cursor.execute(
-        f"""SELECT country_code_id FROM {schema}.country_codes WHERE country_code=%s""", (cc,))
-
-    result = cursor.fetchone()
-
-    return result
-
-
-def add_country_code_to_db(cc: str, schema: str, conn: pymssql.Connection, cursor: pymssql.Cursor) -> None:
-    """Adds the new country code to the 'country_codes' table"""
-    try:
-        cursor.execute(
-            f"""INSERT INTO {schema}.country_codes (country_code) VALUES (%s)""", (cc,))
-        conn.commit()
-    except Exception as e:
-        print(f"Error: {e}")
-        conn.rollback()
 
+def chunk_rows(rows: list[tuple], params_per_row: int) -> list[list[tuple]]:
+    """Splits rows into chunks that stay under SQL Server's per-statement parameter and VALUES limits"""
+    rows_per_chunk = max(
+        1, min(MAX_ROWS_PER_VALUES, MAX_PARAMS_PER_STATEMENT // params_per_row))
+    return [rows[i:i + rows_per_chunk] for i in range(0, len(rows), rows_per_chunk)]
 
-def check_if_location_in_db(city: str, lat: float, lon: float, schema: str, cursor: pymssql.Cursor) -> tuple:
-    """Checks if the passed data is present in the 'locations' table"""
-    cursor.execute(
-        f"""SELECT location_id FROM {schema}.locations
-            WHERE location_name=%s AND location_lat=%s AND location_lon=%s""", (city, lat, lon,))
 
-    result = cursor.fetchone()
+def build_values_clause(row_count: int, params_per_row: int) -> str:
+    """Builds the placeholder list for a multi-row VALUES clause"""
+    row_placeholders = f"({', '.join(['%s'] * params_per_row)})"
+    return ", ".join([row_placeholders] * row_count)
 
-    return result
 
+def build_dimension_merge_query(schema: str, table: str, id_column: str, column_types: dict, key_columns: tuple, row_count: int) -> str:
+    """Builds a single batch that stages rows in a table variable, merges the missing ones into the table and returns the IDs of every staged row.
+    NOCOUNT is turned back off at the end, as it would otherwise stay on for the pooled session and hide later rowcounts"""
+    column_definitions = ", ".join(
+        f"{column} {sql_type}" for column, sql_type in column_types.items())
+    columns = ", ".join(column_types)
+    source_columns = ", ".join(f"source.{column}" for column in column_types)
+    key_match = " AND ".join(
+        f"(target.{column} = source.{column} OR (target.{column} IS NULL AND source.{column} IS NULL))" for column in key_columns)
+    selected_keys = ", ".join(f"target.{column}" for column in key_columns)
 
-def add_location_to_db(location_data: tuple, schema: str, conn: pymssql.Connection, cursor: pymssql.Cursor) -> None:
-    """Adds the new location to the 'locations' table"""
-    city = location_data[INDEX_OF_NAME]
-    lat = location_data[INDEX_OF_LAT]
-    lon = location_data[INDEX_OF_LON]
-    cc_id = check_if_country_code_in_db(
-        location_data[INDEX_OF_CC], schema, cursor)[0]
-    timezone_id = check_if_timezone_in_db(
-        location_data[INDEX_OF_TIMEZONE], schema, cursor)[0]
+    return f"""SET NOCOUNT ON;
+        DECLARE @source TABLE ({column_definitions});
+        INSERT INTO @source ({columns}) VALUES {build_values_clause(row_count, len(column_types))};
+        MERGE {schema}.{table} WITH (HOLDLOCK) AS target
+        USING @source AS source
+        ON {key_match}
+        WHEN NOT MATCHED THEN INSERT ({columns}) VALUES ({source_columns});
+        SELECT target.{id_column}, {selected_keys} FROM {schema}.{table} AS target
+        JOIN @source AS source ON {key_match};
+        SET NOCOUNT OFF;"""
 
-    try:
-        cursor.execute(
-            f"""INSERT INTO {schema}.locations
-                (location_name, location_lat, location_lon,
-                 timezone_id, country_code_id)
-                VALUES (%s, %s, %s, %s, %s)""", (city, lat, lon, timezone_id, cc_id,))
-        conn.commit()
-    except Exception as e:
-        print(f"Error: {e}")
-        conn.rollback()
 
+def merge_dimension_rows(rows: list[tuple], schema: str, table: str, id_column: str, column_types: dict, key_columns: tuple, cursor: pymssql.Cursor) -> list[tuple]:
+    """Inserts any missing rows into a dimension table and returns (id, *key_columns) for every row passed in"""
+    unique_rows = list(dict.fromkeys(rows))
+    id_rows = []
 
-def check_if_species_in_db(common_name: str, scientific_name: str, schema: str, cursor: pymssql.Cursor) -> tuple:
-    """Checks if there exists a species with the given name in the 'plant_species' table"""
-    if scientific_name is None:
-        cursor.execute(
-            f"""SELECT species_id FROM {schema}.plant_species WHERE common_name=%s AND scientific_name IS NULL""", (common_name,))
-    else:
-        cursor.execute(
-            f"""SELECT species_id FROM {schema}.plant_species WHERE common_name=%s AND scientific_name=%s""", (common_name, scientific_name,))
+    for chunk in chunk_rows(unique_rows, len(column_types)):
+        cursor.execute(build_dimension_merge_query(schema, table, id_column, column_types, key_columns, len(chunk)),
+                       tuple(value for row in chunk for value in row))
+        id_rows.extend(cursor.fetchall())
 
-    result = cursor.fetchone()
+    return id_rows
 
-    return result
 
+def location_key(name: str, lat: float, lon: float) -> tuple:
+    """Returns the (name, lat, lon) key of a location, rounded to the precision the database stores"""
+    return (name, round(float(lat), 7), round(float(lon), 7))
 
-def add_species_to_db(common_name: str, scientific_name: str, schema: str, conn: pymssql.Connection, cursor: pymssql.Cursor) -> None:
-    """Adds the provided species to the 'plant_species' table"""
-    try:
-        cursor.execute(
-            f"""INSERT INTO {
-                schema}.plant_species (common_name, scientific_name) VALUES (%s, %s)""",
-            (common_name, scientific_name))
-        conn.commit()
-    except Exception as e:
-        print(f"Error: {e}")
-        conn.rollback()
 
+def get_timezone_id_map(schema: str, cursor: pymssql.Cursor) -> dict:
+    """Creates a dict of each timezone and its associated ID"""
+    cursor.execute(f"SELECT timezone_id, timezone FROM {schema}.timezones")
+    return {row[1]: row[0] for row in cursor.fetchall()}
 
-def check_if_plant_in_db(plant_id: int, schema: str, cursor: pymssql.Cursor) -> tuple:
-    """Checks if there is a plant with the passed plant_id"""
-    cursor.execute(f"""SELECT plant_id FROM {
-                   schema}.plants WHERE plant_id = %s""", (plant_id,))
 
-    result = cursor.fetchone()
+def get_country_code_id_map(schema: str, cursor: pymssql.Cursor) -> dict:
+    """Creates a dict of each country code and its associated ID"""
+    cursor.execute(
+        f"SELECT country_code_id, country_code FROM {schema}.country_codes")
+    return {row[1]: row[0] for row in cursor.fetchall()}
 
-    return result
 
+def get_locations_id_map(schema: str, cursor: pymssql.Cursor) -> dict:
+    """Creates a dict of each (name, lat, lon) location and its associated ID"""
+    cursor.execute(
+        f"SELECT location_id, location_name, location_lat, location_lon FROM {schema}.locations")
+    return {location_key(row[1], row[2], row[3]): row[0] for row in cursor.fetchall()}
 
-def add_plant_to_db(plant_id: int, common_name: str, scientific_name: str, location_data: list, schema: str, conn: pymssql.Connection, cursor: pymssql.Cursor) -> None:
-    """Adds the plant to the 'plants' table"""
-    plant_species_id = check_if_species_in_db(
-        common_name, scientific_name, schema, cursor)[0]
-    location_id = check_if_location_in_db(
-        location_data[INDEX_OF_NAME], location_data[INDEX_OF_LAT], location_data[INDEX_OF_LON], schema, cursor)[0]
 
+def get_plant_names_id_map(schema: str, cursor: pymssql.Cursor) -> dict:
+    """Creates a dict of each (common_name, scientific_name) and its associated ID"""
+    cursor.execute(
+        f"SELECT species_id, common_name, scientific_name FROM {schema}.plant_species")
+    return {(row[1], row[2]): row[0] for row in cursor.fetchall()}
+
+
+def get_botanist_id_map(schema: str, cursor: pymssql.Cursor) -> dict:
+    """Creates a dict of each botanist email and its associated ID"""
+    cursor.execute(f"SELECT botanists_id, email FROM {schema}.botanists")
+    return {row[1]: row[0] for row in cursor.fetchall()}
+
+
+def get_plant_id_map(schema: str, cursor: pymssql.Cursor) -> dict:
+    """Creates a dict of each plant ID that already exists"""
+    cursor.execute(f"SELECT plant_id FROM {schema}.plants")
+    return {row[0]: row[0] for row in cursor.fetchall()}
+
+
+def warm_dimension_caches(caches: dict, schema: str, cursor: pymssql.Cursor) -> None:
+    """Loads every dimension table whose cache is cold or older than its TTL"""
+    id_map_queries = {TIMEZONES: get_timezone_id_map, COUNTRY_CODES: get_country_code_id_map,
+                      LOCATIONS: get_locations_id_map, PLANT_SPECIES: get_plant_names_id_map,
+                      BOTANISTS: get_botanist_id_map, PLANTS: get_plant_id_map}
+
+    for dimension, get_id_map in id_map_queries.items():
+        if caches[dimension].needs_warming():
+            caches[dimension].warm(get_id_map(schema, cursor))
+
+
+def bulk_timezone_checks(timezones: list[str], schema: str, cursor: pymssql.Cursor, cache: DimensionCache) -> dict:
+    """Makes sure every timezone exists and returns a dict of each timezone and its ID"""
+    timezone_ids, missing = cache.split(timezones)
+    if missing:
+        rows = merge_dimension_rows([(timezone,) for timezone in missing], schema, "timezones", "timezone_id",
+                                    {"timezone": "VARCHAR(25)"}, ("timezone",), cursor)
+        timezone_ids.update(cache.update({row[1]: row[0] for row in rows}))
+    return timezone_ids
+
+
+def bulk_country_code_checks(country_codes: list[str], schema: str, cursor: pymssql.Cursor, cache: DimensionCache) -> dict:
+    """Makes sure every country code exists and returns a dict of each country code and its ID"""
+    country_code_ids, missing = cache.split(country_codes)
+    if missing:
+        rows = merge_dimension_rows([(cc,) for cc in missing], schema, "country_codes", "country_code_id",
+                                    {"country_code": "VARCHAR(2)"}, ("country_code",), cursor)
+        country_code_ids.update(cache.update(
+            {row[1]: row[0] for row in rows}))
+    return country_code_ids
+
+
+def bulk_location_checks(locations: list[Location], timezone_ids: dict, country_code_ids: dict, schema: str, cursor: pymssql.Cursor, cache: DimensionCache) -> dict:
+    """Makes sure every location exists and returns a dict of each (name, lat, lon) and its ID"""
+    locations_by_key = {location_key(location.name, location.lat, location.lon): location
+                        for location in locations}
+    location_ids, missing = cache.split(list(locations_by_key))
+    if missing:
+        location_rows = [(key[0], key[1], key[2],
+                          timezone_ids[locations_by_key[key].timezone],
+                          country_code_ids[locations_by_key[key].country_code])
+                         for key in missing]
+        rows = merge_dimension_rows(location_rows, schema, "locations", "location_id",
+                                    {"location_name": "VARCHAR(50)", "location_lat": "DECIMAL(10, 7)", "location_lon": "DECIMAL(10, 7)",
+                                     "timezone_id": "SMALLINT", "country_code_id": "SMALLINT"},
+                                    ("location_name", "location_lat", "location_lon"), cursor)
+        location_ids.update(cache.update(
+            {location_key(row[1], row[2], row[3]): row[0] for row in rows}))
+    return location_ids
+
+
+def bulk_plant_species_checks(species: list[tuple], schema: str, cursor: pymssql.Cursor, cache: DimensionCache) -> dict:
+    """Makes sure every (common_name, scientific_name) exists and returns a dict of each pair and its ID"""
+    species_ids, missing = cache.split(species)
+    if missing:
+        rows = merge_dimension_rows(missing, schema, "plant_species", "species_id",
+                                    {"common_name": "VARCHAR(100)",
+                                     "scientific_name": "VARCHAR(100)"},
+                                    ("common_name", "scientific_name"), cursor)
+        species_ids.update(cache.update(
+            {(row[1], row[2]): row[0] for row in rows}))
+    return species_ids
+
+
+def bulk_botanist_checks(botanists: list[Botanist], schema: str, cursor: pymssql.Cursor, cache: DimensionCache) -> dict:
+    """Makes sure every botanist exists and returns a dict of each email and its ID"""
+    botanists_by_email = {botanist.email: botanist for botanist in botanists}
+    botanist_ids, missing = cache.split(list(botanists_by_email))
+    if missing:
+        botanist_rows = []
+        for email in missing:
+            first_name, last_name = tuple(
+                botanists_by_email[email].name.split(maxsplit=1))
+            botanist_rows.append(
+                (first_name, last_name, email, botanists_by_email[email].phone))
+
+        rows = merge_dimension_rows(botanist_rows, schema, "botanists", "botanists_id",
+                                    {"first_name": "VARCHAR(25)", "last_name": "VARCHAR(25)",
+                                     "email": "VARCHAR(75)", "phone_number": "VARCHAR(30)"},
+                                    ("email",), cursor)
+        botanist_ids.update(cache.update({row[1]: row[0] for row in rows}))
+    return botanist_ids
+
+
+def bulk_plant_checks(plants: list[tuple], schema: str, cursor: pymssql.Cursor, cache: DimensionCache) -> None:
+    """Makes sure every (plant_id, species_id, location_id) plant exists"""
+    plants_by_id = {plant[0]: plant for plant in plants}
+    _, missing = cache.split(list(plants_by_id))
+    if missing:
+        rows = merge_dimension_rows([plants_by_id[plant_id] for plant_id in missing], schema, "plants", "plant_id",
+                                    {"plant_id": "SMALLINT", "species_id": "SMALLINT",
+                                     "location_id": "SMALLINT"},
+                                    ("plant_id",), cursor)
+        cache.update({row[0]: row[0] for row in rows})
+
+
+def get_previous_readings(plant_ids: list[int], schema: str, cursor: pymssql.Cursor) -> dict:
+    """Returns a dict of each plant ID and its most recent (temp, moisture) reading"""
+    previous_readings = {}
+
+    for chunk in chunk_rows(list(dict.fromkeys(plant_ids)), 1):
+        placeholders = ", ".join(["%s"] * len(chunk))
+        cursor.execute(f"""SELECT plant_id, temp, moisture FROM (
+                SELECT plant_id, temp, moisture,
+                       ROW_NUMBER() OVER (PARTITION BY plant_id ORDER BY reading_at DESC) AS row_num
+                FROM {schema}.readings WHERE plant_id IN ({placeholders})) AS ranked
+            WHERE row_num = 1""", tuple(chunk))
+        previous_readings.update(
+            {row[0]: (row[1], row[2]) for row in cursor.fetchall()})
+
+    return previous_readings
+
+
+def get_reading_watermarks(plant_ids: list[int], schema: str, cursor: pymssql.Cursor) -> dict:
+    """Returns a dict of each plant ID and the reading_at of its newest stored reading"""
+    watermarks = {}
+
+    for chunk in chunk_rows(list(dict.fromkeys(plant_ids)), 1):
+        placeholders = ", ".join(["%s"] * len(chunk))
+        cursor.execute(f"""SELECT plant_id, MAX(reading_at) FROM {schema}.readings
+            WHERE plant_id IN ({placeholders}) GROUP BY plant_id""", tuple(chunk))
+        watermarks.update({row[0]: row[1] for row in cursor.fetchall()})
+
+    return watermarks
+
+
+def bulk_add_readings_to_db(readings: list[tuple], schema: str, cursor: pymssql.Cursor) -> int:
+    """Adds all (plant_id, reading_at, moisture, temp, botanist_id, watered_at) readings not already stored
+    with multi-row inserts, returning how many were added"""
+    inserted = 0
+    for chunk in chunk_rows(readings, 6):
+        cursor.execute(build_insert_new_readings_query(schema, len(chunk)),
+                       tuple(value for row in chunk for value in row))
+        inserted += max(cursor.rowcount, 0)
+    return inserted
+
+
+def build_latest_readings_merge_query(schema: str, row_count: int, smoothing: float = LATEST_READINGS_SMOOTHING) -> str:
+    """Builds a MERGE that moves each plant's latest_readings row forward and updates its smoothed averages"""
+    return f"""MERGE {schema}.latest_readings WITH (HOLDLOCK) AS target
+        USING (VALUES {build_values_clause(row_count, 6)})
+            AS source (plant_id, reading_at, moisture, temp, botanist_id, watered_at)
+        ON target.plant_id = source.plant_id
+        WHEN MATCHED AND source.reading_at > target.reading_at THEN UPDATE SET
+            reading_at = source.reading_at, moisture = source.moisture, temp = source.temp,
+            botanist_id = source.botanist_id, watered_at = source.watered_at,
+            moisture_avg = target.moisture_avg + {float(smoothing)} * (source.moisture - target.moisture_avg),
+            temp_avg = target.temp_avg + {float(smoothing)} * (source.temp - target.temp_avg),
+            reading_count = target.reading_count + 1
+        WHEN NOT MATCHED THEN INSERT (plant_id, reading_at, moisture, temp, botanist_id, watered_at,
+                                      moisture_avg, temp_avg, reading_count)
+            VALUES (source.plant_id, source.reading_at, source.moisture, source.temp, source.botanist_id,
+                    source.watered_at, source.moisture, source.temp, 1);"""
+
+
+def bulk_upsert_latest_readings(readings: list[tuple], schema: str, cursor: pymssql.Cursor) -> None:
+    """Keeps one (plant_id, reading_at, moisture, temp, botanist_id, watered_at) row per plant in latest_readings"""
+    latest = {}
+    for reading in sorted(readings, key=lambda reading: reading[1]):
+        latest[reading[0]] = reading
+
+    for chunk in chunk_rows(list(latest.values()), 6):
+        cursor.execute(build_latest_readings_merge_query(schema, len(chunk)),
+                       tuple(value for row in chunk for value in row))
+
+
+def load_batch(plants: list[PlantReading], con: CountingConnection, cur: CountingCursor, s3_client,
+               on_rollback=None) -> None:
+    """Adds readings to the database with a handful of set-based statements in one transaction, moving alerts,
+    watermarks and alert state on only once it commits, and passing the plant IDs to on_rollback if it doesn't"""
+    plant_ids = [plant.plant_id for plant in plants]
     try:
-        cursor.execute(
-            f"""INSERT INTO {schema}.plants (plant_id, species_id, location_id) VALUES (%s, %s, %s)""", (plant_id, plant_species_id, location_id))
-        conn.commit()
+        warm_dimension_caches(DIMENSION_CACHES, DB_SCHEMA, cur)
+        locations = [plant.location for plant in plants]
+        timezone_ids = bulk_timezone_checks([location.timezone for location in locations],
+                                            DB_SCHEMA, cur, DIMENSION_CACHES[TIMEZONES])
+        country_code_ids = bulk_country_code_checks([location.country_code for location in locations],
+                                                    DB_SCHEMA, cur, DIMENSION_CACHES[COUNTRY_CODES])
+        location_ids = bulk_location_checks(locations, timezone_ids, country_code_ids,
+                                            DB_SCHEMA, cur, DIMENSION_CACHES[LOCATIONS])
+        species_ids = bulk_plant_species_checks([(plant.name, plant.scientific_name) for plant in plants],
+                                                DB_SCHEMA, cur, DIMENSION_CACHES[PLANT_SPECIES])
+        botanist_ids = bulk_botanist_checks([plant.botanist for plant in plants],
+                                            DB_SCHEMA, cur, DIMENSION_CACHES[BOTANISTS])
+        bulk_plant_checks([(plant.plant_id, species_ids[(plant.name, plant.scientific_name)],
+                            location_ids[location_key(plant.location.name, plant.location.lat, plant.location.lon)])
+                           for plant in plants], DB_SCHEMA, cur, DIMENSION_CACHES[PLANTS])
+
+        unmarked_plant_ids = READING_WATERMARKS.missing(plant_ids)
+        if unmarked_plant_ids:
+            READING_WATERMARKS.seed(unmarked_plant_ids, get_reading_watermarks(
+                unmarked_plant_ids, DB_SCHEMA, cur))
+        # Repeats of a stored reading are dropped before the rules see them, or they'd be compared with themselves
+        plants, duplicates = READING_WATERMARKS.split(
+            plants, key=lambda plant: (plant.plant_id, plant.reading_at))
+
+        ALERT_STATE.load(s3_client)
+        unseen_plant_ids = ALERT_STATE.missing(
+            [plant.plant_id for plant in plants])
+        if unseen_plant_ids:
+            ALERT_STATE.seed(unseen_plant_ids, get_previous_readings(
+                unseen_plant_ids, DB_SCHEMA, cur))
+        triggered, cleared = evaluate_rules(plants, [ALERT_STATE.history(plant.plant_id) for plant in plants],
+                                            RULE_CACHE.get(DB_SCHEMA, cur))
+
+        readings = [(plant.plant_id, plant.reading_at, plant.soil_moisture, plant.temperature,
+                     botanist_ids[plant.botanist.email], plant.last_watered) for plant in plants]
+        inserted = bulk_add_readings_to_db(readings, DB_SCHEMA, cur)
+        bulk_upsert_latest_readings(readings, DB_SCHEMA, cur)
+        con.commit()
+        con.stats[DUPLICATES] += duplicates + len(readings) - inserted
+
+        # Alerts and cooldowns only change once the batch is committed, so a rolled back batch leaves them alone
+        for plant_id, alert in cleared:
+            ALERT_DISPATCHER.resolve(plant_id, alert)
+        for plant_id, alert, message in triggered:
+            ALERT_DISPATCHER.collect(plant_id, alert, message)
+
+        for plant in plants:
+            READING_WATERMARKS.advance(plant.plant_id, plant.reading_at)
+            ALERT_STATE.record(plant.plant_id, plant.reading_at,
+                               plant.temperature, plant.soil_moisture)
     except Exception as e:
         print(f"Error: {e}")
-        conn.rollback()
-
-
-def botanist_checks(botanist_data: dict, schema: str, conn: pymssql.Connection, cursor: pymssql.Cursor) -> tuple:
-    """The logic for checking if a given botanist exists, and if it doesn't then adding it"""
-    botanist_email = botanist_data[EMAIL]
-    botanist_id = check_if_botanist_in_db(botanist_email, schema, cursor)
-
-    if botanist_id:
-        return botanist_id[0]
+        con.rollback()
+        # IDs merged inside the rolled back transaction were never committed
+        for cache in DIMENSION_CACHES.values():
+            cache.clear()
+        if on_rollback:
+            on_rollback(plant_ids)
 
-    add_botanist_to_db(botanist_data, schema, conn, cursor)
-    return check_if_botanist_in_db(botanist_email, schema, cursor)[0]
 
+def get_alert_state_client():
+    """Returns the s3 client the alert state snapshot is saved through, if it is saved to s3 at all"""
+    return CONNECTION_POOL.get_client(
+        's3', aws_access_key_id=ACCESS_KEY, aws_secret_access_key=SECRET_ACCESS_KEY) if ALERT_STATE.bucket else None
 
-def timezone_checks(timezone_name: str, schema: str, conn: pymssql.Connection, cursor: pymssql.Cursor) -> None:
-    """The logic for checking if a given timezone exists in the database, and if it doesn't then adding it"""
-    if not check_if_timezone_in_db(timezone_name, schema, cursor):
-        add_timezone_to_db(timezone_name, schema, conn, cursor)
 
+def apply_load_process(all_plant_data: list[PlantReading], on_rollback=None) -> dict:
+    """Adds all information into the database one plant at a time, each in its own transaction, so a reading
+    that fails is rolled back on its own"""
+    s3_client = get_alert_state_client()
+    with CONNECTION_POOL.connection(DB_HOST, DB_USERNAME, DB_PASSWORD, DB_NAME) as pooled_con:
+        con = CountingConnection(pooled_con)
+        con.stats[DUPLICATES] = 0
+        cur = con.cursor()
 
-def country_code_checks(cc: str, schema: str, conn: pymssql.Connection, cursor: pymssql.Cursor) -> None:
-    """The logic for checking if a given country code exists in the database, and if it doesn't then adding it"""
-    if not check_if_country_code_in_db(cc, schema, cursor):
-        add_country_code_to_db(cc, schema, conn, cursor)
+        for plant in all_plant_data:
+            load_batch([plant], con, cur, s3_client, on_rollback)
+        ALERT_STATE.save(s3_client)
 
+        cur.close()
 
-def location_checks(location_data: list, schema: str, conn: pymssql.Connection, cursor: pymssql.Cursor) -> None:
-    """The logic for checking if a given location exists in the database, and if it doesn't then adding it"""
-    if not check_if_location_in_db(
-            location_data[INDEX_OF_NAME], location_data[INDEX_OF_LAT], location_data[INDEX_OF_LON], schema, cursor):
-        add_location_to_db(location_data, schema, conn, cursor)
+    return con.stats
 
 
-def plant_species_checks(common_name: str, scientific_name: str, schema: str, conn: pymssql.Connection, cursor: pymssql.Cursor) -> None:
-    """The logic for checking if a given species exists in the database, and if it doesn't then adding it"""
-    if not check_if_species_in_db(common_name, scientific_name, schema, cursor):
-        add_species_to_db(common_name, scientific_name, schema, conn, cursor)
+def apply_bulk_load_process(all_plant_data: list[PlantReading], on_rollback=None) -> dict:
+    """Adds the whole batch to the database with a handful of set-based statements and a single commit"""
+    s3_client = get_alert_state_client()
+    with CONNECTION_POOL.connection(DB_HOST, DB_USERNAME, DB_PASSWORD, DB_NAME) as pooled_con:
+        con = CountingConnection(pooled_con)
+        con.stats[DUPLICATES] = 0
+        cur = con.cursor()
 
+        load_batch(list(all_plant_data), con, cur, s3_client, on_rollback)
+        ALERT_STATE.save(s3_client)
 
-def plant_checks(plant_id: int, common_name: str, scientific_name: str, location_data: list, schema: str, conn: pymssql.Connection, cursor: pymssql.Cursor) -> None:
-    """The logic for checking if a given plant and location combination exists in the database, and if it doesn't then adding it"""
-    if not check_if_plant_in_db(plant_id, schema, cursor):
-        add_plant_to_db(plant_id, common_name,
-                        scientific_name, location_data, schema, conn, cursor)
+        cur.close()
 
-
-def add_reading_to_db(plant_id: int, reading_at: str, moisture: float, temp: float, botanist_id: int, watered_at: str, schema: str, conn: pymssql.Connection, cursor: pymssql.Cursor) -> None:
-    """Adds the plant reading to the readings table"""
-    try:
-        cursor.execute(
-            f"""INSERT INTO {schema}.readings (plant_id, reading_at, moisture, temp, botanist_id, watered_at)
-                VALUES (%s, %s, %s, %s, %s, %s)""", (plant_id, reading_at, moisture, temp, botanist_id, watered_at))
-        conn.commit()
-    except Exception as e:
-        print(f"Error: {e}")
-        conn.rollback()
-
-
-def send_notification(boto_client: 'boto3.client.SNS', subject: str, body: str) -> None:
-    """Sends a notification using AWS SNS"""
-    boto_client.publish(
-        TopicArn=TOPIC_ARN,
-        Message=body,
-        Subject=subject
-    )
-
-
-def check_for_abnormal_levels(email_client: 'boto3.client.SNS', cursor: pymssql.Cursor, plant_data: dict) -> None:
-    """Checks if the plant temperature and soil moisture is abnormal, and sends an email if necessary"""
-    cursor.execute(f"""SELECT TOP 1 temp, moisture FROM readings WHERE plant_id = {
-                   plant_data[PLANT_ID]} ORDER BY reading_at DESC;""")
-
-    most_recent_reading = cursor.fetchone()
-    current_soil_moisture = plant_data[SOIL_MOISTURE]
-    current_temp = plant_data[TEMPERATURE]
-    if most_recent_reading:
-        previous_soil_moisture = float(most_recent_reading[1])
-        previous_temp = float(most_recent_reading[0])
-
-        if not MIN_SOIL_MOISTURE < current_soil_moisture < MAX_SOIL_MOISTURE and not MIN_SOIL_MOISTURE < previous_soil_moisture < MAX_SOIL_MOISTURE:
-            send_notification(email_client, "Issue with moisture",
-                              "Good day to you, there seems to be an issue with moisture levels, please check it")
-
-        if not MIN_TEMP < current_temp < MAX_TEMP and not MIN_TEMP < previous_temp < MAX_TEMP:
-            send_notification(email_client, "Issue with temperature",
-                              "Good day to you, there seems to be an issue with temperature levels, please check it")
-
-
-def apply_load_process(all_plant_data: dict) -> None:
-    """Adds all information into their relevant table in the database"""
-    con = create_connection(DB_HOST, DB_USERNAME,
-                            DB_PASSWORD, DB_NAME)
-    cur = con.cursor()
-
-    sns_client = boto3.client(
-        'sns', aws_access_key_id=ACCESS_KEY, aws_secret_access_key=SECRET_ACCESS_KEY)
-
-    for plant in all_plant_data:
-        if ERROR not in plant:
-            current_botanist_id = botanist_checks(
-                plant[BOTANIST], DB_SCHEMA, con, cur)
-            timezone_checks(plant[ORIGIN_LOCATION]
-                            [INDEX_OF_TIMEZONE], DB_SCHEMA, con, cur)
-            country_code_checks(
-                plant[ORIGIN_LOCATION][INDEX_OF_CC], DB_SCHEMA, con, cur)
-            location_checks(plant[ORIGIN_LOCATION], DB_SCHEMA, con, cur)
-            plant_species_checks(
-                plant[NAME], plant[SCIENTIFIC_NAME], DB_SCHEMA, con, cur)
-            plant_checks(plant[PLANT_ID], plant[NAME],
-                         plant[SCIENTIFIC_NAME], plant[ORIGIN_LOCATION], DB_SCHEMA, con, cur)
-
-            check_for_abnormal_levels(sns_client, cur, plant)
-
-            add_reading_to_db(plant[PLANT_ID], plant[RECORDING_TAKEN], plant[SOIL_MOISTURE],
-                              plant[TEMPERATURE], current_botanist_id, plant[LAST_WATERED], DB_SCHEMA, con, cur)
-
-    cur.close()
-    con.close()
+    return con.stats
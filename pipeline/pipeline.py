@@ -1,14 +1,125 @@
 "This script runs the entire short-term database pipeline"
 
-from extract import extract_data
-from transform import apply_transformations
-from load import apply_load_process
+import os
+import asyncio
+from functools import partial
+from extract import extract_data, stream_responses, FETCH_STATS, PLANT_VERSIONS
+from transform import apply_transformations, INVALID_RECORDS
+from load import apply_load_process, apply_bulk_load_process, ROUND_TRIPS, COMMITS, DUPLICATES
+from load import DB_HOST, DB_USERNAME, DB_PASSWORD, DB_NAME, DB_SCHEMA
+from connections import CONNECTION_POOL
+from plant_registry import PLANT_REGISTRY, PLANT_ID_SOURCE
+from alerts import ALERT_DISPATCHER, get_sns_client
+from alert_state import ALERT_STATE
 import logging
 
+LOAD_MODE = os.getenv('LOAD_MODE', 'bulk')
+PIPELINE_MODE = os.getenv('PIPELINE_MODE', 'batch')
+STREAM_QUEUE_SIZE = int(os.getenv('STREAM_QUEUE_SIZE', '20'))
+LOAD_BATCH_SIZE = int(os.getenv('LOAD_BATCH_SIZE', '25'))
+LOAD_BATCH_SECONDS = float(os.getenv('LOAD_BATCH_SECONDS', '2'))
+SHARD_INDEX = int(os.getenv('SHARD_INDEX', '0'))
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', '1'))
 
-def handler(event=None, context=None):
+
+def get_load_function():
+    """Returns the load process selected by LOAD_MODE, forgetting the fetched versions of any readings it rolls
+    back so the next poll doesn't skip them"""
+    load_function = apply_bulk_load_process if LOAD_MODE == 'bulk' else apply_load_process
+    return partial(load_function, on_rollback=PLANT_VERSIONS.forget)
+
+
+def get_plant_ids(registry=PLANT_REGISTRY) -> list[int]:
+    """Returns the plant IDs to fetch this run, reloading the known plants from the database once they are stale"""
+    if PLANT_ID_SOURCE == 'database' and registry.needs_refresh():
+        with CONNECTION_POOL.connection(DB_HOST, DB_USERNAME, DB_PASSWORD, DB_NAME) as conn:
+            cur = conn.cursor()
+            registry.load_from_db(DB_SCHEMA, cur)
+            cur.close()
+    return registry.plant_ids()
+
+
+def shard_plant_ids(plant_ids: list[int], shard_index: int, shard_count: int) -> list[int]:
+    """Returns the plant IDs that belong to one shard, split by plant_id modulo shard_count so a plant
+    stays on the same shard as new IDs are added"""
+    if shard_count < 1 or not 0 <= shard_index < shard_count:
+        raise ValueError(f"Invalid shard {shard_index} of {shard_count}")
+    return [plant_id for plant_id in plant_ids if plant_id % shard_count == shard_index]
+
+
+def get_shard(event: dict = None) -> tuple[int, int]:
+    """Returns the (shard_index, shard_count) from the event, falling back to SHARD_INDEX and SHARD_COUNT"""
+    event = event or {}
+    return int(event.get("shard_index", SHARD_INDEX)), int(event.get("shard_count", SHARD_COUNT))
+
+
+async def transform_stream(raw_queue: asyncio.Queue, batch_queue: asyncio.Queue,
+                           batch_size: int = LOAD_BATCH_SIZE, batch_seconds: float = LOAD_BATCH_SECONDS) -> None:
+    """Transforms responses as they arrive and hands them on in micro-batches, by size or by age"""
+    loop = asyncio.get_running_loop()
+    batch = []
+    batch_started = None
+
+    while True:
+        timeout = None if not batch else max(
+            0, batch_started + batch_seconds - loop.time())
+        try:
+            item = await asyncio.wait_for(raw_queue.get(), timeout)
+        except TimeoutError:
+            item = ()
+
+        if item:
+            cleaned = apply_transformations([item[1]])
+            if cleaned and not batch:
+                batch_started = loop.time()
+            batch.extend(cleaned)
+
+        if batch and (item is None or len(batch) >= batch_size or loop.time() - batch_started >= batch_seconds):
+            await batch_queue.put(batch)
+            batch = []
+
+        if item is None:
+            await batch_queue.put(None)
+            return
+
+
+async def load_stream(batch_queue: asyncio.Queue, load_function) -> dict:
+    """Loads each micro-batch in a worker thread so fetches and transforms carry on meanwhile"""
+    load_stats = {ROUND_TRIPS: 0, COMMITS: 0, DUPLICATES: 0, "batches": 0}
+
+    while (batch := await batch_queue.get()) is not None:
+        batch_stats = await asyncio.to_thread(load_function, batch)
+        load_stats[ROUND_TRIPS] += batch_stats[ROUND_TRIPS]
+        load_stats[COMMITS] += batch_stats[COMMITS]
+        load_stats[DUPLICATES] += batch_stats.get(DUPLICATES, 0)
+        load_stats["batches"] += 1
+
+    return load_stats
+
+
+async def run_streaming_pipeline(plant_ids: list[int], load_function, queue_size: int = STREAM_QUEUE_SIZE,
+                                 batch_size: int = LOAD_BATCH_SIZE, batch_seconds: float = LOAD_BATCH_SECONDS,
+                                 registry=None) -> dict:
+    """Runs extract, transform and load concurrently, with bounded queues between them for backpressure"""
+    raw_queue = asyncio.Queue(maxsize=queue_size)
+    batch_queue = asyncio.Queue(maxsize=2)
+
+    tasks = [asyncio.create_task(stream_responses(plant_ids, raw_queue, registry=registry)),
+             asyncio.create_task(transform_stream(raw_queue, batch_queue, batch_size, batch_seconds)),
+             asyncio.create_task(load_stream(batch_queue, load_function))]
+    try:
+        results = await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    return results[-1]
+
+
+def run_batch_pipeline(load_function, plant_ids: list[int], registry=None, **fetch_options) -> dict:
+    """Runs extract, transform and load one after the other over the whole batch"""
     logging.info("Retrieving data")
-    initial_data = extract_data()
+    initial_data = extract_data(plant_ids, registry, **fetch_options)
     logging.info("Data retrieved")
 
     logging.info("Cleaning data")
@@ -16,8 +127,29 @@ def handler(event=None, context=None):
     logging.info("Data cleaned")
 
     logging.info("Loading data")
-    apply_load_process(cleaned_data)
-    logging.info("Data loaded")
+    return load_function(cleaned_data)
+
+
+def handler(event=None, context=None):
+    shard_index, shard_count = get_shard(event)
+    ALERT_STATE.use_shard(shard_index, shard_count)
+    plant_ids = shard_plant_ids(get_plant_ids(), shard_index, shard_count)
+    logging.info("Shard %s of %s fetching %s plants", shard_index, shard_count, len(plant_ids))
+    INVALID_RECORDS.clear()
+    if PIPELINE_MODE == 'stream':
+        logging.info("Streaming data")
+        load_stats = asyncio.run(
+            run_streaming_pipeline(plant_ids, get_load_function(), registry=PLANT_REGISTRY))
+        logging.info("Fetch stats: %s", dict(FETCH_STATS))
+    else:
+        load_stats = run_batch_pipeline(get_load_function(), plant_ids, PLANT_REGISTRY)
+    logging.info("Plant registry stats: %s", PLANT_REGISTRY.stats())
+    logging.info("Invalid records skipped: %s", dict(INVALID_RECORDS))
+    logging.info("Data loaded in %s round trips and %s commits, %s duplicate readings suppressed",
+                 load_stats[ROUND_TRIPS], load_stats[COMMITS], load_stats.get(DUPLICATES, 0))
+    logging.info("Connection pool stats: %s", CONNECTION_POOL.stats)
+    ALERT_DISPATCHER.flush(get_sns_client())
+    logging.info("Alert stats: %s", ALERT_DISPATCHER.stats)
 
 
 if __name__ == "__main__":
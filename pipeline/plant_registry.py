@@ -0,0 +1,85 @@
+"This file keeps track of which plant IDs exist, so each run only fetches live plants and a few new candidates"
+
+import os
+import time
+import pymssql
+from extract import ERROR, CONNECTION_ERROR, BUDGET_ERROR, ALL_PLANT_IDS
+
+PLANT_ID_SOURCE = os.getenv('PLANT_ID_SOURCE', 'database')
+PLANT_REGISTRY_TTL = float(os.getenv('PLANT_REGISTRY_TTL', '3600'))
+PLANT_PROBE_AHEAD = int(os.getenv('PLANT_PROBE_AHEAD', '5'))
+PLANT_BACKOFF_BASE = float(os.getenv('PLANT_BACKOFF_BASE', '60'))
+PLANT_BACKOFF_MAX = float(os.getenv('PLANT_BACKOFF_MAX', '86400'))
+TRANSIENT_ERRORS = {CONNECTION_ERROR, BUDGET_ERROR}
+
+
+class PlantRegistry:
+    """The plant IDs worth fetching: every known plant plus a few IDs past the highest, with IDs that keep
+    failing skipped for exponentially longer between attempts"""
+
+    def __init__(self, initial_ids=ALL_PLANT_IDS, probe_ahead: int = PLANT_PROBE_AHEAD,
+                 backoff_base: float = PLANT_BACKOFF_BASE, backoff_max: float = PLANT_BACKOFF_MAX,
+                 ttl_seconds: float = PLANT_REGISTRY_TTL, clock=time.time):
+        self.probe_ahead = probe_ahead
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._known = set(initial_ids)
+        self._failures = {}
+        self._loaded_at = None
+        self.skipped = 0
+
+    def add(self, plant_ids) -> None:
+        """Adds plant IDs to fetch from now on"""
+        self._known.update(plant_ids)
+
+    def needs_refresh(self) -> bool:
+        """Whether the known IDs should be reloaded from the database"""
+        return self._loaded_at is None or self._clock() - self._loaded_at >= self.ttl_seconds
+
+    def load_from_db(self, schema: str, cursor: pymssql.Cursor) -> None:
+        """Adds every plant in the plants table to the known IDs"""
+        cursor.execute(f"SELECT plant_id FROM {schema}.plants")
+        self.add(row[0] for row in cursor.fetchall())
+        self._loaded_at = self._clock()
+
+    def is_due(self, plant_id: int, now: float) -> bool:
+        """Whether a plant is not waiting out a backoff"""
+        failure = self._failures.get(plant_id)
+        return failure is None or failure[1] <= now
+
+    def plant_ids(self) -> list[int]:
+        """Returns the IDs to fetch this run, in order, leaving out any still backing off"""
+        highest = max(self._known, default=0)
+        candidates = self._known.union(range(highest + 1, highest + 1 + self.probe_ahead))
+        now = self._clock()
+        due = sorted(plant_id for plant_id in candidates if self.is_due(plant_id, now))
+        self.skipped = len(candidates) - len(due)
+        return due
+
+    def record(self, plant_id: int, response: dict) -> None:
+        """Learns from a fetch: a plant that answered is live, one that errored backs off for longer each time"""
+        if ERROR not in response:
+            self._known.add(plant_id)
+            self._failures.pop(plant_id, None)
+            return
+        if response[ERROR] in TRANSIENT_ERRORS:
+            return
+
+        failures = self._failures.get(plant_id, (0, 0))[0] + 1
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (failures - 1))
+        self._failures[plant_id] = (failures, self._clock() + delay)
+
+    def failures(self, plant_id: int) -> int:
+        """Returns how many times in a row a plant has failed"""
+        return self._failures.get(plant_id, (0, 0))[0]
+
+    def stats(self) -> dict:
+        """Returns how many IDs are known, backing off and skipped this run"""
+        now = self._clock()
+        return {"known": len(self._known), "skipped": self.skipped,
+                "backing_off": sum(1 for plant_id in self._failures if not self.is_due(plant_id, now))}
+
+
+PLANT_REGISTRY = PlantRegistry()
@@ -0,0 +1,44 @@
+"This file defines the compact records the transform hands to the load"
+
+from dataclasses import dataclass
+
+
+@dataclass(slots=True, frozen=True)
+class Location:
+    """Where a plant comes from, shared by every reading from the same place"""
+    lat: float
+    lon: float
+    name: str
+    country_code: str
+    timezone: str
+
+
+@dataclass(slots=True, frozen=True)
+class Botanist:
+    """The botanist looking after a plant, shared by every reading they take"""
+    name: str
+    email: str
+    phone: str
+
+
+@dataclass(slots=True)
+class PlantReading:
+    """One validated reading of a plant, with every value already in the type and layout the database stores"""
+    plant_id: int
+    name: str
+    scientific_name: str
+    last_watered: str
+    temperature: float
+    soil_moisture: float
+    reading_at: str
+    location: Location
+    botanist: Botanist
+
+    def to_dict(self) -> dict:
+        """Returns the reading in the nested dict layout the transform used to produce"""
+        location = self.location
+        return {"plant_id": self.plant_id, "name": self.name, "scientific_name": self.scientific_name,
+                "last_watered": self.last_watered, "temperature": self.temperature, "soil_moisture": self.soil_moisture,
+                "reading_at": self.reading_at,
+                "origin_location": [location.lat, location.lon, location.name, location.country_code, location.timezone],
+                "botanist": {"name": self.botanist.name, "email": self.botanist.email, "phone": self.botanist.phone}}
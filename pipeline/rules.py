@@ -0,0 +1,118 @@
+"This file evaluates alert rules over a whole batch of readings at once"
+
+import os
+import time
+import numpy as np
+import pandas as pd
+import pymssql
+from records import PlantReading
+from alert_state import ALERT_HISTORY_SIZE
+from thresholds import ALERT_RULES_PATH, ALERT_RULES_SOURCE, MIN, MAX, MAX_CHANGE
+from thresholds import load_rules, resolve_thresholds, outside
+
+ALERT_RULES_TTL = float(os.getenv('ALERT_RULES_TTL', '600'))
+ROLLING_WINDOW = "rolling_window"
+METRIC_FIELDS = {"moisture": "soil_moisture", "temperature": "temperature"}
+HISTORY_INDEXES = {"moisture": 2, "temperature": 1}
+OUT_OF_RANGE = "out_of_range"
+RATE_OF_CHANGE = "rate_of_change"
+ROLLING_MEAN = "rolling_mean"
+
+
+def validate_rules(rules: dict, history_size: int = ALERT_HISTORY_SIZE) -> dict:
+    """Checks the rolling window fits in the readings kept per plant, as a longer one could never fill up and fire"""
+    window = int(rules.get(ROLLING_WINDOW, 0))
+    if window - 1 > history_size:
+        raise ValueError(f"rolling_window {window} needs {window - 1} previous readings, "
+                         f"but only {history_size} are kept (ALERT_HISTORY_SIZE)")
+    return rules
+
+
+class RuleCache:
+    """Keeps the rules between warm invocations, reloading them once they are older than the TTL"""
+
+    def __init__(self, source: str = ALERT_RULES_SOURCE, path: str = ALERT_RULES_PATH,
+                 ttl_seconds: float = ALERT_RULES_TTL, clock=time.monotonic, history_size: int = ALERT_HISTORY_SIZE):
+        self.source = source
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.history_size = history_size
+        self._clock = clock
+        self._rules = None
+        self._loaded_at = None
+
+    def get(self, schema: str, cursor: pymssql.Cursor) -> dict:
+        """Returns the current rules, reloading them from the file and, if configured, the database"""
+        if self._rules is None or self._clock() - self._loaded_at >= self.ttl_seconds:
+            rules = load_rules(schema, cursor, self.source, self.path)
+            self._rules = validate_rules(rules, self.history_size)
+            self._loaded_at = self._clock()
+        return self._rules
+
+
+def build_history_matrix(histories: list[list[tuple]], metric: str, width: int) -> np.ndarray:
+    """Returns an (plants, width) array of each plant's previous values, oldest first and NaN padded,
+    scattering every reading into place at once"""
+    width = max(width, 1)
+    index = HISTORY_INDEXES[metric]
+    lengths = np.fromiter((len(history) for history in histories), dtype=int, count=len(histories))
+    total = int(lengths.sum())
+    values = np.fromiter((reading[index] for history in histories for reading in history), dtype=float, count=total)
+
+    # How far each reading is from the end of its plant's history, 0 being the most recent
+    from_end = np.repeat(np.cumsum(lengths), lengths) - np.arange(total) - 1
+    kept = from_end < width
+    matrix = np.full((len(histories), width), np.nan)
+    matrix[np.repeat(np.arange(len(histories)), lengths)[kept], width - 1 - from_end[kept]] = values[kept]
+    return matrix
+
+
+def evaluate_rules(plants: list[PlantReading], histories: list[list[tuple]], rules: dict) -> tuple[list[tuple], list[tuple]]:
+    """Evaluates every rule for every plant in one pass, returning the (plant_id, alert, message) triggered
+    and the (plant_id, alert) keys that are clear, which needs the reading back inside its bounds"""
+    if not plants:
+        return [], []
+
+    frame = pd.DataFrame([(plant.plant_id, plant.name, *(getattr(plant, field) for field in METRIC_FIELDS.values()))
+                          for plant in plants], columns=["plant_id", "name", *METRIC_FIELDS.values()])
+    plant_ids = frame["plant_id"].to_numpy()
+    window = int(rules.get(ROLLING_WINDOW, 0))
+    triggered, cleared = [], []
+
+    for metric, field in METRIC_FIELDS.items():
+        current = frame[field].to_numpy(dtype=float)
+        low = resolve_thresholds(frame["plant_id"], frame["name"], rules, metric, MIN)
+        high = resolve_thresholds(frame["plant_id"], frame["name"], rules, metric, MAX)
+        max_change = resolve_thresholds(frame["plant_id"], frame["name"], rules, metric, MAX_CHANGE)
+        history = build_history_matrix(histories, metric, max(window - 1, 1))
+        previous = history[:, -1]
+
+        in_bounds = ~outside(current, low, high)
+        results = {OUT_OF_RANGE: (outside(current, low, high) & outside(previous, low, high), current, in_bounds),
+                   RATE_OF_CHANGE: (np.abs(current - previous) > max_change, current - previous, in_bounds)}
+        if window > 1:
+            recent = np.column_stack([history[:, -(window - 1):], current])
+            rolling_mean = recent.mean(axis=1)
+            results[ROLLING_MEAN] = (outside(rolling_mean, low, high), rolling_mean,
+                                     in_bounds & ~outside(rolling_mean, low, high))
+
+        for rule, (mask, values, settled) in results.items():
+            alert = metric if rule == OUT_OF_RANGE else f"{metric}_{rule}"
+            for row in np.flatnonzero(mask):
+                triggered.append((int(plant_ids[row]), alert, describe(
+                    rule, metric, values[row], low[row], high[row], max_change[row])))
+            cleared.extend((int(plant_id), alert) for plant_id in plant_ids[~mask & settled])
+
+    return triggered, cleared
+
+
+def describe(rule: str, metric: str, value: float, low: float, high: float, max_change: float) -> str:
+    """Returns the message for an alert"""
+    if rule == RATE_OF_CHANGE:
+        return f"{metric} changed by {value:+.1f} since the last reading, more than {max_change:g}"
+    if rule == ROLLING_MEAN:
+        return f"recent average {metric} {value:.1f} is outside {low:g}-{high:g}"
+    return f"{metric} {value:.1f} is outside {low:g}-{high:g}"
+
+
+RULE_CACHE = RuleCache()
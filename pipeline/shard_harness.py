@@ -0,0 +1,105 @@
+"This file runs the pipeline as several shard processes against the stub plants API and reports aggregate throughput"
+
+import argparse
+import asyncio
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from extract import FETCH_STATS, REQUESTS, MAX_CONCURRENCY
+from load import ROUND_TRIPS, COMMITS, DUPLICATES
+from pipeline import shard_plant_ids, run_batch_pipeline, get_load_function
+from alert_state import ALERT_STATE
+from records import PlantReading
+from stub_api import StubPlantsAPI, start_stub_server
+
+HARNESS_PLANT_COUNT = 1000
+HARNESS_LATENCY = 0.05
+
+
+def discard_load(cleaned_data: list[PlantReading]) -> dict:
+    """Stands in for the database load when the harness runs without one"""
+    return {ROUND_TRIPS: 0, COMMITS: 0, DUPLICATES: 0}
+
+
+def run_shard(shard_index: int, shard_count: int, plant_ids: list[int], api_url: str,
+              max_concurrency: int = MAX_CONCURRENCY, load_to_db: bool = False) -> dict:
+    """Extracts, transforms and loads one shard's slice of the plants, returning what it did and when it ran"""
+    started = time.time()
+    ALERT_STATE.use_shard(shard_index, shard_count)
+    load_function = get_load_function() if load_to_db else discard_load
+    readings = 0
+
+    def counting_load(cleaned_data: list[PlantReading]) -> dict:
+        nonlocal readings
+        readings += len(cleaned_data)
+        return load_function(cleaned_data)
+
+    shard_ids = shard_plant_ids(plant_ids, shard_index, shard_count)
+    load_stats = run_batch_pipeline(counting_load, shard_ids, api_url=api_url, versions=None,
+                                    max_concurrency=max_concurrency)
+    return {"shard": shard_index, "plants": len(shard_ids), "readings": readings,
+            REQUESTS: FETCH_STATS[REQUESTS], ROUND_TRIPS: load_stats[ROUND_TRIPS],
+            "started": started, "finished": time.time()}
+
+
+def run_shards(shard_count: int, plant_ids: list[int], api_url: str,
+               max_concurrency: int = MAX_CONCURRENCY, load_to_db: bool = False) -> dict:
+    """Runs every shard in its own process at once and sums up their results. Throughput is measured from the first
+    shard starting to the last finishing, leaving out process start-up, as each shard would be a warm invocation"""
+    context = multiprocessing.get_context("spawn")
+    start = time.time()
+    with ProcessPoolExecutor(max_workers=shard_count, mp_context=context) as executor:
+        futures = [executor.submit(run_shard, shard_index, shard_count, plant_ids, api_url,
+                                   max_concurrency, load_to_db)
+                   for shard_index in range(shard_count)]
+        shards = [future.result() for future in futures]
+    finished = time.time()
+
+    readings = sum(shard["readings"] for shard in shards)
+    seconds = max(shard["finished"] for shard in shards) - min(shard["started"] for shard in shards)
+    return {"shards": shard_count, "plants": sum(shard["plants"] for shard in shards), "readings": readings,
+            REQUESTS: sum(shard[REQUESTS] for shard in shards), "seconds": seconds,
+            "slowest_shard_seconds": max(shard["finished"] - shard["started"] for shard in shards),
+            "total_seconds": finished - start, "readings_per_second": readings / seconds}
+
+
+def serve_in_background(api: StubPlantsAPI) -> tuple[str, callable]:
+    """Starts the stub on its own event loop thread, returning its URL template and a function that stops it"""
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    runner, url = asyncio.run_coroutine_threadsafe(start_stub_server(api), loop).result()
+
+    def stop() -> None:
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+    return url, stop
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--plants", type=int, default=HARNESS_PLANT_COUNT)
+    parser.add_argument("--latency", type=float, default=HARNESS_LATENCY,
+                        help="seconds the stub holds back every response")
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENCY,
+                        help="concurrent fetches per shard")
+    parser.add_argument("--db", action="store_true",
+                        help="load into the database configured in .env instead of discarding")
+    args = parser.parse_args()
+
+    stub_url, stop_stub = serve_in_background(StubPlantsAPI(args.plants, latency=args.latency))
+    try:
+        print(f"{'shards':>6} {'plants':>7} {'readings':>9} {'requests':>9} {'seconds':>8} "
+              f"{'slowest':>8} {'total':>8} {'readings/sec':>13}")
+        for count in args.shards:
+            result = run_shards(count, list(range(1, args.plants + 1)), stub_url, args.concurrency, args.db)
+            print(f"{result['shards']:>6} {result['plants']:>7} {result['readings']:>9} {result[REQUESTS]:>9} "
+                  f"{result['seconds']:>8.2f} {result['slowest_shard_seconds']:>8.2f} {result['total_seconds']:>8.2f} "
+                  f"{result['readings_per_second']:>13,.0f}")
+    finally:
+        stop_stub()
@@ -0,0 +1,155 @@
+"This file runs a local stand-in for the plants API so extraction can be tested and measured without the real one"
+
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+from collections import Counter
+from datetime import datetime, timedelta
+from email.utils import parsedate_to_datetime
+from aiohttp import web
+
+STUB_PLANT_COUNT = 50
+STUB_START = datetime(2024, 6, 13, 9, 0, 0)
+RECORDING_TAKEN_FORMAT = '%Y-%m-%d %H:%M:%S'
+WATERED_AT_FORMAT = '%a, %d %b %Y %H:%M:%S GMT'
+BOTANISTS = [{"email": "carl.linnaeus@lnhm.co.uk", "name": "Carl Linnaeus", "phone": "(146)994-1635x35992"},
+             {"email": "eliza.andrews@lnhm.co.uk", "name": "Eliza Andrews", "phone": "(846)669-6651x75948"},
+             {"email": "gertrude.jekyll@lnhm.co.uk", "name": "Gertrude Jekyll", "phone": "001-481-273-3691x127"}]
+LOCATIONS = [["43.50891", "16.43915", "Split", "HR", "Europe/Zagreb"],
+             ["-19.32556", "41.25528", "Ilha de Mocambique", "MZ", "Africa/Maputo"],
+             ["33.95015", "-118.03917", "South Whittier", "US", "America/Los_Angeles"],
+             ["13.70167", "-89.10944", "Ilopango", "SV", "America/El_Salvador"]]
+SPECIES = [("Epipremnum Aureum", None), ("Dragon tree", None), ("Venus flytrap", ["Dionaea muscipula"]),
+           ("Corpse flower", ["Amorphophallus titanum"]), ("Rafflesia arnoldii", ["Rafflesia arnoldii"])]
+REQUESTS = "requests"
+OK = "ok"
+NOT_MODIFIED = "not_modified"
+NOT_FOUND = "not_found"
+SERVER_ERRORS = "server_errors"
+BYTES_SENT = "bytes_sent"
+
+
+class StubPlantsAPI:
+    """Serves /plants/{plant_id} for IDs 1 to plant_count like the plants API, with each plant's reading
+    only moving on when advance is called and every answer held back by latency seconds"""
+
+    def __init__(self, plant_count: int = STUB_PLANT_COUNT, conditional: bool = True, missing_ids: set = None,
+                 failure_rate: float = 0.0, seed: int = 0, latency: float = 0.0):
+        self.plant_count = plant_count
+        self.conditional = conditional
+        self.missing_ids = set(missing_ids or ())
+        self.failure_rate = failure_rate
+        self.latency = latency
+        self._random = random.Random(seed)
+        self._readings = {}
+        self.stats = Counter()
+        self.advance()
+
+    def exists(self, plant_id: int) -> bool:
+        """Whether the API knows a plant"""
+        return 1 <= plant_id <= self.plant_count and plant_id not in self.missing_ids
+
+    def advance(self, plant_ids: list[int] = None, minutes: int = 1) -> None:
+        """Takes a new reading for the plants, or for every plant if none are given"""
+        for plant_id in range(1, self.plant_count + 1) if plant_ids is None else plant_ids:
+            previous = self._readings.get(plant_id)
+            taken_at = STUB_START if previous is None else previous[0] + timedelta(minutes=minutes)
+            self._readings[plant_id] = (taken_at, round(self._random.uniform(15, 45), 2),
+                                        round(self._random.uniform(5, 30), 2))
+
+    def plant(self, plant_id: int) -> dict:
+        """Returns a plant's current response body"""
+        taken_at, moisture, temperature = self._readings[plant_id]
+        name, scientific_name = SPECIES[plant_id % len(SPECIES)]
+        plant = {"botanist": BOTANISTS[plant_id % len(BOTANISTS)],
+                 "last_watered": (taken_at - timedelta(hours=plant_id % 12 + 1)).strftime(WATERED_AT_FORMAT),
+                 "name": name, "origin_location": LOCATIONS[plant_id % len(LOCATIONS)], "plant_id": plant_id,
+                 "recording_taken": taken_at.strftime(RECORDING_TAKEN_FORMAT),
+                 "soil_moisture": moisture, "temperature": temperature}
+        if scientific_name:
+            plant["scientific_name"] = scientific_name
+        return plant
+
+    def respond(self, status: int, body: dict, headers: dict = None) -> web.Response:
+        """Builds a JSON response, counting the bytes sent"""
+        text = json.dumps(body)
+        self.stats[BYTES_SENT] += len(text)
+        return web.Response(status=status, text=text, content_type="application/json", headers=headers)
+
+    async def handle_plant(self, request: web.Request) -> web.Response:
+        """Answers one plant request, with a 304 if the client's validators still match"""
+        self.stats[REQUESTS] += 1
+        plant_id = int(request.match_info["plant_id"])
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.failure_rate and self._random.random() < self.failure_rate:
+            self.stats[SERVER_ERRORS] += 1
+            return self.respond(500, {"error": "Internal server error"})
+        if not self.exists(plant_id):
+            self.stats[NOT_FOUND] += 1
+            return self.respond(404, {"error": "plant not found", "plant_id": plant_id})
+
+        body = self.plant(plant_id)
+        if not self.conditional:
+            self.stats[OK] += 1
+            return self.respond(200, body)
+
+        etag = f'"{hashlib.md5(json.dumps(body).encode()).hexdigest()}"'
+        last_modified = self._readings[plant_id][0].strftime(WATERED_AT_FORMAT)
+        if request.headers.get("If-None-Match") == etag or (
+                "If-None-Match" not in request.headers and "If-Modified-Since" in request.headers
+                and parsedate_to_datetime(request.headers["If-Modified-Since"]).replace(tzinfo=None)
+                >= self._readings[plant_id][0]):
+            self.stats[NOT_MODIFIED] += 1
+            return web.Response(status=304, headers={"ETag": etag, "Last-Modified": last_modified})
+
+        self.stats[OK] += 1
+        return self.respond(200, body, {"ETag": etag, "Last-Modified": last_modified})
+
+    def build_app(self) -> web.Application:
+        """Returns the aiohttp application serving the plants routes"""
+        app = web.Application()
+        app.router.add_get("/plants/{plant_id:-?\\d+}", self.handle_plant)
+        return app
+
+
+async def start_stub_server(api: StubPlantsAPI, host: str = "127.0.0.1", port: int = 0) -> tuple[web.AppRunner, str]:
+    """Starts the stub on a free port, returning its runner and a URL template like API_URL"""
+    runner = web.AppRunner(api.build_app())
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    bound_port = runner.addresses[0][1]
+    return runner, f"http://{host}:{bound_port}/plants/{{}}"
+
+
+async def serve_forever(api: StubPlantsAPI, host: str, port: int, tick_seconds: float) -> None:
+    """Serves the stub, taking a new reading for every plant each tick"""
+    runner, url = await start_stub_server(api, host, port)
+    print(f"Serving {api.plant_count} plants at {url.format('<plant_id>')}, set PLANTS_API_URL={url}")
+    try:
+        while True:
+            await asyncio.sleep(tick_seconds)
+            api.advance()
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--plants", type=int, default=STUB_PLANT_COUNT)
+    parser.add_argument("--tick", type=float, default=60,
+                        help="seconds between new readings")
+    parser.add_argument("--latency", type=float, default=0,
+                        help="seconds to hold back every response")
+    parser.add_argument("--no-conditional", action="store_true",
+                        help="send no ETag or Last-Modified headers")
+    args = parser.parse_args()
+
+    asyncio.run(serve_forever(StubPlantsAPI(args.plants, not args.no_conditional,
+                                            latency=args.latency),
+                              args.host, args.port, args.tick))
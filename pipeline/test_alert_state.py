@@ -0,0 +1,76 @@
+from unittest.mock import MagicMock
+from alert_state import AlertStateStore
+
+
+def test_seed_remembers_plants_without_readings():
+    store = AlertStateStore(path=None)
+    store.seed([1, 2], {1: (12.5, 30.0)})
+
+    assert store.latest(1) == (12.5, 30.0)
+    assert store.latest(2) is None
+    assert store.missing([1, 2, 3]) == [3]
+
+
+def test_record_keeps_last_n_newer_readings():
+    store = AlertStateStore(history_size=2, path=None)
+    store.record(1, "2024-06-13 20:57:00", 10.0, 20.0)
+    store.record(1, "2024-06-13 20:58:00", 11.0, 21.0)
+    store.record(1, "2024-06-13 20:58:00", 99.0, 99.0)
+    store.record(1, "2024-06-13 20:59:00", 12.0, 22.0)
+
+    assert store.history(1) == [("2024-06-13 20:58:00", 11.0, 21.0),
+                                ("2024-06-13 20:59:00", 12.0, 22.0)]
+    assert store.latest(1) == (12.0, 22.0)
+
+
+def test_snapshot_round_trips_through_local_file(tmp_path):
+    path = str(tmp_path / "alert_state.json")
+    store = AlertStateStore(path=path)
+    store.record(7, "2024-06-13 20:59:00", 12.0, 22.0)
+    store.save()
+
+    restored = AlertStateStore(path=path)
+    restored.load()
+
+    assert restored.history(7) == [("2024-06-13 20:59:00", 12.0, 22.0)]
+
+
+def test_snapshot_restores_from_s3_when_no_local_file(tmp_path):
+    store = AlertStateStore(path=None, bucket="bucket")
+    store.record(7, "2024-06-13 20:59:00", 12.0, 22.0)
+    mock_s3 = MagicMock()
+    store.save(mock_s3)
+    snapshot = mock_s3.put_object.call_args.kwargs["Body"]
+    mock_s3.get_object.return_value = {"Body": MagicMock(read=MagicMock(return_value=snapshot))}
+
+    restored = AlertStateStore(path=str(tmp_path / "missing.json"), bucket="bucket")
+    restored.load(mock_s3)
+
+    assert restored.latest(7) == (12.0, 22.0)
+
+
+def test_unreadable_snapshot_starts_empty(tmp_path):
+    path = tmp_path / "alert_state.json"
+    path.write_text("not json")
+    store = AlertStateStore(path=str(path))
+    store.load()
+
+    assert store.missing([1]) == [1]
+
+
+def test_use_shard_gives_each_shard_its_own_snapshot(tmp_path):
+    path = str(tmp_path / "alert_state.json")
+    store = AlertStateStore(path=path, key="alert-state/snapshot.json")
+    store.use_shard(0, 1)
+    assert (store.path, store.key) == (path, "alert-state/snapshot.json")
+
+    store.use_shard(1, 4)
+    assert store.path == str(tmp_path / "alert_state-shard-1-of-4.json")
+    assert store.key == "alert-state/shard-1-of-4/snapshot.json"
+
+    store.record(7, "2024-06-13 20:59:00", 12.0, 22.0)
+    store.save()
+    store.use_shard(2, 4)
+    store.load()
+
+    assert 7 not in store
@@ -0,0 +1,78 @@
+from botocore.exceptions import ClientError
+from alerts import AlertDispatcher, SENT, SUPPRESSED, DIGESTS, FAILED
+
+
+class StubSNSClient:
+    """Records what would have been published instead of calling AWS"""
+
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.published = []
+
+    def publish(self, **kwargs):
+        if self.fail:
+            raise ClientError({"Error": {"Code": "Throttling"}}, "Publish")
+        self.published.append(kwargs)
+        return {"MessageId": str(len(self.published))}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_one_digest_per_flush():
+    sns = StubSNSClient()
+    dispatcher = AlertDispatcher(topic_arn="topic")
+    dispatcher.collect(1, "moisture", "soil moisture 10.0 is outside 21-41")
+    dispatcher.collect(2, "temperature", "temperature 40.0 is outside 7-38")
+    dispatcher.flush(sns)
+
+    assert len(sns.published) == 1
+    assert sns.published[0]["TopicArn"] == "topic"
+    assert "Plant 1, moisture" in sns.published[0]["Message"]
+    assert "Plant 2, temperature" in sns.published[0]["Message"]
+    assert dispatcher.stats[SENT] == 2 and dispatcher.stats[DIGESTS] == 1
+
+
+def test_repeats_are_suppressed_until_cooldown_ends():
+    sns = StubSNSClient()
+    clock = FakeClock()
+    dispatcher = AlertDispatcher(cooldown_seconds=600, clock=clock)
+    assert dispatcher.collect(1, "moisture", "low")
+    assert not dispatcher.collect(1, "moisture", "low")
+    dispatcher.flush(sns)
+
+    clock.now = 599
+    assert not dispatcher.collect(1, "moisture", "low")
+    clock.now = 600
+    assert dispatcher.collect(1, "moisture", "low")
+    assert dispatcher.stats[SUPPRESSED] == 2
+
+
+def test_resolve_ends_cooldown():
+    dispatcher = AlertDispatcher(cooldown_seconds=600, clock=FakeClock())
+    dispatcher.collect(1, "moisture", "low")
+    dispatcher.flush(StubSNSClient())
+    dispatcher.resolve(1, "moisture")
+
+    assert dispatcher.collect(1, "moisture", "low")
+
+
+def test_empty_flush_sends_nothing():
+    sns = StubSNSClient()
+    AlertDispatcher().flush(sns)
+
+    assert sns.published == []
+
+
+def test_failed_digest_is_not_put_on_cooldown():
+    dispatcher = AlertDispatcher(clock=FakeClock())
+    dispatcher.collect(1, "moisture", "low")
+    dispatcher.flush(StubSNSClient(fail=True))
+
+    assert dispatcher.stats[FAILED] == 1
+    assert dispatcher.collect(1, "moisture", "low")
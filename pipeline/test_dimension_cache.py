@@ -0,0 +1,62 @@
+from dimension_cache import DimensionCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_cache_returns_stored_ids():
+    cache = DimensionCache()
+    cache.put("Europe/Zagreb", 1)
+
+    assert cache.get("Europe/Zagreb") == 1
+    assert cache.get("Asia/Shanghai") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_cache_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = DimensionCache(ttl_seconds=60, clock=clock)
+    cache.put("HR", 2)
+
+    clock.now = 59
+    assert cache.get("HR") == 2
+    clock.now = 60
+    assert cache.get("HR") is None
+    assert len(cache) == 0
+
+
+def test_cache_evicts_least_recently_used_entry():
+    cache = DimensionCache(max_size=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_split_separates_cached_and_missing_keys():
+    cache = DimensionCache()
+    cache.update({("split", 43.50891, 16.43915): 4})
+
+    assert cache.split([("split", 43.50891, 16.43915), ("licheng", 23.29549, 113.82465),
+                        ("licheng", 23.29549, 113.82465)]) == ({("split", 43.50891, 16.43915): 4}, [("licheng", 23.29549, 113.82465)])
+
+
+def test_needs_warming_until_warmed_and_after_ttl():
+    clock = FakeClock()
+    cache = DimensionCache(ttl_seconds=60, clock=clock)
+    assert cache.needs_warming()
+
+    cache.warm({"HR": 2})
+    assert not cache.needs_warming()
+
+    clock.now = 61
+    assert cache.needs_warming()
@@ -0,0 +1,188 @@
+import asyncio
+import json
+from unittest.mock import patch
+import pytest
+
+import extract
+from extract import fetch_plant_data, get_all_responses, get_latency_percentiles, percentile, FETCH_LATENCIES
+from extract import PlantVersions, FETCH_STATS, PLANT_VERSIONS
+from stub_api import StubPlantsAPI, start_stub_server
+
+
+class FakeResponse:
+    def __init__(self, status, body, headers=None):
+        self.status = status
+        self.body = body
+        self.headers = headers or {}
+
+    async def __aenter__(self):
+        if isinstance(self.body, Exception):
+            raise self.body
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    async def read(self):
+        return json.dumps(self.body).encode()
+
+
+class FakeSession:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = 0
+        self.headers = []
+
+    def get(self, url, headers=None, timeout=None):
+        self.calls += 1
+        self.headers.append(headers)
+        return self.responses.pop(0)
+
+
+@pytest.fixture(autouse=True)
+def clear_latencies():
+    FETCH_LATENCIES.clear()
+    FETCH_STATS.clear()
+    PLANT_VERSIONS.clear()
+    yield
+    FETCH_LATENCIES.clear()
+    PLANT_VERSIONS.clear()
+
+
+def test_fetch_plant_data_returns_json_and_records_latency():
+    session = FakeSession([FakeResponse(200, {"plant_id": 1})])
+
+    assert asyncio.run(fetch_plant_data(session, 1)) == {"plant_id": 1}
+    assert len(FETCH_LATENCIES[1]) == 1
+
+
+def test_fetch_plant_data_retries_timeouts_and_server_errors():
+    session = FakeSession([FakeResponse(200, TimeoutError()), FakeResponse(503, None),
+                           FakeResponse(200, {"plant_id": 1})])
+
+    assert asyncio.run(fetch_plant_data(session, 1, base_delay=0)) == {
+        "plant_id": 1}
+    assert session.calls == 3
+
+
+def test_fetch_plant_data_does_not_retry_client_errors():
+    session = FakeSession(
+        [FakeResponse(404, {"error": "plant not found", "plant_id": 7})])
+
+    assert asyncio.run(fetch_plant_data(session, 7, base_delay=0)) == {
+        "error": "plant not found", "plant_id": 7}
+    assert session.calls == 1
+
+
+def test_fetch_plant_data_gives_up_after_max_retries():
+    session = FakeSession([FakeResponse(500, None) for _ in range(3)])
+
+    assert "error" in asyncio.run(fetch_plant_data(
+        session, 1, max_retries=2, base_delay=0))
+    assert session.calls == 3
+
+
+def test_get_all_responses_returns_partial_results_after_run_budget():
+    async def fake_fetch(session, plant_id, semaphore, **kwargs):
+        if plant_id == 2:
+            await asyncio.sleep(10)
+        return {"plant_id": plant_id}
+
+    with patch.object(extract, "fetch_plant_data", fake_fetch):
+        responses = asyncio.run(get_all_responses([1, 2], run_budget=0.05))
+
+    assert responses[0] == {"plant_id": 1}
+    assert responses[1]["plant_id"] == 2
+    assert "error" in responses[1]
+
+
+def test_percentiles():
+    samples = [float(i) for i in range(1, 101)]
+
+    assert percentile(samples, 50) == 50.0
+    assert percentile(samples, 95) == 95.0
+    assert percentile(samples, 99) == 99.0
+
+
+def test_get_latency_percentiles_per_plant_and_overall():
+    FETCH_LATENCIES[1].extend([0.1, 0.2])
+    FETCH_LATENCIES[2].extend([0.3])
+
+    assert get_latency_percentiles(1) == {"p50": 0.1, "p95": 0.2, "p99": 0.2}
+    assert get_latency_percentiles()["p99"] == 0.3
+    assert get_latency_percentiles(3) == {}
+
+
+def test_fetch_plant_data_sends_validators_and_skips_not_modified():
+    versions = PlantVersions()
+    session = FakeSession([FakeResponse(200, {"plant_id": 1, "recording_taken": "2024-06-13 20:59:29"},
+                                        {"ETag": '"v1"', "Last-Modified": "Thu, 13 Jun 2024 20:59:29 GMT"}),
+                           FakeResponse(304, None)])
+
+    asyncio.run(fetch_plant_data(session, 1, versions=versions))
+    second = asyncio.run(fetch_plant_data(session, 1, versions=versions))
+
+    assert second == {"unchanged": True, "plant_id": 1}
+    assert session.headers[1] == {"If-None-Match": '"v1"', "If-Modified-Since": "Thu, 13 Jun 2024 20:59:29 GMT"}
+    assert FETCH_STATS["not_modified"] == 1
+
+
+def test_fetch_plant_data_compares_recording_taken_without_validators():
+    versions = PlantVersions()
+    plant = {"plant_id": 1, "recording_taken": "2024-06-13 20:59:29"}
+    session = FakeSession([FakeResponse(200, plant), FakeResponse(200, plant),
+                           FakeResponse(200, dict(plant, recording_taken="2024-06-13 21:00:29"))])
+
+    results = [asyncio.run(fetch_plant_data(session, 1, versions=versions)) for _ in range(3)]
+
+    assert results[0] == plant
+    assert "unchanged" in results[1]
+    assert results[2]["recording_taken"] == "2024-06-13 21:00:29"
+    assert session.headers[1] == {}
+
+
+async def fetch_twice_from_stub(api, changed_ids):
+    versions = PlantVersions()
+    runner, url = await start_stub_server(api)
+    try:
+        first = await get_all_responses(list(range(1, 11)), api_url=url, versions=versions)
+        first_bytes = api.stats["bytes_sent"]
+        api.advance(changed_ids)
+        second = await get_all_responses(list(range(1, 11)), api_url=url, versions=versions)
+        return first, second, first_bytes, api.stats["bytes_sent"] - first_bytes
+    finally:
+        await runner.cleanup()
+
+
+def test_conditional_requests_against_the_stub_only_download_changed_plants():
+    api = StubPlantsAPI(plant_count=10)
+
+    first, second, first_bytes, second_bytes = asyncio.run(fetch_twice_from_stub(api, [3, 7]))
+
+    assert len(first) == 10
+    assert [plant["plant_id"] for plant in second] == [3, 7]
+    assert api.stats["not_modified"] == 8
+    assert second_bytes < first_bytes / 4
+
+
+def test_recording_taken_check_against_the_stub_skips_unchanged_plants():
+    api = StubPlantsAPI(plant_count=10, conditional=False)
+
+    first, second, first_bytes, second_bytes = asyncio.run(fetch_twice_from_stub(api, [5]))
+
+    assert len(first) == 10
+    assert [plant["plant_id"] for plant in second] == [5]
+    assert second_bytes == first_bytes
+    assert FETCH_STATS["unchanged"] == 9
+
+
+def test_stub_returns_not_found_for_missing_plants():
+    async def fetch_missing():
+        api = StubPlantsAPI(plant_count=3, missing_ids={2})
+        runner, url = await start_stub_server(api)
+        try:
+            return await get_all_responses([2, 4], api_url=url, versions=None, base_delay=0)
+        finally:
+            await runner.cleanup()
+
+    assert [response["error"] for response in asyncio.run(fetch_missing())] == ["plant not found"] * 2
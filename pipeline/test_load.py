@@ -1,7 +1,20 @@
 import pytest
+from contextlib import ExitStack
+from dataclasses import replace
+from types import SimpleNamespace
+from datetime import datetime
 from unittest.mock import MagicMock, patch
 
-from load import check_if_botanist_in_db, add_botanist_to_db, check_if_timezone_in_db, add_timezone_to_db, check_if_country_code_in_db, add_country_code_to_db, check_if_location_in_db, add_location_to_db, check_if_species_in_db, add_species_to_db, check_if_plant_in_db, add_plant_to_db, botanist_checks, timezone_checks, country_code_checks, location_checks, plant_species_checks, plant_checks, botanist_checks
+from alert_state import AlertStateStore
+from watermarks import ReadingWatermarks
+from extract import PlantVersions
+from load import bulk_upsert_latest_readings
+from load import CountingConnection, chunk_rows, build_values_clause, merge_dimension_rows, bulk_location_checks, get_previous_readings, bulk_add_readings_to_db, apply_bulk_load_process, ROUND_TRIPS, COMMITS
+from load import bulk_timezone_checks, bulk_botanist_checks, warm_dimension_caches
+from load import get_reading_watermarks, DUPLICATES
+from load import apply_load_process
+from records import PlantReading, Location, Botanist
+from dimension_cache import DimensionCache, TIMEZONES, COUNTRY_CODES, LOCATIONS, PLANT_SPECIES, BOTANISTS, PLANTS
 
 
 @pytest.fixture
@@ -17,408 +30,265 @@ def mock_cursor(mock_create_connection):
     return mock_cursor
 
 
-def test_check_if_botanist_in_db_found(mock_cursor):
-    mock_cursor.fetchone.return_value = (1,)
-    test_email = "test@example.com"
-    test_schema = "test_schema"
-    assert check_if_botanist_in_db(
-        test_email, test_schema, mock_cursor) == (1,)
+@pytest.fixture
+def transformed_plant():
+    return PlantReading(10, "dragon tree", None, "2024-06-13 13:04:57", 14.0, 30.0, "2024-06-13 20:59:29",
+                        Location(43.50891, 16.43915, "Split", "HR", "Europe/Zagreb"),
+                        Botanist("Gertrude Jekyll", "gertrude.jekyll@lnhm.co.uk", "0014812733691127"))
+
+
+def test_counting_connection_counts_statements_and_commits():
+    mock_conn = MagicMock()
+    con = CountingConnection(mock_conn)
+    cur = con.cursor()
+
+    cur.execute("SELECT 1")
+    cur.executemany("INSERT INTO t VALUES (%s)", [(1,), (2,)])
+    con.commit()
+
+    assert con.stats == {ROUND_TRIPS: 4, COMMITS: 1}
+    mock_conn.commit.assert_called_once()
+
+
+def test_chunk_rows_respects_parameter_limit():
+    rows = [(i, i, i, i, i, i) for i in range(1000)]
+    chunks = chunk_rows(rows, 6)
+
+    assert [len(chunk) for chunk in chunks] == [333, 333, 333, 1]
+
+
+def test_build_values_clause():
+    assert build_values_clause(2, 3) == "(%s, %s, %s), (%s, %s, %s)"
+
+
+def test_merge_dimension_rows_is_one_statement_for_duplicate_rows(mock_cursor):
+    mock_cursor.fetchall.return_value = [(1, "Europe/Zagreb")]
 
-    mock_cursor.execute.assert_called_once_with(
-        f"""SELECT botanists_id FROM {test_schema}.botanists WHERE email=%s""", (test_email,))
+    assert merge_dimension_rows([("Europe/Zagreb",), ("Europe/Zagreb",)], "test_schema", "timezones", "timezone_id",
+                                {"timezone": "VARCHAR(25)"}, ("timezone",), mock_cursor) == [(1, "Europe/Zagreb")]
 
-    mock_cursor.fetchone.assert_called_once()
+    mock_cursor.execute.assert_called_once()
+    query, params = mock_cursor.execute.call_args[0]
+    assert "MERGE test_schema.timezones" in query
+    assert params == ("Europe/Zagreb",)
 
 
-def test_check_if_botanist_in_db_not_found(mock_cursor):
-    mock_cursor.fetchone.return_value = None
-    test_email = None
-    test_schema = "test_schema"
-    assert check_if_botanist_in_db(
-        test_email, test_schema, mock_cursor) == None
+def test_bulk_location_checks_maps_rounded_keys(mock_cursor):
+    mock_cursor.fetchall.return_value = [(4, "Split", 43.5089100, 16.4391500)]
 
-    mock_cursor.execute.assert_called_once_with(
-        f"""SELECT botanists_id FROM {test_schema}.botanists WHERE email=%s""", (test_email,))
+    assert bulk_location_checks([Location(43.50891, 16.43915, "Split", "HR", "Europe/Zagreb")], {"Europe/Zagreb": 1}, {"HR": 2},
+                                "test_schema", mock_cursor, DimensionCache()) == {("Split", 43.50891, 16.43915): 4}
+    assert mock_cursor.execute.call_args[0][1] == (
+        "Split", 43.50891, 16.43915, 1, 2)
 
-    mock_cursor.fetchone.assert_called_once()
 
+def test_get_previous_readings(mock_cursor):
+    mock_cursor.fetchall.return_value = [(1, 12.5, 30.1), (2, 14.0, 22.0)]
 
-def test_add_botanist_to_db(mock_create_connection, mock_cursor):
-    botanist_data = {
-        'name': 'John Doe',
-        'email': 'john.doe@example.com',
-        'phone': '123-456-7890'
-    }
-    schema = 'test_schema'
+    assert get_previous_readings([1, 2, 1], "test_schema", mock_cursor) == {
+        1: (12.5, 30.1), 2: (14.0, 22.0)}
+    assert mock_cursor.execute.call_args[0][1] == (1, 2)
 
-    add_botanist_to_db(botanist_data, schema,
-                       mock_create_connection, mock_cursor)
 
-    mock_cursor.execute.assert_called_once_with(
-        f"INSERT INTO {
-            schema}.botanists (first_name, last_name, email, phone_number) VALUES (%s, %s, %s, %s)",
-        ('John', 'Doe', 'john.doe@example.com', '123-456-7890')
-    )
+def test_bulk_add_readings_to_db_uses_one_insert(mock_cursor):
+    readings = [(1, "2024-06-13 20:59:29", 30.0, 14.0, 1, "2024-06-13 13:04:57"),
+                (2, "2024-06-13 20:59:30", 31.0, 15.0, 2, "2024-06-13 13:04:58")]
+    mock_cursor.rowcount = 1
 
-    mock_create_connection.commit.assert_called_once()
+    assert bulk_add_readings_to_db(readings, "test_schema", mock_cursor) == 1
 
+    mock_cursor.execute.assert_called_once()
+    assert "WHERE NOT EXISTS" in mock_cursor.execute.call_args[0][0]
+    assert len(mock_cursor.execute.call_args[0][1]) == 12
 
-def test_check_if_timezone_in_db_found(mock_cursor):
-    mock_cursor.fetchone.return_value = (1,)
-    test_timezone = "Africa/Abidjan"
-    test_schema = "test_schema"
-    assert check_if_timezone_in_db(
-        test_timezone, test_schema, mock_cursor) == (1,)
 
-    mock_cursor.execute.assert_called_once_with(
-        f"""SELECT timezone_id FROM {test_schema}.timezones WHERE timezone=%s""", (test_timezone,))
+class NocountCursor:
+    """A cursor that keeps SQL Server's session NOCOUNT setting between batches, reporting rowcount -1 while it is on"""
 
-    mock_cursor.fetchone.assert_called_once()
+    def __init__(self):
+        self.nocount = False
+        self.rowcount = -1
+
+    def execute(self, query, params=None):
+        for statement in query.split(";"):
+            if "SET NOCOUNT ON" in statement:
+                self.nocount = True
+            elif "SET NOCOUNT OFF" in statement:
+                self.nocount = False
+        self.rowcount = -1 if self.nocount else len(params) // 6
+
+    def fetchall(self):
+        return [(1, "Europe/Zagreb")]
+
+
+def test_bulk_insert_after_a_dimension_merge_still_counts_inserted_readings():
+    cursor = NocountCursor()
+    readings = [(1, "2024-06-13 20:59:29", 30.0, 14.0, 1, "2024-06-13 13:04:57"),
+                (2, "2024-06-13 20:59:30", 31.0, 15.0, 2, "2024-06-13 13:04:58")]
+
+    merge_dimension_rows([("Europe/Zagreb",)], "test_schema", "timezones", "timezone_id",
+                         {"timezone": "VARCHAR(25)"}, ("timezone",), cursor)
+
+    assert bulk_add_readings_to_db(readings, "test_schema", cursor) == 2
+
+
+def test_get_reading_watermarks(mock_cursor):
+    mock_cursor.fetchall.return_value = [(1, datetime(2024, 6, 13, 20, 59, 29))]
+
+    assert get_reading_watermarks([1, 2, 1], "test_schema", mock_cursor) == {
+        1: datetime(2024, 6, 13, 20, 59, 29)}
+    assert mock_cursor.execute.call_args[0][1] == (1, 2)
+
+
+@pytest.fixture
+def bulk_load():
+    """Patches every database step of apply_bulk_load_process, yielding the mocks and stores it uses by name"""
+    with ExitStack() as stack:
+        mock_pool = stack.enter_context(patch('load.CONNECTION_POOL'))
+        mocks = {"conn": mock_pool.connection.return_value.__enter__.return_value}
+        for name, value in {"warm_dimension_caches": None,
+                            "bulk_timezone_checks": {"Europe/Zagreb": 1},
+                            "bulk_country_code_checks": {"HR": 2},
+                            "bulk_location_checks": {("Split", 43.50891, 16.43915): 4},
+                            "bulk_plant_species_checks": {("dragon tree", None): 5},
+                            "bulk_botanist_checks": {"gertrude.jekyll@lnhm.co.uk": 3},
+                            "bulk_plant_checks": None,
+                            "get_previous_readings": {},
+                            "get_reading_watermarks": {}}.items():
+            mocks[name] = stack.enter_context(patch(f'load.{name}', return_value=value))
+        mocks["bulk_add_readings_to_db"] = stack.enter_context(
+            patch('load.bulk_add_readings_to_db', side_effect=lambda readings, schema, cur: len(readings)))
+        for name, value in {"READING_WATERMARKS": ReadingWatermarks(), "ALERT_STATE": AlertStateStore(path=None),
+                            "ALERT_DISPATCHER": MagicMock()}.items():
+            mocks[name] = stack.enter_context(patch(f'load.{name}', value))
+        yield SimpleNamespace(**mocks)
 
 
-def test_check_if_timezone_in_db_not_found(mock_cursor):
-    mock_cursor.fetchone.return_value = None
-    test_timezone = "Africa/Abidjan"
-    test_schema = "test_schema"
-    assert check_if_timezone_in_db(
-        test_timezone, test_schema, mock_cursor) == None
+def test_apply_bulk_load_process_commits_once(bulk_load, transformed_plant):
+    stats = apply_bulk_load_process([transformed_plant])
 
-    mock_cursor.execute.assert_called_once_with(
-        f"""SELECT timezone_id FROM {test_schema}.timezones WHERE timezone=%s""", (test_timezone,))
+    assert stats[COMMITS] == 1
+    bulk_load.conn.commit.assert_called_once()
+    assert bulk_load.bulk_plant_checks.call_args[0][0] == [(10, 5, 4)]
+    assert bulk_load.bulk_add_readings_to_db.call_args[0][0] == [
+        (10, "2024-06-13 20:59:29", 30.0, 14.0, 3, "2024-06-13 13:04:57")]
 
-    mock_cursor.fetchone.assert_called_once()
 
+def test_apply_bulk_load_process_only_queries_previous_readings_once(bulk_load, transformed_plant):
+    bulk_load.get_previous_readings.return_value = {10: (15.0, 31.0)}
 
-def test_add_timezone_to_db(mock_create_connection, mock_cursor):
-    timezone_name = "Africa/Abidjan"
-    schema = 'test_schema'
+    apply_bulk_load_process([transformed_plant])
+    apply_bulk_load_process([replace(transformed_plant, reading_at="2024-06-13 21:00:29")])
 
-    add_timezone_to_db(timezone_name, schema,
-                       mock_create_connection, mock_cursor)
+    bulk_load.get_previous_readings.assert_called_once()
+    assert bulk_load.ALERT_STATE.latest(10) == (14.0, 30.0)
 
-    mock_cursor.execute.assert_called_once_with(
-        f"""INSERT INTO {schema}.timezones (timezone) VALUES (%s)""", (timezone_name,))
 
-    mock_create_connection.commit.assert_called_once()
+def test_apply_bulk_load_process_suppresses_stored_readings(bulk_load, transformed_plant):
+    bulk_load.get_reading_watermarks.return_value = {10: datetime(2024, 6, 13, 20, 58, 29)}
 
+    first = apply_bulk_load_process([transformed_plant, transformed_plant])
+    second = apply_bulk_load_process([transformed_plant])
 
-def test_check_if_country_code_in_db_found(mock_cursor):
-    mock_cursor.fetchone.return_value = (1,)
-    test_cc = "CI"
-    test_schema = "test_schema"
-    assert check_if_country_code_in_db(
-        test_cc, test_schema, mock_cursor) == (1,)
+    bulk_load.get_reading_watermarks.assert_called_once()
+    assert first[DUPLICATES] == 1
+    assert second[DUPLICATES] == 1
+    assert bulk_load.bulk_add_readings_to_db.call_args[0][0] == []
+    assert bulk_load.READING_WATERMARKS.get(10) == "2024-06-13 20:59:29"
 
-    mock_cursor.execute.assert_called_once_with(
-        f"""SELECT country_code_id FROM {test_schema}.country_codes WHERE country_code=%s""", (test_cc,))
 
-    mock_cursor.fetchone.assert_called_once()
+def test_apply_bulk_load_process_forgets_versions_when_rolled_back(bulk_load, transformed_plant):
+    versions = PlantVersions()
+    versions.remember(10, {"ETag": '"abc"'}, {"recording_taken": "2024-06-13 20:59:29"})
+    bulk_load.warm_dimension_caches.side_effect = Exception("deadlock")
 
+    apply_bulk_load_process([transformed_plant], on_rollback=versions.forget)
 
-def test_check_if_country_code_in_db_not_found(mock_cursor):
-    mock_cursor.fetchone.return_value = None
-    test_cc = "CI"
-    test_schema = "test_schema"
-    assert check_if_country_code_in_db(
-        test_cc, test_schema, mock_cursor) == None
+    bulk_load.conn.rollback.assert_called_once()
+    assert versions.request_headers(10) == {}
 
-    mock_cursor.execute.assert_called_once_with(
-        f"""SELECT country_code_id FROM {test_schema}.country_codes WHERE country_code=%s""", (test_cc,))
 
-    mock_cursor.fetchone.assert_called_once()
+def test_apply_bulk_load_process_only_alerts_once_committed(bulk_load, transformed_plant):
+    bulk_load.bulk_add_readings_to_db.side_effect = Exception("deadlock")
 
+    with patch('load.evaluate_rules', return_value=([(10, "moisture", "too dry")], [(10, "temperature")])):
+        apply_bulk_load_process([transformed_plant])
 
-def test_add_country_code_to_db(mock_create_connection, mock_cursor):
-    test_cc = "CI"
-    test_schema = 'test_schema'
+    bulk_load.conn.rollback.assert_called_once()
+    bulk_load.ALERT_DISPATCHER.collect.assert_not_called()
+    bulk_load.ALERT_DISPATCHER.resolve.assert_not_called()
 
-    add_country_code_to_db(test_cc, test_schema,
-                           mock_create_connection, mock_cursor)
 
-    mock_cursor.execute.assert_called_once_with(
-        f"""INSERT INTO {test_schema}.country_codes (country_code) VALUES (%s)""", (test_cc,))
+def test_bulk_timezone_checks_skips_database_for_cached_keys(mock_cursor):
+    cache = DimensionCache()
+    cache.update({"Europe/Zagreb": 1})
 
-    mock_create_connection.commit.assert_called_once()
+    assert bulk_timezone_checks(
+        ["Europe/Zagreb"], "test_schema", mock_cursor, cache) == {"Europe/Zagreb": 1}
+    mock_cursor.execute.assert_not_called()
 
 
-def test_check_if_location_in_db_found(mock_cursor):
-    mock_cursor.fetchone.return_value = (1,)
-    test_city = "Bonoua"
-    test_lat = 5.27247
-    test_lon = -3.59625
-    test_schema = "test_schema"
-    assert check_if_location_in_db(
-        test_city, test_lat, test_lon, test_schema, mock_cursor) == (1,)
+def test_bulk_botanist_checks_merges_only_missing_botanists(mock_cursor):
+    cache = DimensionCache()
+    cache.update({"carl.linnaeus@lnhm.co.uk": 1})
+    mock_cursor.fetchall.return_value = [(3, "gertrude.jekyll@lnhm.co.uk")]
+    botanists = [Botanist("Carl Linnaeus", "carl.linnaeus@lnhm.co.uk", "1469941635"),
+                 Botanist("Gertrude Jekyll", "gertrude.jekyll@lnhm.co.uk", "0014812733691127")]
 
-    mock_cursor.execute.assert_called_once_with(
-        f"""SELECT location_id FROM {test_schema}.locations
-            WHERE location_name=%s AND location_lat=%s AND location_lon=%s""", (test_city, test_lat, test_lon,))
+    assert bulk_botanist_checks(botanists, "test_schema", mock_cursor, cache) == {
+        "carl.linnaeus@lnhm.co.uk": 1, "gertrude.jekyll@lnhm.co.uk": 3}
+    assert mock_cursor.execute.call_args[0][1] == (
+        "Gertrude", "Jekyll", "gertrude.jekyll@lnhm.co.uk", "0014812733691127")
+    assert cache.get("gertrude.jekyll@lnhm.co.uk") == 3
 
-    mock_cursor.fetchone.assert_called_once()
 
+def test_warm_dimension_caches_only_loads_cold_caches(mock_cursor):
+    caches = {dimension: DimensionCache() for dimension in (
+        TIMEZONES, COUNTRY_CODES, LOCATIONS, PLANT_SPECIES, BOTANISTS, PLANTS)}
+    for dimension in caches:
+        if dimension != TIMEZONES:
+            caches[dimension].warm({})
+    mock_cursor.fetchall.return_value = [(1, "Europe/Zagreb")]
 
-def test_check_if_location_in_db_not_found(mock_cursor):
-    mock_cursor.fetchone.return_value = None
-    test_city = "Bonoua"
-    test_lat = 5.27247
-    test_lon = -3.59625
-    test_schema = "test_schema"
-    assert check_if_location_in_db(
-        test_city, test_lat, test_lon, test_schema, mock_cursor) == None
+    warm_dimension_caches(caches, "test_schema", mock_cursor)
 
-    mock_cursor.execute.assert_called_once_with(
-        f"""SELECT location_id FROM {test_schema}.locations
-            WHERE location_name=%s AND location_lat=%s AND location_lon=%s""", (test_city, test_lat, test_lon,))
+    mock_cursor.execute.assert_called_once()
+    assert caches[TIMEZONES].get("Europe/Zagreb") == 1
 
-    mock_cursor.fetchone.assert_called_once()
 
+def test_bulk_upsert_latest_readings_keeps_newest_reading_per_plant(mock_cursor):
+    readings = [(1, "2024-06-13 21:00:00", 30.0, 14.0, 3, "2024-06-13 13:04:57"),
+                (1, "2024-06-13 20:59:00", 31.0, 15.0, 3, "2024-06-13 13:04:57"),
+                (2, "2024-06-13 20:59:00", 40.0, 20.0, 1, "2024-06-13 13:04:57")]
 
-@patch('load.check_if_country_code_in_db', return_value=(1,))
-@patch('load.check_if_timezone_in_db', return_value=(2,))
-def test_add_location_to_db(mock_create_connection, mock_cursor):
-    test_location_data = (5.27247, -3.59625, "Bonoua", "CI", "Africa/Abidjan")
-    test_city = "Bonoua"
-    test_lat = 5.27247
-    test_lon = -3.59625
-    test_timezone_id = 2
-    test_cc_id = 1
-    test_schema = 'test_schema'
+    bulk_upsert_latest_readings(readings, "test_schema", mock_cursor)
 
-    add_location_to_db(test_location_data, test_schema,
-                       mock_create_connection, mock_cursor)
+    mock_cursor.execute.assert_called_once()
+    query, params = mock_cursor.execute.call_args[0]
+    assert "MERGE test_schema.latest_readings" in query
+    assert "source.reading_at > target.reading_at" in query
+    assert params == readings[0] + readings[2]
 
-    mock_cursor.execute.assert_called_once_with(
-        f"""INSERT INTO {test_schema}.locations
-                (location_name, location_lat, location_lon,
-                 timezone_id, country_code_id)
-                VALUES (%s, %s, %s, %s, %s)""", (test_city, test_lat, test_lon, test_timezone_id, test_cc_id,))
-    mock_create_connection.commit.assert_called_once()
 
+def test_apply_load_process_commits_each_plant_with_its_latest_reading(bulk_load, transformed_plant):
+    other = replace(transformed_plant, plant_id=11)
 
-def test_check_if_species_in_db_found(mock_cursor):
-    mock_cursor.fetchone.return_value = (1,)
-    test_common_name = "Bird of paradise"
-    test_scientific_name = "Heliconia schiedeana 'Fire and Ice'"
-    test_schema = "test_schema"
-    assert check_if_species_in_db(
-        test_common_name, test_scientific_name, test_schema, mock_cursor) == (1,)
+    with patch('load.bulk_upsert_latest_readings') as mock_upsert:
+        stats = apply_load_process([transformed_plant, other])
 
-    mock_cursor.execute.assert_called_once_with(
-        f"""SELECT species_id FROM {test_schema}.plant_species WHERE common_name=%s AND scientific_name=%s""", (test_common_name, test_scientific_name,))
+    assert stats[COMMITS] == 2
+    assert [call[0][0][0][0] for call in mock_upsert.call_args_list] == [10, 11]
+    assert bulk_load.ALERT_STATE.latest(11) == (14.0, 30.0)
 
-    mock_cursor.fetchone.assert_called_once()
 
+def test_apply_load_process_rolls_back_only_the_failing_plant(bulk_load, transformed_plant):
+    bulk_load.bulk_add_readings_to_db.side_effect = [Exception("deadlock"), 1]
+    on_rollback = MagicMock()
 
-def test_check_if_species_in_db_not_found(mock_cursor):
-    mock_cursor.fetchone.return_value = None
-    test_common_name = "Bird of paradise"
-    test_scientific_name = "Heliconia schiedeana 'Fire and Ice'"
-    test_schema = "test_schema"
-    assert check_if_species_in_db(
-        test_common_name, test_scientific_name, test_schema, mock_cursor) == None
-
-    mock_cursor.execute.assert_called_once_with(
-        f"""SELECT species_id FROM {test_schema}.plant_species WHERE common_name=%s AND scientific_name=%s""", (test_common_name, test_scientific_name,))
-
-    mock_cursor.fetchone.assert_called_once()
+    stats = apply_load_process([transformed_plant, replace(transformed_plant, plant_id=11)], on_rollback)
 
-
-def test_add_species_to_db(mock_create_connection, mock_cursor):
-    test_common_name = "Bird of paradise"
-    test_scientific_name = "Heliconia schiedeana 'Fire and Ice'"
-    test_schema = 'test_schema'
-
-    add_species_to_db(test_common_name, test_scientific_name, test_schema,
-                      mock_create_connection, mock_cursor)
-
-    mock_cursor.execute.assert_called_once_with(
-        f"""INSERT INTO {
-            test_schema}.plant_species (common_name, scientific_name) VALUES (%s, %s)""",
-        (test_common_name, test_scientific_name))
-    mock_create_connection.commit.assert_called_once()
-
-
-def test_check_if_plant_in_db_found(mock_cursor):
-    mock_cursor.fetchone.return_value = (1,)
-    test_plant_id = 1
-    test_schema = "test_schema"
-    assert check_if_plant_in_db(
-        test_plant_id, test_schema, mock_cursor) == (1,)
-
-    mock_cursor.execute.assert_called_once_with(
-        f"""SELECT plant_id FROM {
-            test_schema}.plants WHERE plant_id = %s""", (test_plant_id,))
-    mock_cursor.fetchone.assert_called_once()
-
-
-def test_check_if_plant_in_db_not_found(mock_cursor):
-    mock_cursor.fetchone.return_value = None
-    test_plant_id = 1
-    test_schema = "test_schema"
-    assert check_if_plant_in_db(
-        test_plant_id, test_schema, mock_cursor) == None
-
-    mock_cursor.execute.assert_called_once_with(
-        f"""SELECT plant_id FROM {
-            test_schema}.plants WHERE plant_id = %s""", (test_plant_id,))
-    mock_cursor.fetchone.assert_called_once()
-
-
-@patch('load.check_if_species_in_db', return_value=(1,))
-@patch('load.check_if_location_in_db', return_value=(2,))
-def test_add_plant_to_db(mock_create_connection, mock_cursor):
-    test_location_data = (5.27247, -3.59625, "Bonoua", "CI", "Africa/Abidjan")
-    test_plant_species_id = 1
-    test_location_id = 2
-    test_plant_id = 3
-    test_common_name = "Bird of paradise"
-    test_scientific_name = "Heliconia schiedeana 'Fire and Ice'"
-    test_schema = 'test_schema'
-
-    assert (add_plant_to_db(test_plant_id, test_common_name, test_scientific_name, test_location_data, test_schema,
-                            mock_create_connection, mock_cursor)) == None
-
-    mock_cursor.execute.assert_called_once_with(
-        f"""INSERT INTO {test_schema}.plants (plant_id, species_id, location_id) VALUES (%s, %s, %s)""", (test_plant_id, test_plant_species_id, test_location_id))
-
-    mock_create_connection.commit.assert_called_once()
-
-
-@patch('load.check_if_botanist_in_db', return_value=(1,))
-def test_botanist_checks_found(mock_create_connection, mock_cursor):
-    botanist_data = {
-        'name': 'John Doe',
-        'email': 'john.doe@example.com',
-        'phone': '123-456-7890'
-    }
-    test_schema = "test_schema"
-    assert botanist_checks(
-        botanist_data, test_schema, mock_create_connection, mock_cursor) == 1
-
-
-@patch('load.check_if_botanist_in_db', side_effect=[None, (1,)])
-@patch('load.add_botanist_to_db')
-def test_botanist_checks_not_found(mock_add_botanist_to_db, mock_create_connection, mock_cursor):
-    botanist_data = {
-        'name': 'John Doe',
-        'email': 'john.doe@example.com',
-        'phone': '123-456-7890'
-    }
-    test_schema = "test_schema"
-    assert (botanist_checks(botanist_data, test_schema,
-                            mock_create_connection, mock_cursor)) == 1
-    mock_add_botanist_to_db.assert_called_once_with(
-        botanist_data, test_schema, mock_create_connection, mock_cursor)
-
-
-@patch('load.check_if_timezone_in_db', return_value=(1,))
-@patch('load.add_timezone_to_db')
-def test_timezone_checks_found(mock_add_timezone_to_db, mock_create_connection, mock_cursor):
-    timezone_name = "Africa/Abidjan"
-    test_schema = "test_schema"
-    assert timezone_checks(timezone_name, test_schema,
-                           mock_create_connection, mock_cursor) == None
-    mock_add_timezone_to_db.assert_not_called()
-
-
-@patch('load.check_if_timezone_in_db', return_value=None)
-@patch('load.add_timezone_to_db')
-def test_timezone_checks_not_found(mock_add_timezone_to_db, mock_create_connection, mock_cursor):
-    timezone_name = "Africa/Abidjan"
-    test_schema = "test_schema"
-    timezone_checks(timezone_name, test_schema,
-                    mock_create_connection, mock_cursor)
-    mock_add_timezone_to_db.assert_called_once_with(timezone_name, test_schema,
-                                                    mock_create_connection, mock_cursor)
-
-
-@patch('load.check_if_country_code_in_db', return_value=(1,))
-@patch('load.add_country_code_to_db')
-def test_country_code_checks_found(mock_add_country_code_to_db, mock_create_connection, mock_cursor):
-    cc = "CI"
-    test_schema = "test_schema"
-    assert country_code_checks(cc, test_schema,
-                               mock_create_connection, mock_cursor) == None
-    mock_add_country_code_to_db.assert_not_called()
-
-
-@patch('load.check_if_country_code_in_db', return_value=None)
-@patch('load.add_country_code_to_db')
-def test_country_code_checks_not_found(mock_add_country_code_to_db, mock_create_connection, mock_cursor):
-    cc = "CI"
-    test_schema = "test_schema"
-    assert country_code_checks(cc, test_schema,
-                               mock_create_connection, mock_cursor) == None
-    mock_add_country_code_to_db.assert_called_once_with(cc, test_schema,
-                                                        mock_create_connection, mock_cursor)
-
-
-@patch('load.check_if_location_in_db', return_value=(1,))
-@patch('load.add_location_to_db')
-def test_location_checks_found(mock_add_location_to_db, mock_create_connection, mock_cursor):
-    location_data = (5.27247, -3.59625, "Bonoua", "CI", "Africa/Abidjan")
-    test_schema = "test_schema"
-    location_checks(location_data, test_schema,
-                    mock_create_connection, mock_cursor)
-    mock_add_location_to_db.assert_not_called()
-
-
-@patch('load.check_if_location_in_db', return_value=None)
-@patch('load.add_location_to_db')
-def test_location_checks_not_found(mock_add_location_to_db, mock_create_connection, mock_cursor):
-    location_data = (5.27247, -3.59625, "Bonoua", "CI", "Africa/Abidjan")
-    test_schema = "test_schema"
-    location_checks(location_data, test_schema,
-                    mock_create_connection, mock_cursor)
-    mock_add_location_to_db.assert_called_once_with(location_data, test_schema,
-                                                    mock_create_connection, mock_cursor)
-
-
-@patch('load.check_if_species_in_db', return_value=(1,))
-@patch('load.add_species_to_db')
-def test_plant_species_checks_found(mock_add_species_to_db, mock_create_connection, mock_cursor):
-    test_common_name = "Bird of paradise"
-    test_scientific_name = "Heliconia schiedeana 'Fire and Ice'"
-    test_schema = "test_schema"
-    plant_species_checks(test_common_name, test_scientific_name, test_schema,
-                         mock_create_connection, mock_cursor)
-    mock_add_species_to_db.assert_not_called()
-
-
-@patch('load.check_if_species_in_db', return_value=None)
-@patch('load.add_species_to_db')
-def test_plant_species_checks_not_found(mock_add_species_to_db, mock_create_connection, mock_cursor):
-    test_common_name = "Bird of paradise"
-    test_scientific_name = "Heliconia schiedeana 'Fire and Ice'"
-    test_schema = "test_schema"
-    plant_species_checks(test_common_name, test_scientific_name, test_schema,
-                         mock_create_connection, mock_cursor)
-    mock_add_species_to_db.assert_called_once_with(test_common_name, test_scientific_name, test_schema,
-                                                   mock_create_connection, mock_cursor)
-
-
-@patch('load.check_if_plant_in_db', return_value=(1,))
-@patch('load.add_plant_to_db')
-def test_plant_checks_found(mock_add_plant_to_db, mock_create_connection, mock_cursor):
-    plant_id = 1
-    test_common_name = "Bird of paradise"
-    test_scientific_name = "Heliconia schiedeana 'Fire and Ice'"
-    location_data = (5.27247, -3.59625, "Bonoua", "CI", "Africa/Abidjan")
-    test_schema = "test_schema"
-    plant_checks(plant_id, test_common_name, test_scientific_name, location_data, test_schema,
-                 mock_create_connection, mock_cursor)
-    mock_add_plant_to_db.assert_not_called()
-
-
-@patch('load.check_if_plant_in_db', return_value=None)
-@patch('load.add_plant_to_db')
-def test_plant_checks_not_found(mock_add_plant_to_db, mock_create_connection, mock_cursor):
-    plant_id = 1
-    test_common_name = "Bird of paradise"
-    test_scientific_name = "Heliconia schiedeana 'Fire and Ice'"
-    location_data = (5.27247, -3.59625, "Bonoua", "CI", "Africa/Abidjan")
-    test_schema = "test_schema"
-    plant_checks(plant_id, test_common_name, test_scientific_name, location_data, test_schema,
-                 mock_create_connection, mock_cursor)
-    mock_add_plant_to_db.assert_called_once_with(plant_id, test_common_name, test_scientific_name, location_data, test_schema,
-                                                 mock_create_connection, mock_cursor)
+    bulk_load.conn.rollback.assert_called_once()
+    assert stats[COMMITS] == 1
+    on_rollback.assert_called_once_with([10])
+    assert bulk_load.ALERT_STATE.history(10) == []
+    assert bulk_load.ALERT_STATE.latest(11) == (14.0, 30.0)
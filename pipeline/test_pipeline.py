@@ -0,0 +1,139 @@
+import asyncio
+from unittest.mock import MagicMock, patch
+import pytest
+
+import pipeline
+from pipeline import transform_stream, load_stream, run_streaming_pipeline, get_plant_ids
+from pipeline import shard_plant_ids, get_shard, get_load_function
+from plant_registry import PlantRegistry
+
+
+def raw_plant(plant_id):
+    return {"botanist": {"email": "gertrude.jekyll@lnhm.co.uk", "name": "Gertrude Jekyll", "phone": "001-481-273-3691x127"},
+            "last_watered": "Thu, 13 Jun 2024 13:04:57 GMT", "name": "Dragon tree", "plant_id": plant_id,
+            "origin_location": ["43.50891", "16.43915", "Split", "HR", "Europe/Zagreb"],
+            "recording_taken": "2024-06-13 20:59:29", "soil_moisture": 32.5, "temperature": 14.0}
+
+
+async def run_transform(items, batch_size, batch_seconds):
+    raw_queue = asyncio.Queue()
+    batch_queue = asyncio.Queue()
+    for item in items:
+        raw_queue.put_nowait(item)
+    await transform_stream(raw_queue, batch_queue, batch_size, batch_seconds)
+
+    batches = []
+    while (batch := batch_queue.get_nowait()) is not None:
+        batches.append([plant.plant_id for plant in batch])
+    return batches
+
+
+def test_transform_stream_flushes_by_size_and_at_the_end():
+    items = [(i, raw_plant(i)) for i in range(1, 6)] + [None]
+
+    assert asyncio.run(run_transform(items, 2, 60)) == [[1, 2], [3, 4], [5]]
+
+
+def test_transform_stream_skips_error_responses():
+    items = [(1, raw_plant(1)), (7, {"error": "plant not found"}), None]
+
+    assert asyncio.run(run_transform(items, 10, 60)) == [[1]]
+
+
+def test_transform_stream_flushes_by_age():
+    async def slow_producer():
+        raw_queue = asyncio.Queue()
+        batch_queue = asyncio.Queue()
+        consumer = asyncio.create_task(transform_stream(
+            raw_queue, batch_queue, batch_size=100, batch_seconds=0.05))
+        await raw_queue.put((1, raw_plant(1)))
+        first_batch = await asyncio.wait_for(batch_queue.get(), 1)
+        await raw_queue.put(None)
+        await consumer
+        return first_batch
+
+    assert [plant.plant_id for plant in asyncio.run(slow_producer())] == [1]
+
+
+def test_load_stream_sums_batch_stats():
+    async def run():
+        batch_queue = asyncio.Queue()
+        for batch in ([1], [2], None):
+            batch_queue.put_nowait(batch)
+        return await load_stream(batch_queue, lambda batch: {"round_trips": 3, "commits": 1})
+
+    assert asyncio.run(run()) == {"round_trips": 6, "commits": 2, "duplicates_suppressed": 0, "batches": 2}
+
+
+@pytest.mark.parametrize("mode, function_name", [("bulk", "apply_bulk_load_process"), ("row", "apply_load_process")])
+def test_get_load_function_forgets_versions_on_rollback(mode, function_name):
+    with patch.object(pipeline, "LOAD_MODE", mode), patch.object(pipeline, function_name) as mock_load:
+        get_load_function()(["plant"])
+
+    mock_load.assert_called_once_with(["plant"], on_rollback=pipeline.PLANT_VERSIONS.forget)
+
+
+def test_run_streaming_pipeline_loads_everything_fetched():
+    loaded = []
+
+    async def fake_stream(plant_ids, queue, registry=None):
+        for plant_id in plant_ids:
+            await queue.put((plant_id, raw_plant(plant_id)))
+        await queue.put(None)
+
+    def fake_load(batch):
+        loaded.extend(plant.plant_id for plant in batch)
+        return {"round_trips": 1, "commits": 1}
+
+    with patch.object(pipeline, "stream_responses", fake_stream):
+        stats = asyncio.run(run_streaming_pipeline(
+            [1, 2, 3, 4, 5], fake_load, queue_size=2, batch_size=2, batch_seconds=60))
+
+    assert loaded == [1, 2, 3, 4, 5]
+    assert stats["batches"] == 3
+
+
+@patch('pipeline.CONNECTION_POOL')
+def test_get_plant_ids_loads_the_registry_only_when_stale(mock_pool):
+    cursor = MagicMock()
+    cursor.fetchall.return_value = [(1,), (2,)]
+    mock_pool.connection.return_value.__enter__.return_value.cursor.return_value = cursor
+    registry = PlantRegistry(initial_ids=[], probe_ahead=1)
+
+    assert get_plant_ids(registry) == [1, 2, 3]
+    assert get_plant_ids(registry) == [1, 2, 3]
+    cursor.execute.assert_called_once()
+
+
+def test_shard_plant_ids_splits_every_id_into_exactly_one_shard():
+    plant_ids = list(range(1, 21))
+    shards = [shard_plant_ids(plant_ids, index, 3) for index in range(3)]
+
+    assert sorted(sum(shards, [])) == plant_ids
+    assert shards[1] == [1, 4, 7, 10, 13, 16, 19]
+
+
+def test_shard_plant_ids_rejects_an_invalid_shard():
+    with pytest.raises(ValueError):
+        shard_plant_ids([1, 2], 2, 2)
+
+
+def test_get_shard_prefers_the_event():
+    assert get_shard({"shard_index": "1", "shard_count": 4}) == (1, 4)
+    assert get_shard(None) == (pipeline.SHARD_INDEX, pipeline.SHARD_COUNT)
+
+
+@patch('pipeline.get_sns_client')
+@patch('pipeline.ALERT_DISPATCHER')
+@patch('pipeline.ALERT_STATE')
+@patch('pipeline.run_batch_pipeline')
+@patch('pipeline.get_plant_ids')
+def test_handler_only_runs_its_shard(mock_get_plant_ids, mock_run_batch, mock_alert_state, mock_dispatcher, mock_sns):
+    mock_get_plant_ids.return_value = [1, 2, 3, 4, 5, 6]
+    mock_run_batch.return_value = {"round_trips": 1, "commits": 1}
+
+    pipeline.handler({"shard_index": 0, "shard_count": 2})
+
+    assert mock_run_batch.call_args[0][1] == [2, 4, 6]
+    mock_alert_state.use_shard.assert_called_once_with(0, 2)
+    mock_dispatcher.flush.assert_called_once_with(mock_sns.return_value)
@@ -0,0 +1,86 @@
+import asyncio
+from unittest.mock import MagicMock
+from plant_registry import PlantRegistry
+from extract import get_all_responses, PlantVersions
+from stub_api import StubPlantsAPI, start_stub_server
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_plant_ids_include_probes_past_the_highest_known_id():
+    registry = PlantRegistry(initial_ids=[1, 2, 5], probe_ahead=2)
+
+    assert registry.plant_ids() == [1, 2, 5, 6, 7]
+
+
+def test_load_from_db_adds_table_plants():
+    registry = PlantRegistry(initial_ids=[], probe_ahead=0)
+    cursor = MagicMock()
+    cursor.fetchall.return_value = [(3,), (8,)]
+
+    registry.load_from_db("gamma", cursor)
+
+    assert registry.plant_ids() == [3, 8]
+    assert "gamma.plants" in cursor.execute.call_args[0][0]
+    assert not registry.needs_refresh()
+
+
+def test_failing_ids_back_off_exponentially():
+    clock = FakeClock()
+    registry = PlantRegistry(initial_ids=[1, 2], probe_ahead=0, backoff_base=60, backoff_max=200, clock=clock)
+
+    registry.record(2, {"error": "plant not found", "plant_id": 2})
+    assert registry.plant_ids() == [1]
+    clock.now += 60
+    assert registry.plant_ids() == [1, 2]
+
+    registry.record(2, {"error": "plant not found", "plant_id": 2})
+    clock.now += 60
+    assert registry.plant_ids() == [1]
+    clock.now += 60
+    assert registry.plant_ids() == [1, 2]
+
+    for _ in range(5):
+        registry.record(2, {"error": "plant not found", "plant_id": 2})
+    clock.now += 200
+    assert registry.plant_ids() == [1, 2]
+    assert registry.failures(2) == 7
+
+
+def test_success_clears_backoff_and_transient_errors_do_not_count():
+    clock = FakeClock()
+    registry = PlantRegistry(initial_ids=[1], probe_ahead=0, clock=clock)
+
+    registry.record(1, {"error": "Unable to connect to the API.", "plant_id": 1})
+    assert registry.failures(1) == 0
+    registry.record(1, {"error": "plant not found", "plant_id": 1})
+    registry.record(1, {"plant_id": 1})
+
+    assert registry.failures(1) == 0
+    assert registry.plant_ids() == [1]
+
+
+def test_registry_stops_requesting_dead_ids_from_the_stub():
+    async def run_twice():
+        api = StubPlantsAPI(plant_count=12, missing_ids={4})
+        registry = PlantRegistry(initial_ids=range(1, 9), probe_ahead=5, clock=FakeClock())
+        runner, url = await start_stub_server(api)
+        try:
+            for _ in range(2):
+                await get_all_responses(registry.plant_ids(), api_url=url, versions=PlantVersions(),
+                                        registry=registry)
+            return api, registry
+        finally:
+            await runner.cleanup()
+
+    api, registry = asyncio.run(run_twice())
+
+    assert registry.plant_ids() == [1, 2, 3, 5, 6, 7, 8, 9, 10, 11, 12]
+    assert api.stats["not_found"] == 2 + 4
+    assert api.stats["requests"] == 13 + 15
@@ -0,0 +1,107 @@
+from unittest.mock import MagicMock
+import pytest
+
+from rules import evaluate_rules, RuleCache
+from rules import build_history_matrix, validate_rules
+import numpy as np
+from records import PlantReading, Location, Botanist
+
+
+@pytest.fixture
+def rules():
+    return {"defaults": {"moisture": {"min": 21, "max": 41},
+                         "temperature": {"min": 7, "max": 38, "max_change": 5}},
+            "species": {"venus flytrap": {"moisture": {"min": 50, "max": 90}}},
+            "plants": {"3": {"moisture": {"max": 95}}},
+            "rolling_window": 0}
+
+
+def plant(plant_id, name, temperature, soil_moisture):
+    return PlantReading(plant_id, name, None, "2024-06-13 13:04:57", temperature, soil_moisture, "2024-06-13 20:59:29",
+                        Location(43.50891, 16.43915, "Split", "HR", "Europe/Zagreb"),
+                        Botanist("Gertrude Jekyll", "gertrude.jekyll@lnhm.co.uk", "0014812733691127"))
+
+
+def test_out_of_range_needs_current_and_previous_reading_out(rules):
+    plants = [plant(1, "dragon tree", 14.0, 10.0), plant(2, "dragon tree", 14.0, 10.0),
+              plant(3, "dragon tree", 14.0, 10.0)]
+    histories = [[("2024-06-13 20:58:00", 14.0, 12.0)], [("2024-06-13 20:58:00", 14.0, 30.0)], []]
+
+    triggered, cleared = evaluate_rules(plants, histories, rules)
+
+    assert [(plant_id, alert) for plant_id, alert, _ in triggered] == [(1, "moisture")]
+    assert (2, "moisture") not in cleared and (3, "moisture") not in cleared
+    assert (1, "temperature") in cleared
+
+
+def test_species_thresholds_apply(rules):
+    plants = [plant(1, "venus flytrap", 14.0, 40.0)]
+    histories = [[(None, 14.0, 45.0)]]
+
+    triggered, _ = evaluate_rules(plants, histories, rules)
+
+    assert triggered == [(1, "moisture", "moisture 40.0 is outside 50-90")]
+
+
+def test_rate_of_change_rule(rules):
+    plants = [plant(1, "dragon tree", 20.0, 30.0), plant(2, "dragon tree", 16.0, 30.0)]
+    histories = [[(None, 14.0, 30.0)], [(None, 14.0, 30.0)]]
+
+    triggered, _ = evaluate_rules(plants, histories, rules)
+
+    assert [(plant_id, alert) for plant_id, alert, _ in triggered] == [
+        (1, "temperature_rate_of_change")]
+
+
+def test_rolling_mean_rule_needs_a_full_window(rules):
+    rules["rolling_window"] = 3
+    plants = [plant(1, "dragon tree", 14.0, 22.0), plant(2, "dragon tree", 14.0, 22.0)]
+    histories = [[(None, 14.0, 15.0), (None, 14.0, 22.0)], [(None, 14.0, 22.0)]]
+
+    triggered, _ = evaluate_rules(plants, histories, rules)
+
+    assert [(plant_id, alert) for plant_id, alert, _ in triggered] == [
+        (1, "moisture_rolling_mean")]
+
+
+def test_empty_batch(rules):
+    assert evaluate_rules([], [], rules) == ([], [])
+
+
+def test_rule_cache_reloads_after_ttl(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text('{"rolling_window": 0}')
+    now = [0.0]
+    cache = RuleCache(path=str(path), ttl_seconds=60, clock=lambda: now[0])
+    cache.get("gamma", MagicMock())
+
+    path.write_text('{"rolling_window": 4}')
+    assert cache.get("gamma", MagicMock())["rolling_window"] == 0
+    now[0] = 60
+    assert cache.get("gamma", MagicMock())["rolling_window"] == 4
+
+
+def test_rate_of_change_alert_stays_set_until_back_in_bounds(rules):
+    plants = [plant(1, "dragon tree", 40.0, 30.0), plant(2, "dragon tree", 20.0, 30.0)]
+    histories = [[(None, 39.5, 30.0)], [(None, 20.5, 30.0)]]
+
+    _, cleared = evaluate_rules(plants, histories, rules)
+
+    assert (1, "temperature_rate_of_change") not in cleared
+    assert (2, "temperature_rate_of_change") in cleared
+
+
+def test_build_history_matrix_keeps_the_newest_readings_right_aligned():
+    histories = [[(None, 1.0, 10.0), (None, 2.0, 20.0), (None, 3.0, 30.0)], [], [(None, 4.0, 40.0)]]
+
+    matrix = build_history_matrix(histories, "moisture", 2)
+
+    np.testing.assert_array_equal(matrix, [[20.0, 30.0], [np.nan, np.nan], [np.nan, 40.0]])
+
+
+def test_validate_rules_rejects_a_window_longer_than_the_history(rules):
+    rules["rolling_window"] = 7
+
+    assert validate_rules(rules, history_size=6) is rules
+    with pytest.raises(ValueError):
+        validate_rules(rules, history_size=5)
@@ -0,0 +1,29 @@
+from shard_harness import run_shard, run_shards, serve_in_background
+from stub_api import StubPlantsAPI
+
+
+def test_run_shard_loads_only_its_slice_from_the_stub():
+    api = StubPlantsAPI(plant_count=10)
+    url, stop = serve_in_background(api)
+    try:
+        result = run_shard(1, 3, list(range(1, 11)), url)
+    finally:
+        stop()
+
+    assert result["plants"] == 4
+    assert result["readings"] == 4
+    assert api.stats["requests"] == 4
+
+
+def test_run_shards_covers_every_plant_across_processes():
+    api = StubPlantsAPI(plant_count=12)
+    url, stop = serve_in_background(api)
+    try:
+        result = run_shards(2, list(range(1, 13)), url)
+    finally:
+        stop()
+
+    assert result["plants"] == 12
+    assert result["readings"] == 12
+    assert api.stats["requests"] == 12
+    assert result["readings_per_second"] > 0
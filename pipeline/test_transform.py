@@ -1,6 +1,9 @@
+from collections import Counter
 from datetime import datetime
+import pytest
 
 from transform import format_phone_number, format_recording_taken, format_watered_at, apply_transformations
+from records import PlantReading, Location, Botanist
 
 
 def test_formatting_phone_number():
@@ -39,4 +42,62 @@ def test_applying_transformations():
                                                                                                                                        "scientific_name": "sansevieria trifasciata", "last_watered": "2024-06-13 13:05:43", "temperature": 13.3688828085612, "soil_moisture": 71.3028826740385,
                                                                                                                                        "reading_at": "2024-06-13 21:23:08", "origin_location": [23.29549, 113.82465, "Licheng", "CN", "Asia/Shanghai"], "botanist": {"email": "gertrude.jekyll@lnhm.co.uk", "name": "Gertrude Jekyll", "phone": "0014812733691127"}}]
 
-    assert apply_transformations(example_data) == expected_output
+    assert [plant.to_dict() for plant in apply_transformations(example_data)] == expected_output
+
+
+@pytest.mark.parametrize("test_date", ["2024-06-13 20:59:29", "2024-02-29 00:00:00", "2024-6-3 1:2:3", "2024-06-13  1:59:29", "0999-06-13 20:59:29"])
+def test_formatting_recording_taken_matches_strptime(test_date):
+    expected_value = datetime.strptime(test_date, '%Y-%m-%d %H:%M:%S')
+    assert format_recording_taken(
+        test_date) == expected_value.strftime("%Y-%m-%d %H:%M:%S")
+
+
+@pytest.mark.parametrize("test_date", ["2023-02-29 20:59:29", "2024-06-13 24:00:00", "2024-06-13T20:59:29", "2024-06-13 20:59+01"])
+def test_formatting_invalid_recording_taken_raises(test_date):
+    with pytest.raises(ValueError):
+        format_recording_taken(test_date)
+
+
+@pytest.mark.parametrize("test_watered_at_value", ["Thu, 13 Jun 2024 13:04:57 GMT", "Mon, 3 Jun 2024 01:02:03 UTC", "thu, 13 jun 2024 13:04:57 gmt",
+                                                   "Thu,  13 Jun 2024 13:04:57 GMT", "Thu, 13 Jun 2024 1:4:7 GMT"])
+def test_formatting_watered_at_matches_strptime(test_watered_at_value):
+    expected_value = datetime.strptime(
+        test_watered_at_value, '%a, %d %b %Y %H:%M:%S %Z')
+    assert format_watered_at(
+        test_watered_at_value) == expected_value.strftime("%Y-%m-%d %H:%M:%S")
+
+
+@pytest.mark.parametrize("test_watered_at_value", ["Thu, 31 Jun 2024 13:04:57 GMT", "Thu, 13 Jun 2024 13:04:57 XYZ"])
+def test_formatting_invalid_watered_at_raises(test_watered_at_value):
+    with pytest.raises(ValueError):
+        format_watered_at(test_watered_at_value)
+
+
+@pytest.fixture
+def api_plant():
+    return {"botanist": {"email": "gertrude.jekyll@lnhm.co.uk", "name": "Gertrude Jekyll", "phone": "001-481-273-3691x127"}, "last_watered": "Thu, 13 Jun 2024 13:04:57 GMT",
+            "name": "Venus flytrap", "origin_location": ["43.50891", "16.43915", "Split", "HR", "Europe/Zagreb"], "plant_id": 10, "recording_taken": "2024-06-13 20:59:29",
+            "scientific_name": ["Dionaea muscipula"], "soil_moisture": 72.5, "temperature": 14.0}
+
+
+def test_applying_transformations_builds_records(api_plant):
+    assert apply_transformations([api_plant], Counter()) == [
+        PlantReading(10, "venus flytrap", "dionaea muscipula", "2024-06-13 13:04:57", 14.0, 72.5, "2024-06-13 20:59:29",
+                     Location(43.50891, 16.43915, "Split", "HR", "Europe/Zagreb"),
+                     Botanist("Gertrude Jekyll", "gertrude.jekyll@lnhm.co.uk", "0014812733691127"))]
+
+
+def test_applying_transformations_counts_invalid_plants_by_reason(api_plant):
+    without_botanist = dict(api_plant)
+    del without_botanist["botanist"]
+    plants = [api_plant, {"error": "plant not found", "plant_id": 7}, without_botanist,
+              dict(api_plant, temperature="warm"), dict(api_plant, origin_location=["43.5", "16.4"]),
+              dict(api_plant, recording_taken="yesterday"), dict(api_plant, plant_id="10"),
+              dict(api_plant, botanist=dict(api_plant["botanist"], name="Gertrude")),
+              dict(api_plant, scientific_name=[]), None]
+    invalid = Counter()
+
+    assert [plant.plant_id for plant in apply_transformations(plants, invalid)] == [10]
+    assert invalid == {"api_error": 1, "missing_botanist": 1, "invalid_temperature": 1, "invalid_origin_location": 1,
+                       "invalid_recording_taken": 1, "invalid_plant_id": 1, "invalid_botanist": 1,
+                       "invalid_scientific_name": 1, "invalid_record": 1}
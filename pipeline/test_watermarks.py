@@ -0,0 +1,36 @@
+from datetime import datetime
+from watermarks import ReadingWatermarks
+
+
+def key(reading):
+    return reading[0], reading[1]
+
+
+def test_split_drops_readings_at_or_before_the_mark():
+    watermarks = ReadingWatermarks()
+    watermarks.seed([1, 2], {1: datetime(2024, 6, 13, 20, 59, 0)})
+
+    new, dropped = watermarks.split([(1, "2024-06-13 20:58:00"), (1, "2024-06-13 20:59:00"),
+                                     (1, "2024-06-13 21:00:00"), (2, "2024-06-13 21:00:00")], key)
+
+    assert new == [(1, "2024-06-13 21:00:00"), (2, "2024-06-13 21:00:00")]
+    assert dropped == 2
+    assert watermarks.missing([1, 2, 3]) == [3]
+
+
+def test_split_drops_repeats_within_a_batch():
+    watermarks = ReadingWatermarks()
+
+    new, dropped = watermarks.split([(1, "2024-06-13 21:00:00"), (1, "2024-06-13 21:00:00"),
+                                     (1, "2024-06-13 21:01:00")], key)
+
+    assert new == [(1, "2024-06-13 21:00:00"), (1, "2024-06-13 21:01:00")]
+    assert dropped == 1
+
+
+def test_advance_only_moves_forward():
+    watermarks = ReadingWatermarks()
+    watermarks.advance(1, "2024-06-13 21:01:00")
+    watermarks.advance(1, datetime(2024, 6, 13, 21, 0, 0))
+
+    assert watermarks.get(1) == "2024-06-13 21:01:00"
@@ -1,9 +1,12 @@
 "This file cleans and processes plant data"
 # pylint: disable=C0301, E1101
+from collections import Counter
 from datetime import datetime
+from functools import lru_cache
 import os
 import re
 from dotenv import load_dotenv
+from records import PlantReading, Location, Botanist
 
 load_dotenv()
 
@@ -12,11 +15,6 @@ DB_USERNAME = os.getenv('DB_USER')
 DB_PASSWORD = os.getenv('DB_PASSWORD')
 DB_NAME = os.getenv('DB_NAME')
 DB_SCHEMA = os.getenv('DB_SCHEMA')
-INDEX_OF_LAT = 0
-INDEX_OF_LON = 1
-INDEX_OF_NAME = 2
-INDEX_OF_CC = 3
-INDEX_OF_TIMEZONE = 4
 ORIGIN_LOCATION = "origin_location"
 NAME = "name"
 SCIENTIFIC_NAME = "scientific_name"
@@ -29,58 +27,154 @@ LAST_WATERED = "last_watered"
 TEMPERATURE = "temperature"
 SOIL_MOISTURE = "soil_moisture"
 RECORDING_TAKEN = "recording_taken"
+RECORDING_TAKEN_FORMAT = '%Y-%m-%d %H:%M:%S'
+WATERED_AT_FORMAT = '%a, %d %b %Y %H:%M:%S %Z'
+DATABASE_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+WATERED_AT_CACHE_SIZE = 4096
+PHONE_NUMBER_CACHE_SIZE = 1024
+LOCATION_CACHE_SIZE = 4096
+BOTANIST_CACHE_SIZE = 1024
+NON_DIGITS = re.compile(r'[^\d]')
+WEEKDAYS = {"Mon,", "Tue,", "Wed,", "Thu,", "Fri,", "Sat,", "Sun,"}
+MONTHS = {"Jan": 1, "Feb": 2, "Mar": 3, "Apr": 4, "May": 5, "Jun": 6,
+          "Jul": 7, "Aug": 8, "Sep": 9, "Oct": 10, "Nov": 11, "Dec": 12}
+UTC_NAMES = {"GMT", "UTC"}
+API_ERROR = "api_error"
+INVALID_RECORD = "invalid_record"
+PARSE_ERRORS = (KeyError, IndexError, TypeError, ValueError, AttributeError)
+INVALID_RECORDS = Counter()
 
 
+@lru_cache(maxsize=PHONE_NUMBER_CACHE_SIZE)
 def format_phone_number(number: str) -> str:
     """Formats phone numbers so they consist of numbers"""
-    return re.sub(r'[^\d]', "", number)
+    return NON_DIGITS.sub("", number)
+
+
+def is_clock_time(time: str) -> bool:
+    """Whether the string is a zero-padded HH:MM:SS"""
+    return len(time) == 8 and time[2] == ':' and time[5] == ':' and time[:2].isdigit() and time[3:5].isdigit() and time[6:].isdigit()
 
 
 def format_recording_taken(date: str) -> datetime:
     """Converts a given date for 'record_taken' to datetime and then formats it correctly for storing it in the database"""
-    parsed_date = datetime.strptime(date, '%Y-%m-%d %H:%M:%S')
-    return parsed_date.strftime('%Y-%m-%d %H:%M:%S')
+    # Already in the database layout: let the C ISO parser validate it, and keep strptime for anything else
+    if (len(date) == 19 and date[10] == ' ' and date[4] == '-' and date[7] == '-' and date[13] == ':' and date[16] == ':'
+            and date[0] != '0' and date[11:13] < '24' and date.isascii()):
+        try:
+            datetime.fromisoformat(date)
+            return date
+        except ValueError:
+            pass
+
+    parsed_date = datetime.strptime(date, RECORDING_TAKEN_FORMAT)
+    return parsed_date.strftime(DATABASE_DATE_FORMAT)
 
 
+@lru_cache(maxsize=WATERED_AT_CACHE_SIZE)
 def format_watered_at(date: str) -> datetime:
     """Converts a given date for 'watered_at' to datetime and then formats it correctly for storing it in the database"""
-    parsed_date = datetime.strptime(date, '%a, %d %b %Y %H:%M:%S %Z')
-    return parsed_date.strftime('%Y-%m-%d %H:%M:%S')
+    # Plants are watered far less often than they are read, so most calls are cache hits
+    parts = date.split(' ')
+    if (len(parts) == 6 and date.isascii() and parts[0] in WEEKDAYS and parts[2] in MONTHS and parts[5] in UTC_NAMES
+            and len(parts[1]) <= 2 and parts[1].isdigit() and len(parts[3]) == 4 and parts[3].isdigit() and parts[3][0] != '0'
+            and is_clock_time(parts[4])):
+        try:
+            year, month, day = int(parts[3]), MONTHS[parts[2]], int(parts[1])
+            datetime(year, month, day, int(parts[4][:2]),
+                     int(parts[4][3:5]), int(parts[4][6:]))
+            return f"{year}-{month:02d}-{day:02d} {parts[4]}"
+        except ValueError:
+            pass
+
+    parsed_date = datetime.strptime(date, WATERED_AT_FORMAT)
+    return parsed_date.strftime(DATABASE_DATE_FORMAT)
+
+
+def parse_plant_id(plant_id: int) -> int:
+    """Checks a plant ID is a whole number"""
+    if plant_id.__class__ is not int:
+        raise TypeError(f"plant_id {plant_id!r} is not an integer")
+    return plant_id
+
+
+def parse_scientific_name(scientific_names: list) -> str:
+    """Returns the first scientific name in lower case, or None if the plant has none"""
+    return scientific_names[0].lower() if scientific_names is not None else None
+
+
+@lru_cache(maxsize=LOCATION_CACHE_SIZE)
+def make_location(lat: str, lon: str, name: str, country_code: str, timezone: str) -> Location:
+    """Builds a Location, handing back the same one for every reading from the same place"""
+    return Location(float(lat), float(lon), name, country_code, timezone)
+
+
+@lru_cache(maxsize=BOTANIST_CACHE_SIZE)
+def make_botanist(name: str, email: str, phone: str) -> Botanist:
+    """Builds a Botanist, checking the name splits into a first and last name as the botanists table needs"""
+    if ' ' not in name.strip():
+        raise ValueError(f"botanist name {name!r} has no last name")
+    return Botanist(name, email, format_phone_number(phone))
+
+
+def parse_location(location: list) -> Location:
+    """Builds a Location from the API's [lat, lon, name, country_code, timezone] list"""
+    return make_location(*location)
+
+
+def parse_botanist(botanist: dict) -> Botanist:
+    """Builds a Botanist from the API's botanist object"""
+    return make_botanist(botanist[NAME], botanist[EMAIL], botanist[PHONE])
+
+
+FIELD_PARSERS = ((PLANT_ID, parse_plant_id), (NAME, str.lower), (LAST_WATERED, format_watered_at),
+                 (TEMPERATURE, float), (SOIL_MOISTURE, float), (RECORDING_TAKEN, format_recording_taken),
+                 (ORIGIN_LOCATION, parse_location), (BOTANIST, parse_botanist))
+
+
+def invalid_reason(plant: dict) -> str:
+    """Works out why a plant failed validation by checking each field in turn, only run for the plants that fail"""
+    if not isinstance(plant, dict):
+        return INVALID_RECORD
+    if ERROR in plant:
+        return API_ERROR
+    for field, parse in FIELD_PARSERS:
+        if field not in plant:
+            return f"missing_{field}"
+        try:
+            parse(plant[field])
+        except PARSE_ERRORS:
+            return f"invalid_{field}"
+    try:
+        parse_scientific_name(plant.get(SCIENTIFIC_NAME))
+    except PARSE_ERRORS:
+        return f"invalid_{SCIENTIFIC_NAME}"
+    return INVALID_RECORD
 
 
-def apply_transformations(all_plant_data: dict) -> dict:
-    """Applies transformation to plants and gets each value to the correct data type"""
+def apply_transformations(all_plant_data: list[dict], invalid: Counter = INVALID_RECORDS) -> list[PlantReading]:
+    """Validates each plant and converts it to a PlantReading in one pass, counting the plants skipped by reason"""
     formatted_data = []
+    append = formatted_data.append
 
     for plant in all_plant_data:
-        if ERROR not in plant:
-            try:
-                plant_scientific_name = plant[SCIENTIFIC_NAME][0].lower(
-                ) if SCIENTIFIC_NAME in plant else None
-                plant_name = plant[NAME].lower()
-                current_plant_id = plant[PLANT_ID]
-
-                plant_watered_at = format_watered_at(plant[LAST_WATERED])
-                current_temp = float(plant[TEMPERATURE])
-                current_moisture = float(plant[SOIL_MOISTURE])
-                plant_reading_at = format_recording_taken(
-                    plant[RECORDING_TAKEN])
-                lat = float(plant[ORIGIN_LOCATION][INDEX_OF_LAT])
-                lon = float(plant[ORIGIN_LOCATION][INDEX_OF_LON])
-                city_name = plant[ORIGIN_LOCATION][INDEX_OF_NAME]
-                country_code = plant[ORIGIN_LOCATION][INDEX_OF_CC]
-                timezone = plant[ORIGIN_LOCATION][INDEX_OF_TIMEZONE]
-
-                botanist_phone = format_phone_number(plant[BOTANIST][PHONE])
-                botanist_email = plant[BOTANIST][EMAIL]
-                botanist_name = plant[BOTANIST][NAME]
-
-                formatted_data.append({"plant_id": current_plant_id, "name": plant_name, "scientific_name": plant_scientific_name,
-                                       "last_watered": plant_watered_at, "temperature": current_temp, "soil_moisture": current_moisture,
-                                       "reading_at": plant_reading_at, "origin_location": [lat, lon, city_name, country_code, timezone],
-                                       "botanist": {"name": botanist_name, "email": botanist_email, "phone": botanist_phone}})
-            except (KeyError, IndexError):
-                print("Missing data, skipping this plant")
+        try:
+            if ERROR in plant:
+                invalid[API_ERROR] += 1
                 continue
+            # The parse_* checks inlined, as this runs once per reading
+            plant_id = plant[PLANT_ID]
+            if plant_id.__class__ is not int:
+                raise TypeError
+            scientific_names = plant.get(SCIENTIFIC_NAME)
+            botanist = plant[BOTANIST]
+            append(PlantReading(plant_id, plant[NAME].lower(),
+                                scientific_names[0].lower() if scientific_names is not None else None,
+                                format_watered_at(plant[LAST_WATERED]), float(plant[TEMPERATURE]),
+                                float(plant[SOIL_MOISTURE]), format_recording_taken(plant[RECORDING_TAKEN]),
+                                make_location(*plant[ORIGIN_LOCATION]),
+                                make_botanist(botanist[NAME], botanist[EMAIL], botanist[PHONE])))
+        except PARSE_ERRORS:
+            invalid[invalid_reason(plant)] += 1
 
     return formatted_data
@@ -0,0 +1,63 @@
+"This file remembers each plant's newest stored reading so repeats from the API are dropped before they are inserted"
+
+from datetime import datetime
+
+READING_AT_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def to_reading_at(value) -> str:
+    """Returns a reading time in the 'YYYY-MM-DD HH:MM:SS' layout the transform produces, so times compare as text"""
+    return value.strftime(READING_AT_FORMAT) if isinstance(value, datetime) else value
+
+
+class ReadingWatermarks:
+    """The newest stored reading_at of every plant, kept between warm invocations"""
+
+    def __init__(self):
+        self._latest = {}
+
+    def __contains__(self, plant_id: int) -> bool:
+        return plant_id in self._latest
+
+    def missing(self, plant_ids: list[int]) -> list[int]:
+        """Returns the unique plant IDs with no known high-water mark yet"""
+        return [plant_id for plant_id in dict.fromkeys(plant_ids) if plant_id not in self._latest]
+
+    def get(self, plant_id: int) -> str:
+        """Returns a plant's newest stored reading_at, or None if it has none"""
+        return self._latest.get(plant_id)
+
+    def seed(self, plant_ids: list[int], latest_readings: dict) -> None:
+        """Fills in plants from a database lookup, remembering the ones with no readings at all"""
+        for plant_id in plant_ids:
+            reading_at = latest_readings.get(plant_id)
+            self._latest[plant_id] = to_reading_at(reading_at) if reading_at is not None else None
+
+    def split(self, items: list, key) -> tuple[list, int]:
+        """Returns the items whose (plant_id, reading_at) key is newer than the plant's mark, once each,
+        and how many were dropped"""
+        seen = set()
+        new_items = []
+        for item in items:
+            plant_id, reading_at = key(item)
+            reading_at = to_reading_at(reading_at)
+            latest = self._latest.get(plant_id)
+            if (plant_id, reading_at) in seen or (latest is not None and reading_at <= latest):
+                continue
+            seen.add((plant_id, reading_at))
+            new_items.append(item)
+        return new_items, len(items) - len(new_items)
+
+    def advance(self, plant_id: int, reading_at) -> None:
+        """Moves a plant's mark forward to a reading that has been committed"""
+        reading_at = to_reading_at(reading_at)
+        latest = self._latest.get(plant_id)
+        if latest is None or reading_at > latest:
+            self._latest[plant_id] = reading_at
+
+    def clear(self) -> None:
+        """Forgets every mark"""
+        self._latest = {}
+
+
+READING_WATERMARKS = ReadingWatermarks()
@@ -0,0 +1,119 @@
+"This file keeps database connections and boto3 clients alive between warm invocations, shared by every service image"
+
+import threading
+import logging
+from contextlib import contextmanager
+import pymssql
+import boto3
+
+CONNECTS = "connects"
+REUSES = "reuses"
+FAILED_PINGS = "failed_pings"
+CLIENTS_CREATED = "clients_created"
+CLIENTS_REUSED = "clients_reused"
+MAX_IDLE_CONNECTIONS = 4
+
+
+class ConnectionPool:
+    """A thread-safe pool of pymssql connections and boto3 clients that outlives a single invocation"""
+
+    def __init__(self, connect=pymssql.connect, client_factory=boto3.client, max_idle: int = MAX_IDLE_CONNECTIONS):
+        self._connect = connect
+        self._client_factory = client_factory
+        self._max_idle = max_idle
+        self._idle = {}
+        self._clients = {}
+        self._lock = threading.Lock()
+        self.stats = {CONNECTS: 0, REUSES: 0, FAILED_PINGS: 0,
+                      CLIENTS_CREATED: 0, CLIENTS_REUSED: 0}
+
+    def _count(self, stat: str) -> None:
+        """Increments one of the pool's counters"""
+        with self._lock:
+            self.stats[stat] += 1
+
+    @staticmethod
+    def is_healthy(conn: pymssql.Connection) -> bool:
+        """Pings the server with the cheapest possible query"""
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+            return True
+        except (pymssql.Error, OSError):
+            return False
+
+    def acquire(self, host: str, username: str, password: str, database_name: str) -> pymssql.Connection:
+        """Returns an idle connection that still answers a ping, or opens a new one"""
+        key = (host, username, password, database_name)
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                conn = idle.pop() if idle else None
+            if conn is None:
+                break
+            if self.is_healthy(conn):
+                self._count(REUSES)
+                return conn
+            self._count(FAILED_PINGS)
+            self.discard(conn)
+
+        self._count(CONNECTS)
+        return self._connect(server=host, user=username, password=password, database=database_name)
+
+    def release(self, host: str, username: str, password: str, database_name: str, conn: pymssql.Connection) -> None:
+        """Ends any open transaction and keeps the connection for the next caller"""
+        key = (host, username, password, database_name)
+        try:
+            conn.rollback()
+        except (pymssql.Error, OSError):
+            self.discard(conn)
+            return
+
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self._max_idle:
+                idle.append(conn)
+                return
+        self.discard(conn)
+
+    @staticmethod
+    def discard(conn: pymssql.Connection) -> None:
+        """Closes a connection that will not be reused"""
+        try:
+            conn.close()
+        except (pymssql.Error, OSError) as e:
+            logging.warning("Error closing connection: %s", e)
+
+    @contextmanager
+    def connection(self, host: str, username: str, password: str, database_name: str):
+        """Lends a pooled connection for the duration of a with block"""
+        conn = self.acquire(host, username, password, database_name)
+        try:
+            yield conn
+        finally:
+            self.release(host, username, password, database_name, conn)
+
+    def get_client(self, service: str, **kwargs):
+        """Returns the boto3 client for a service and its settings, creating it only once"""
+        key = (service, tuple(sorted(kwargs.items())))
+        with self._lock:
+            if key in self._clients:
+                self.stats[CLIENTS_REUSED] += 1
+                return self._clients[key]
+            self.stats[CLIENTS_CREATED] += 1
+            self._clients[key] = self._client_factory(service, **kwargs)
+            return self._clients[key]
+
+    def close_all(self) -> None:
+        """Closes every idle connection and forgets every client"""
+        with self._lock:
+            idle = [conn for conns in self._idle.values() for conn in conns]
+            self._idle.clear()
+            self._clients.clear()
+        for conn in idle:
+            self.discard(conn)
+
+
+CONNECTION_POOL = ConnectionPool()
@@ -0,0 +1,78 @@
+from unittest.mock import MagicMock
+import pymssql
+
+from connections import ConnectionPool, CONNECTS, REUSES, FAILED_PINGS, CLIENTS_CREATED, CLIENTS_REUSED
+
+
+DB_ARGS = ("host", "user", "password", "db")
+
+
+def test_pool_reuses_healthy_connection():
+    mock_conn = MagicMock()
+    mock_connect = MagicMock(return_value=mock_conn)
+    pool = ConnectionPool(connect=mock_connect)
+
+    with pool.connection(*DB_ARGS) as first:
+        pass
+    with pool.connection(*DB_ARGS) as second:
+        pass
+
+    assert first is second is mock_conn
+    mock_connect.assert_called_once_with(
+        server="host", user="user", password="password", database="db")
+    mock_conn.cursor.return_value.execute.assert_called_once_with("SELECT 1")
+    assert pool.stats[CONNECTS] == 1
+    assert pool.stats[REUSES] == 1
+
+
+def test_pool_reconnects_when_ping_fails():
+    dead_conn = MagicMock()
+    dead_conn.cursor.return_value.execute.side_effect = pymssql.OperationalError
+    live_conn = MagicMock()
+    pool = ConnectionPool(connect=MagicMock(side_effect=[dead_conn, live_conn]))
+
+    with pool.connection(*DB_ARGS):
+        pass
+    with pool.connection(*DB_ARGS) as conn:
+        assert conn is live_conn
+
+    dead_conn.close.assert_called_once()
+    assert pool.stats[FAILED_PINGS] == 1
+    assert pool.stats[CONNECTS] == 2
+
+
+def test_pool_discards_connection_that_cannot_roll_back():
+    broken_conn = MagicMock()
+    broken_conn.rollback.side_effect = pymssql.OperationalError
+    mock_connect = MagicMock(side_effect=[broken_conn, MagicMock()])
+    pool = ConnectionPool(connect=mock_connect)
+
+    with pool.connection(*DB_ARGS):
+        pass
+    with pool.connection(*DB_ARGS):
+        pass
+
+    broken_conn.close.assert_called_once()
+    assert mock_connect.call_count == 2
+
+
+def test_concurrent_borrowers_get_separate_connections():
+    mock_connect = MagicMock(side_effect=[MagicMock(), MagicMock()])
+    pool = ConnectionPool(connect=mock_connect)
+
+    with pool.connection(*DB_ARGS) as first, pool.connection(*DB_ARGS) as second:
+        assert first is not second
+
+
+def test_get_client_builds_each_client_once():
+    mock_factory = MagicMock()
+    pool = ConnectionPool(client_factory=mock_factory)
+
+    first = pool.get_client('sns', aws_access_key_id="key")
+    second = pool.get_client('sns', aws_access_key_id="key")
+    pool.get_client('s3', aws_access_key_id="key")
+
+    assert first is second
+    assert mock_factory.call_count == 2
+    assert pool.stats[CLIENTS_CREATED] == 2
+    assert pool.stats[CLIENTS_REUSED] == 1
@@ -0,0 +1,57 @@
+# pylint: skip-file
+from unittest.mock import MagicMock
+import numpy as np
+import pandas as pd
+import pytest
+
+from thresholds import resolve_thresholds, load_rules_from_db, load_rules, outside
+
+
+@pytest.fixture
+def rules():
+    return {"defaults": {"moisture": {"min": 21, "max": 41},
+                         "temperature": {"min": 7, "max": 38, "max_change": 5}},
+            "species": {"venus flytrap": {"moisture": {"min": 50, "max": 90}}},
+            "plants": {"3": {"moisture": {"max": 95}}},
+            "rolling_window": 0}
+
+
+def test_thresholds_fall_back_from_plant_to_species_to_default(rules):
+    plant_ids = pd.Series([1, 2, 3])
+    names = pd.Series(["dragon tree", "venus flytrap", "venus flytrap"])
+
+    assert resolve_thresholds(plant_ids, names, rules, "moisture", "min").tolist() == [21, 50, 50]
+    assert resolve_thresholds(plant_ids, names, rules, "moisture", "max").tolist() == [41, 90, 95]
+
+
+def test_load_rules_from_db_overlays_thresholds(rules):
+    mock_cursor = MagicMock()
+    mock_cursor.fetchall.return_value = [("dragon tree", None, "temperature", 10, 30, None),
+                                         (None, 7, "moisture", None, 60, 15),
+                                         (None, None, "moisture", 25, None, None)]
+
+    merged = load_rules_from_db("gamma", mock_cursor, rules)
+
+    assert merged["species"]["dragon tree"]["temperature"] == {"min": 10.0, "max": 30.0}
+    assert merged["plants"]["7"]["moisture"] == {"max": 60.0, "max_change": 15.0}
+    assert merged["defaults"]["moisture"] == {"min": 25.0, "max": 41}
+    assert rules["defaults"]["moisture"] == {"min": 21, "max": 41}
+
+
+def test_load_rules_only_reads_the_database_when_it_is_the_source(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text('{"defaults": {"moisture": {"min": 21, "max": 41}}}')
+    mock_cursor = MagicMock()
+    mock_cursor.fetchall.return_value = [(None, None, "moisture", 25, None, None)]
+
+    assert load_rules("gamma", mock_cursor, "file", str(path))["defaults"]["moisture"]["min"] == 21
+    mock_cursor.execute.assert_not_called()
+    assert load_rules("gamma", mock_cursor, "database", str(path))["defaults"]["moisture"]["min"] == 25.0
+
+
+def test_outside_ignores_missing_values_and_bounds():
+    values = np.array([10.0, 30.0, np.nan, 50.0])
+    low = np.array([21.0, 21.0, 21.0, np.nan])
+    high = np.array([41.0, 41.0, 41.0, np.nan])
+
+    assert outside(values, low, high).tolist() == [True, False, False, False]
@@ -0,0 +1,70 @@
+"This file loads the alert thresholds and resolves them per plant, shared by the pipeline's alerts and the migration's rollups"
+
+import os
+import json
+import numpy as np
+import pandas as pd
+import pymssql
+
+ALERT_RULES_PATH = os.getenv('ALERT_RULES_PATH', os.path.join(
+    os.path.dirname(__file__), 'alert_rules.json'))
+ALERT_RULES_SOURCE = os.getenv('ALERT_RULES_SOURCE', 'file')
+DEFAULTS = "defaults"
+SPECIES = "species"
+PLANTS = "plants"
+MIN = "min"
+MAX = "max"
+MAX_CHANGE = "max_change"
+
+
+def load_rules_file(path: str = ALERT_RULES_PATH) -> dict:
+    """Reads the default, per-species and per-plant thresholds from a json file"""
+    with open(path, encoding="utf-8") as rules_file:
+        return json.load(rules_file)
+
+
+def load_rules_from_db(schema: str, cursor: pymssql.Cursor, base_rules: dict) -> dict:
+    """Overlays the thresholds in the alert_thresholds table on a set of rules"""
+    cursor.execute(f"""SELECT ps.common_name, t.plant_id, t.metric, t.min_value, t.max_value, t.max_change
+                       FROM {schema}.alert_thresholds AS t
+                       LEFT JOIN {schema}.plant_species AS ps ON ps.species_id = t.species_id""")
+
+    rules = json.loads(json.dumps(base_rules))
+    for species_name, plant_id, metric, min_value, max_value, max_change in cursor.fetchall():
+        if plant_id is not None:
+            scope = rules.setdefault(PLANTS, {}).setdefault(str(plant_id), {})
+        elif species_name is not None:
+            scope = rules.setdefault(SPECIES, {}).setdefault(species_name, {})
+        else:
+            scope = rules.setdefault(DEFAULTS, {})
+        thresholds = scope.setdefault(metric, {})
+        for bound, value in ((MIN, min_value), (MAX, max_value), (MAX_CHANGE, max_change)):
+            if value is not None:
+                thresholds[bound] = float(value)
+    return rules
+
+
+def load_rules(schema: str, cursor: pymssql.Cursor, source: str = ALERT_RULES_SOURCE,
+               path: str = ALERT_RULES_PATH) -> dict:
+    """Reads the rules file, overlaying the database thresholds on it when they are the configured source"""
+    rules = load_rules_file(path)
+    if source == 'database':
+        rules = load_rules_from_db(schema, cursor, rules)
+    return rules
+
+
+def resolve_thresholds(plant_ids: pd.Series, names: pd.Series, rules: dict, metric: str, bound: str) -> np.ndarray:
+    """Returns each plant's threshold, taking its plant override, then its species override, then the default"""
+    def overrides(scope: dict) -> dict:
+        return {key: thresholds[metric][bound] for key, thresholds in scope.items()
+                if bound in thresholds.get(metric, {})}
+
+    default = rules.get(DEFAULTS, {}).get(metric, {}).get(bound, np.nan)
+    plant_values = plant_ids.astype(str).map(overrides(rules.get(PLANTS, {})))
+    species_values = names.map(overrides(rules.get(SPECIES, {})))
+    return plant_values.fillna(species_values).fillna(default).to_numpy(dtype=float)
+
+
+def outside(values: np.ndarray, low: np.ndarray, high: np.ndarray) -> np.ndarray:
+    """Whether each value is outside its open (low, high) range, with NaN values and bounds never counting"""
+    return (values <= low) | (values >= high)